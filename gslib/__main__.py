@@ -130,7 +130,9 @@ def main():
   from gslib.util import MultiprocessingIsAvailable
   if MultiprocessingIsAvailable()[0]:
     # These setup methods must be called, and, on Windows, they can only be
-    # called from within an "if __name__ == '__main__':" block.
+    # called from within an "if __name__ == '__main__':" block. They don't
+    # start any processes; the multiprocessing.Manager is only started once a
+    # command actually needs to share state with other processes.
     gslib.util.InitializeMultiprocessingVariables()
     gslib.command.InitializeMultiprocessingVariables()
   oauth2_client.InitializeMultiprocessingVariables()
@@ -75,8 +75,8 @@ _detailed_help_text = ("""
               See also "gsutil help setmeta" for the ability to set metadata
               fields on objects after they have been uploaded.
 
-  -m          Causes supported operations (acl ch, acl set, cp, mv, rm,
-              and setmeta) to run in parallel. This can significantly improve
+  -m          Causes supported operations (acl ch, acl set, cat, cp, mv,
+              rm, and setmeta) to run in parallel. This can significantly improve
               performance if you are uploading, downloading, moving, removing,
               or changing ACLs on a large number of files over a fast network
               connection.
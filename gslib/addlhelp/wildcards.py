@@ -58,6 +58,12 @@ _detailed_help_text = ("""
 
     gsutil cp 'data/abc**' gs://bucket
 
+  For file names, a wildcard can contain more than one '**'. For example:
+
+    gsutil cp 'data/**/logs/**/*.txt' gs://bucket
+
+  will match .txt files anywhere under any directory named logs under data.
+
 
 <B>BUCKET WILDCARDS</B>
   You can specify wildcards for bucket names. For example:
@@ -21,6 +21,10 @@
 
 import time
 
+# Key attributes that are populated by a bucket listing and that can be carried
+# across process boundaries (see GetListedKeyMetadata()).
+LISTED_KEY_METADATA_FIELDS = ('size', 'etag', 'last_modified', 'cloud_hashes')
+
 
 class BucketListingRef(object):
   """
@@ -40,7 +44,8 @@ class BucketListingRef(object):
   there's a separate gsutil ls -L option to get this more detailed info).
   """
 
-  def __init__(self, uri, key=None, prefix=None, headers=None):
+  def __init__(self, uri, key=None, prefix=None, headers=None,
+               file_stat=None):
     """Instantiate BucketListingRef from uri and (if available) key or prefix.
 
     Args:
@@ -50,6 +55,8 @@ class BucketListingRef(object):
       headers: Dictionary containing optional HTTP headers to pass to boto
           (which happens when GetKey() is called on an BucketListingRef which
           has no constructor-populated Key), or None if not available.
+      file_stat: gslib.local_walker.FileStat of the file, for a file URI found
+          by walking a directory, or None if not available.
 
       At most one of key and prefix can be populated.
     """
@@ -58,6 +65,7 @@ class BucketListingRef(object):
     self.key = key
     self.prefix = prefix
     self.headers = headers or {}
+    self.file_stat = file_stat
 
   def GetUri(self):
     """Get URI form of listed URI.
@@ -140,6 +148,32 @@ class BucketListingRef(object):
       self.key.last_modified = time.strftime('%Y-%m-%dT%H:%M:%S', tuple_time)
     return self.key
 
+  def GetListedKeyMetadata(self):
+    """Get the metadata of the Key populated from the bucket listing, if any.
+
+    Unlike GetKey(), this never makes a request to the service.
+
+    Returns:
+      Pickleable dictionary mapping LISTED_KEY_METADATA_FIELDS to their
+      values, or None if this BucketListingRef has no Key.
+    """
+    if not self.key:
+      return None
+    metadata = {}
+    for field in LISTED_KEY_METADATA_FIELDS:
+      value = getattr(self.key, field, None)
+      if value:
+        metadata[field] = value
+    return metadata
+
+  def GetFileStat(self):
+    """Get the stat information recorded when the file was listed, if any.
+
+    Returns:
+      gslib.local_walker.FileStat, or None if not available.
+    """
+    return self.file_stat
+
   def GetPrefix(self):
     """Get Prefix form of listed URI.
 
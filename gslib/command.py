@@ -26,15 +26,18 @@ import codecs
 import copy
 import getopt
 import gslib
+import heapq
 import logging
 import multiprocessing
 import os
 import Queue
 import re
 import signal
+import socket
 import sys
 import textwrap
 import threading
+import time
 import traceback
 import wildcard_iterator
 import xml.dom.minidom
@@ -51,6 +54,9 @@ from gslib.name_expansion import NameExpansionIterator
 from gslib.name_expansion import NameExpansionIteratorQueue
 from gslib.parallelism_framework_util import AtomicIncrementDict
 from gslib.parallelism_framework_util import BasicIncrementDict
+from gslib.parallelism_framework_util import ReorderingIterator
+from gslib.parallelism_framework_util import TASK_ORDER_FIFO
+from gslib.parallelism_framework_util import TASK_ORDERS
 from gslib.parallelism_framework_util import ThreadAndProcessSafeDict
 from gslib.project_id import ProjectIdHandler
 from gslib.storage_uri_builder import StorageUriBuilder
@@ -120,6 +126,23 @@ def _SetAclExceptionHandler(cls, e):
 # However, this also lets us shut down somewhat more cleanly when interrupted.
 queues = []
 
+def GetCommandClasses():
+  """
+  Returns all of the classes that implement commands, including commands
+  built by subclassing another command (like rsync, which subclasses cp).
+  A subclass is only a command of its own if it defines its own command_spec;
+  otherwise (e.g., a variant of a command used in tests) it would just
+  duplicate its parent's name and help.
+  """
+  command_classes = []
+  classes_to_visit = list(Command.__subclasses__())
+  while classes_to_visit:
+    command_class = classes_to_visit.pop(0)
+    if 'command_spec' in vars(command_class):
+      command_classes.append(command_class)
+    classes_to_visit.extend(command_class.__subclasses__())
+  return command_classes
+
 def _NewMultiprocessingQueue():
   queue = multiprocessing.Queue(MAX_QUEUE_SIZE)
   queues.append(queue)
@@ -147,12 +170,40 @@ URIS_START_ARG = 'uris_start_arg'
 # problems on some operating systems.
 MAX_QUEUE_SIZE = 32500
 
-# That maximum depth of the tree of recursive calls to command.Apply. This is
-# an arbitrary limit put in place to prevent developers from accidentally
-# causing problems with infinite recursion, and it can be increased if needed.
+# That maximum depth of the tree of recursive calls to command.Apply that run
+# in a shared WorkerPool. This is an arbitrary limit put in place to prevent
+# developers from accidentally causing problems with infinite recursion, and
+# it can be increased if needed.
 MAX_RECURSIVE_DEPTH = 5
 
-ZERO_TASKS_TO_DO_ARGUMENT = ("There were no", "tasks to do")
+# Arguments are sent to consumers in batches whose size adapts to how quickly
+# the consumers keep up, up to this many arguments per batch. A batch is never
+# held back for more than TASK_BATCH_MAX_DELAY seconds waiting to be filled.
+MAX_TASK_BATCH_SIZE = 64
+TASK_BATCH_MAX_DELAY = 0.05
+
+# When the adaptive_parallel_thread_count option is set, each WorkerPool
+# measures its throughput and error rate over intervals of at least this many
+# seconds. After each interval, it adds one thread, or multiplies its number of
+# threads by ADAPTIVE_DECREASE_FACTOR if more than ADAPTIVE_MAX_ERROR_RATE of
+# its tasks failed with errors that indicate an overloaded service, or if its
+# throughput dropped by more than ADAPTIVE_THROUGHPUT_TOLERANCE since it last
+# added threads.
+ADAPTIVE_INTERVAL = 2.0
+ADAPTIVE_DECREASE_FACTOR = 0.5
+ADAPTIVE_MAX_ERROR_RATE = 0.02
+ADAPTIVE_THROUGHPUT_TOLERANCE = 0.1
+
+# Each process reports the status of the tasks it has performed in batches of
+# at most this many tasks, and no later than this many seconds after a task is
+# finished. A batch is also sent whenever a process runs out of queued work.
+TASK_STATUS_BATCH_SIZE = 100
+TASK_STATUS_FLUSH_INTERVAL = 0.1
+
+# In place of a list of arguments, this marks the batch that a ProducerThread
+# enqueues after all of the real tasks for its call to Apply, so that a
+# blocking consumer knows when to stop reading from the queue.
+NO_MORE_TASKS = None
 
 # Map from deprecated aliases to the current command and subcommands that
 # provide the same behavior.
@@ -177,11 +228,13 @@ OLD_ALIAS_MAP = {'chacl': ['acl', 'ch'],
 # Declare all of the module level variables - see
 # InitializeMultiprocessingVariables for an explanation of why this is
 # necessary.
-global manager, consumer_pools, task_queues, caller_id_lock, caller_id_counter
-global total_tasks, call_completed_map, global_return_values_map
-global need_pool_or_done_cond, caller_id_finished_count, new_pool_needed
-global current_max_recursive_level, shared_vars_map, shared_vars_list_map
-global class_map
+global manager, consumer_pools, caller_id_lock, caller_id_counter
+global call_completed_map, global_return_values_map, call_done_cond
+global shared_vars_map, caller_info_map, cached_caller_info
+global local_task_statuses, task_status_queue, task_status_aggregator
+global task_status_reporter, task_status_reporter_lock, task_queues
+global num_consumer_pools, num_consumer_pools_needed
+global waiting_consumer_count, waiting_for_tasks
 
 
 def InitializeMultiprocessingVariables():
@@ -190,57 +243,114 @@ def InitializeMultiprocessingVariables():
   subprocesses. On Windows, a multiprocessing.Manager object should only
   be created within an "if __name__ == '__main__':" block. This function
   must be called, otherwise every command that calls Command.Apply will fail.
+
+  This is called on every run of gsutil, so it doesn't start a manager. Until
+  a call to Apply needs more than one process, nothing needs to be shared with
+  another process, and the variables that would otherwise be backed by the
+  manager are plain thread-safe objects; see _InitializeCrossProcessVariables.
   """
   # This list of global variables must exactly match the above list of
   # declarations.
-  global manager, consumer_pools, task_queues, caller_id_lock, caller_id_counter
-  global total_tasks, call_completed_map, global_return_values_map
-  global need_pool_or_done_cond, caller_id_finished_count, new_pool_needed
-  global current_max_recursive_level, shared_vars_map, shared_vars_list_map
-  global class_map
-
-  manager = multiprocessing.Manager()
-
+  global manager, consumer_pools, caller_id_lock, caller_id_counter
+  global call_completed_map, global_return_values_map, call_done_cond
+  global shared_vars_map, caller_info_map, cached_caller_info
+  global local_task_statuses, task_status_queue, task_status_aggregator
+  global task_status_reporter, task_status_reporter_lock, task_queues
+  global num_consumer_pools, num_consumer_pools_needed
+  global waiting_consumer_count, waiting_for_tasks
+
+  # This is set by _InitializeCrossProcessVariables.
+  manager = None
+
+  # The pools of consumer processes. The first is created by the first call
+  # to Apply that uses more than one process and is shared by all later
+  # top-level calls. Nested calls to Apply generally don't use processes, but
+  # when they do, the main thread creates a pool for each level of nesting;
+  # see _ParallelApply. The pool for each level takes its tasks from the
+  # queue at the same index of task_queues, which are all created by the main
+  # process (one level ahead of the pools) so that every consumer process
+  # inherits the queue for the level below its own.
   consumer_pools = []
-
-  # List of all existing task queues - used by all pools to find the queue
-  # that's appropriate for the given recursive_apply_level.
   task_queues = []
 
-  # Used to assign a globally unique caller ID to each Apply call.
-  caller_id_lock = manager.Lock()
-  caller_id_counter = multiprocessing.Value('i', 0)
+  # The number of consumer pools that exist, and the number that consumer
+  # processes have asked the main thread to create.
+  num_consumer_pools = multiprocessing.Value('i', 0)
+  num_consumer_pools_needed = multiprocessing.Value('i', 0)
+
+  # The number of consumer processes that are waiting for tasks, and whether
+  # this process is one of them.
+  waiting_consumer_count = multiprocessing.Value('i', 0)
+  waiting_for_tasks = False
 
-  # Map from caller_id to total number of tasks to be completed for that ID.
-  total_tasks = ThreadAndProcessSafeDict(manager)
+  # Used to assign a globally unique caller ID to each Apply call. The lock
+  # that comes with the shared value also works across processes.
+  caller_id_counter = multiprocessing.Value('i', 0)
+  caller_id_lock = caller_id_counter.get_lock()
 
   # Map from caller_id to a boolean which is True iff all its tasks are
   # finished.
-  call_completed_map = ThreadAndProcessSafeDict(manager)
-
-  # Used to keep track of the set of return values for each caller ID.
-  global_return_values_map = AtomicIncrementDict(manager)
-
-  # Condition used to notify any waiting threads that a task has finished or
-  # that a call to Apply needs a new set of consumer processes.
-  need_pool_or_done_cond = manager.Condition()
-
-  # Map from caller_id to the current number of completed tasks for that ID.
-  caller_id_finished_count = AtomicIncrementDict(manager)
-
-  # Used as a way for the main thread to distinguish between being woken up
-  # by another call finishing and being woken up by a call that needs a new set
-  # of consumer processes.
-  new_pool_needed = multiprocessing.Value('i', 0)
-
-  current_max_recursive_level = multiprocessing.Value('i', 0)
-
-  # Map from (caller_id, name) to the value of that shared variable.
-  shared_vars_map = AtomicIncrementDict(manager)
-  shared_vars_list_map = ThreadAndProcessSafeDict(manager)
-
-  # Map from caller_id to calling class.
-  class_map = manager.dict()
+  call_completed_map = {}
+
+  # Used to keep track of the set of return values for each caller ID. This is
+  # only written once per caller ID, by the _TaskStatusAggregator, after all of
+  # the tasks for that caller ID are finished.
+  global_return_values_map = BasicIncrementDict()
+
+  # Condition used to notify any waiting threads that a call has finished.
+  call_done_cond = threading.Condition()
+
+  # Map from (caller_id, name) to the final value of that shared variable.
+  # Like global_return_values_map, this is only written once per caller ID.
+  shared_vars_map = BasicIncrementDict()
+
+  # Map from caller_id to the CallerInfo for that call, which holds everything
+  # that's the same for all of its tasks, so that the tasks themselves only
+  # need to carry their arguments. Each process caches what it looks up here.
+  caller_info_map = {}
+  cached_caller_info = {}
+
+  # Map from caller_id to the _LocalTaskStatus of each call to Apply that's
+  # running in a WorkerPool in this process; see _ApplyInWorkerPool.
+  local_task_statuses = {}
+
+  # Task completions, return values and shared variable deltas don't go
+  # through the manager. Instead, each process accumulates them locally in its
+  # _TaskStatusReporter and periodically sends them, in batches, through this
+  # queue to the _TaskStatusAggregator in the main process, which is the only
+  # one that touches the manager when a call to Apply finishes.
+  # The queue and the aggregator are created by the first parallel call to
+  # Apply, and each process creates its own reporter when it first needs it.
+  task_status_queue = None
+  task_status_aggregator = None
+  task_status_reporter = None
+  task_status_reporter_lock = threading.Lock()
+
+
+def _InitializeCrossProcessVariables():
+  """
+  Starts the manager and replaces the module-level variables that must be
+  shared with consumer processes by versions that are backed by the manager.
+  This must be called by the main thread before it creates the first consumer
+  pool, at which point there are no other ongoing calls to Apply, so none of
+  the existing state needs to be carried over.
+  """
+  global manager, call_completed_map, global_return_values_map
+  global call_done_cond, shared_vars_map, caller_info_map
+
+  # The locks returned by util.CreateLock are stored in instances of Command
+  # and therefore in caller_info_map, so they must come from a different
+  # manager; a manager can't send back a proxy for one of its own objects.
+  new_manager = multiprocessing.Manager()
+  # Consumer processes inherit any locks created so far by util.CreateLock,
+  # so those must be able to work across processes before we create any.
+  util.GetManager()
+  call_completed_map = ThreadAndProcessSafeDict(new_manager)
+  global_return_values_map = AtomicIncrementDict(new_manager)
+  call_done_cond = new_manager.Condition()
+  shared_vars_map = AtomicIncrementDict(new_manager)
+  caller_info_map = new_manager.dict()
+  manager = new_manager
 
 
 class Command(object):
@@ -832,8 +942,98 @@ class Command(object):
     
     return (process_count, thread_count)
 
-  def _SetUpPerCallerState(self):
-    """Set up the state for a caller id, corresponding to one Apply call."""
+  def _GetAdaptiveThreadCountBounds(self):
+    """
+    Determines whether the number of threads per process should be adjusted
+    while tasks run, rather than fixed.
+
+    Returns:
+      (min_thread_count, max_thread_count) if the adaptive_parallel_thread_count
+      option is set, or None otherwise.
+    """
+    if not boto.config.getbool('GSUtil', 'adaptive_parallel_thread_count',
+                               False):
+      return None
+    min_thread_count = boto.config.getint(
+        'GSUtil', 'min_parallel_thread_count',
+        gslib.commands.config.DEFAULT_MIN_PARALLEL_THREAD_COUNT)
+    max_thread_count = boto.config.getint(
+        'GSUtil', 'max_parallel_thread_count',
+        gslib.commands.config.DEFAULT_MAX_PARALLEL_THREAD_COUNT)
+    if min_thread_count < 1 or max_thread_count < min_thread_count:
+      raise CommandException(
+          'Invalid min_parallel_thread_count "%d" and max_parallel_thread_count '
+          '"%d".' % (min_thread_count, max_thread_count))
+    self.logger.debug('adaptive thread count bounds: %d to %d',
+                      min_thread_count, max_thread_count)
+    return (min_thread_count, max_thread_count)
+
+  def _ReorderTasks(self, args_iterator, task_order):
+    """
+    Wraps args_iterator in a ReorderingIterator if a task order other than
+    FIFO was requested or configured.
+
+    Args:
+      args_iterator: Iterable collection of arguments passed to Apply.
+      task_order: One of TASK_ORDERS, or None to use the parallel_task_order
+                  option from the boto config file.
+
+    Returns:
+      Iterable collection of the same arguments, in the order to dispatch them.
+    """
+    if task_order is None:
+      task_order = boto.config.get('GSUtil', 'parallel_task_order',
+                                   TASK_ORDER_FIFO)
+    if task_order not in TASK_ORDERS:
+      raise CommandException(
+          'Invalid parallel_task_order "%s". Valid values are: %s.' %
+          (task_order, ', '.join(TASK_ORDERS)))
+    if task_order == TASK_ORDER_FIFO:
+      return args_iterator
+    window_size = boto.config.getint(
+        'GSUtil', 'parallel_task_order_window',
+        gslib.commands.config.DEFAULT_PARALLEL_TASK_ORDER_WINDOW)
+    self.logger.debug('task order: %s (window of %d)', task_order, window_size)
+    return ReorderingIterator(args_iterator, task_order, window_size)
+
+  def _PrepareForMultipleProcesses(self, process_count):
+    """
+    Starts the manager before the first call to Apply that uses more than one
+    process.
+
+    Args:
+      process_count: The number of processes requested for the call.
+
+    Returns:
+      The number of processes to actually use.
+    """
+    try:
+      _InitializeCrossProcessVariables()
+    except Exception, e:
+      self.logger.debug(traceback.format_exc())
+      self.logger.warn('\n'.join(textwrap.wrap(
+          'Unable to start a multiprocessing manager, so operations will use '
+          'a single process: %s' % e)))
+      return 1
+    return process_count
+
+  def _SetUpPerCallerState(self, func, exception_handler, shared_attrs,
+                           arg_checker, should_return_results, fail_on_error,
+                           share_with_other_processes=True):
+    """
+    Set up the state for a caller id, corresponding to one Apply call. Only
+    the state that's needed by other processes goes through the manager; the
+    rest of it is kept by the _TaskStatusAggregator.
+
+    Args:
+      share_with_other_processes: False if all of the tasks for the call will
+                                  run in this process, in which case the
+                                  manager isn't involved at all.
+      See command.Apply for description of other arguments.
+
+    Returns:
+      The caller ID for the call.
+    """
     # Get a new caller ID.
     with caller_id_lock:
       caller_id_counter.value = caller_id_counter.value + 1
@@ -849,39 +1049,74 @@ class Command(object):
     # recreate it later in the WorkerThread. This is not a problem since any
     # logger with the same name will be treated as a singleton.
     cls.logger = None
-    class_map[caller_id] = cls
-    
-    total_tasks[caller_id] = -1  # -1 => the producer hasn't finished yet.
-    call_completed_map[caller_id] = False
-    caller_id_finished_count.put(caller_id, 0)
-    global_return_values_map.put(caller_id, [])
+    caller_info = CallerInfo(cls, func, exception_handler,
+                             should_return_results, arg_checker, fail_on_error,
+                             shared_attrs)
+    if share_with_other_processes:
+      caller_info_map[caller_id] = caller_info
+    cached_caller_info[caller_id] = caller_info
     return caller_id
 
-  def _CreateNewConsumerPool(self, num_processes, num_threads):
-    """Create a new pool of processes that call _ApplyThreads."""
+  def _CreateNewConsumerPool(self, num_processes, num_threads,
+                             adaptive_thread_bounds=None):
+    """
+    Create a new pool of processes that call _ApplyThreads, for the next level
+    of nested calls to Apply. Only the main thread may do this.
+    """
+    level = len(consumer_pools)
+    # Tasks performed by the new processes may make calls to Apply that use
+    # the pool for the next level, so they need to inherit its queue.
+    while len(task_queues) < level + 2:
+      task_queues.append(_NewMultiprocessingQueue())
+    task_queue = task_queues[level]
     processes = []
-    task_queue = _NewMultiprocessingQueue()
-    task_queues.append(task_queue)
-
-    current_max_recursive_level.value = current_max_recursive_level.value + 1
-    if current_max_recursive_level.value > MAX_RECURSIVE_DEPTH:
-      raise CommandException('Recursion depth of Apply calls is too great.')
     for shard in range(num_processes):
-      recursive_apply_level = len(consumer_pools)
       p = multiprocessing.Process(
           target=self._ApplyThreads,
-          args=(num_threads, recursive_apply_level, shard))
+          args=(num_threads, task_queue, shard),
+          kwargs={'adaptive_thread_bounds': adaptive_thread_bounds})
       p.daemon = True
       processes.append(p)
       p.start()
     consumer_pool = _ConsumerPool(processes, task_queue)
     consumer_pools.append(consumer_pool)
+    num_consumer_pools.value = len(consumer_pools)
+
+  def _WaitForConsumerPool(self, level):
+    """
+    Called by a nested call to Apply in a consumer process, which can't create
+    processes itself. Asks the main thread, which is waiting for the top-level
+    call that led to this one, to create the consumer pool for level (and any
+    missing ones above it), and waits until it has.
+    """
+    with call_done_cond:
+      while num_consumer_pools.value <= level:
+        num_consumer_pools_needed.value = max(num_consumer_pools_needed.value,
+                                              level + 1)
+        call_done_cond.notify_all()
+        call_done_cond.wait()
+
+  def _ShouldUseProcessesForNestedCall(self, process_count):
+    """
+    Returns whether a nested call to Apply should send its tasks to the pool
+    of consumer processes for its level rather than perform them with the
+    threads of this process. That's the case when this is a consumer process
+    and other consumer processes are waiting for tasks, e.g., when the
+    top-level call copies a single large file and the nested call performs
+    its parallel composite upload. Otherwise, the top-level call is keeping the
+    processes busy, and more processes would just compete with them.
+    """
+    if (process_count <= 1 or not self.multiprocessing_is_available or
+        manager is None or not multiprocessing.current_process().daemon or
+        self.recursive_apply_level >= MAX_RECURSIVE_DEPTH):
+      return False
+    return waiting_consumer_count.value > (1 if waiting_for_tasks else 0)
 
   def Apply(self, func, args_iterator, exception_handler,
             shared_attrs=None, arg_checker=_UriArgChecker,
             parallel_operations_override=False, process_count=None,
             thread_count=None, should_return_results=False,
-            fail_on_error=False):
+            fail_on_error=False, task_order=None):
     """
     Determines whether the necessary parts of the multiprocessing module are
     available, and delegates to _ParallelApply or _SequentialApply as
@@ -908,7 +1143,11 @@ class Command(object):
       fail_on_error: If true, then raise any exceptions encountered when
                      executing func. This is only applicable in the case of
                      process_count == thread_count == 1.
+      task_order: The order in which to dispatch tasks when running in
+                  parallel (one of TASK_ORDERS). If not specified, then the
+                  configured default will be used.
     """
+    thread_count_is_configured = not thread_count
     if shared_attrs:
       original_shared_vars_values = {}  # We'll add these back in at the end.
       for name in shared_attrs:
@@ -922,9 +1161,29 @@ class Command(object):
     is_main_thread = (self.recursive_apply_level == 0
                       and self.sequential_caller_id == -1)
 
+    # Only adjust the number of threads if it came from the config file; a
+    # caller that asks for a specific number of threads gets exactly that.
+    adaptive_thread_bounds = None
+    if ((self.parallel_operations or parallel_operations_override)
+        and thread_count_is_configured and self.multiprocessing_is_available):
+      adaptive_thread_bounds = self._GetAdaptiveThreadCountBounds()
+    if adaptive_thread_bounds:
+      max_thread_count = adaptive_thread_bounds[1]
+    else:
+      max_thread_count = thread_count
+
+    if self.recursive_apply_level > 0:
+      # Nested calls only use consumer processes when the top-level call
+      # leaves some of them idle; see _ParallelApply.
+      if not self._ShouldUseProcessesForNestedCall(process_count):
+        process_count = 1
+    elif (self.multiprocessing_is_available and process_count > 1
+          and manager is None):
+      process_count = self._PrepareForMultipleProcesses(process_count)
+
     # We don't honor the fail_on_error flag in the case of multiple threads
     # or processes.
-    fail_on_error = fail_on_error and (process_count * thread_count == 1)
+    fail_on_error = fail_on_error and (process_count * max_thread_count == 1)
     
     # Only check this from the first call in the main thread. Apart from the
     # fact that it's  wasteful to try this multiple times in general, it also
@@ -940,39 +1199,39 @@ class Command(object):
         # threads or processes.
         MultiprocessingIsAvailable(logger=self.logger)
 
-    if self.multiprocessing_is_available:
-      caller_id = self._SetUpPerCallerState()
-    else:
-      self.sequential_caller_id += 1
-      caller_id = self.sequential_caller_id
-      
-      if is_main_thread:
-        global global_return_values_map, shared_vars_map
-        global caller_id_finished_count, shared_vars_list_map
-        global_return_values_map = BasicIncrementDict()
-        global_return_values_map.put(caller_id, [])
-        shared_vars_map = BasicIncrementDict()
-        caller_id_finished_count = BasicIncrementDict()
-        shared_vars_list_map = {}
-
-
-    # If any shared attributes passed by caller, create a dictionary of
-    # shared memory variables for every element in the list of shared
-    # attributes.
-    if shared_attrs:
-      shared_vars_list_map[caller_id] = shared_attrs
-      for name in shared_attrs:
-        shared_vars_map.put((caller_id, name), 0)
-
     # Make all of the requested function calls.
-    if self.multiprocessing_is_available and thread_count * process_count > 1:
+    is_parallel = (self.multiprocessing_is_available
+                   and max_thread_count * process_count > 1)
+    scheduler = _GetCurrentWorkerScheduler()
+    if is_parallel and scheduler and process_count == 1:
+      (caller_id, task_status) = self._ApplyInWorkerPool(
+          func, args_iterator, exception_handler, shared_attrs, arg_checker,
+          should_return_results, task_order, scheduler)
+      return_values = task_status.return_values
+      shared_vars = task_status.shared_vars
+    elif is_parallel:
+      caller_id = self._SetUpPerCallerState(func, exception_handler,
+                                            shared_attrs, arg_checker,
+                                            should_return_results,
+                                            fail_on_error)
+      args_iterator = self._ReorderTasks(args_iterator, task_order)
       self._ParallelApply(func, args_iterator, exception_handler, caller_id,
                           arg_checker, parallel_operations_override,
                           process_count, thread_count, should_return_results,
-                          fail_on_error)
+                          fail_on_error, adaptive_thread_bounds)
+      return_values = global_return_values_map.get(caller_id, [])
+      shared_vars = shared_vars_map
     else:
+      # Nothing about a sequential call needs to be shared with any other
+      # thread or process, so all of its state is kept locally.
+      self.sequential_caller_id += 1
+      caller_id = self.sequential_caller_id
+      task_status = _SequentialTaskStatus(shared_attrs)
       self._SequentialApply(func, args_iterator, exception_handler, caller_id,
-                            arg_checker, should_return_results, fail_on_error)
+                            arg_checker, should_return_results, fail_on_error,
+                            task_status)
+      return_values = task_status.return_values
+      shared_vars = task_status.shared_vars
 
     if shared_attrs:
       for name in shared_attrs:
@@ -980,24 +1239,30 @@ class Command(object):
         # and simply apply the delta after what was done during the call to
         # apply.                      
         final_value = (original_shared_vars_values[name] +
-                       shared_vars_map.get((caller_id, name)))
+                       shared_vars.get((caller_id, name), 0))
         setattr(self, name, final_value)
 
     if should_return_results:
-      return global_return_values_map.get(caller_id)
+      return return_values
 
   def _SequentialApply(self, func, args_iterator, exception_handler, caller_id,
-                       arg_checker, should_return_results, fail_on_error):
+                       arg_checker, should_return_results, fail_on_error,
+                       task_status):
     """
     Perform all function calls sequentially in the current thread. No other
-    threads or processes will be spawned. This degraded functionality is only
-    for use when the multiprocessing module is not available for some reason.
+    threads or processes will be spawned. This is used when only one thread
+    and process were requested, or when the multiprocessing module is not
+    available for some reason.
+
+    Args:
+      task_status: The _SequentialTaskStatus in which to record the results.
+      See command.Apply for description of other arguments.
     """
 
     # Create a WorkerThread to handle all of the logic needed to actually call
     # the function. Note that this thread will never be started, and all work
     # is done in the current thread.
-    worker_thread = WorkerThread(None, False)
+    worker_thread = WorkerThread(None, task_status=task_status)
     args_iterator = iter(args_iterator)
     while True:
       
@@ -1025,7 +1290,8 @@ class Command(object):
 
   def _ParallelApply(self, func, args_iterator, exception_handler, caller_id,
                      arg_checker, parallel_operations_override, process_count,
-                     thread_count, should_return_results, fail_on_error):
+                     thread_count, should_return_results, fail_on_error,
+                     adaptive_thread_bounds=None):
     """
     Dispatch input arguments across a pool of parallel OS
     processes and/or Python threads, based on options (-m or not)
@@ -1033,20 +1299,28 @@ class Command(object):
     or only one OS process requested, execute requests sequentially
     in the current OS process.
     
-    In the multi-process case, we will create one pool of worker processes for
-    each level of the tree of recursive calls to Apply. E.g., if A calls
-    Apply(B), and B ultimately calls Apply(C) followed by Apply(D), then we
-    will only create two sets of worker processes - B will execute in the first,
-    and C and D will execute in the second. If C is then changed to call
-    Apply(E) and D is changed to call Apply(F), then we will automatically
-    create a third set of processes (lazily, when needed) that will be used to
-    execute calls to E and F. This might look something like:
+    All top-level calls to Apply share one pool of worker processes, which is
+    created by the first call that uses more than one process. A call to Apply
+    that's made by a task (e.g., a copy that performs a parallel composite
+    upload) usually doesn't use processes. Instead, if the task is running in
+    a WorkerPool, its tasks are added to that pool and the calling thread
+    helps to perform them rather than blocking; see _ApplyInWorkerPool.
+    Otherwise (e.g., if the parent call to Apply was sequential), it uses a
+    new pool of threads in the calling process.
+
+    However, if other consumer processes are waiting for tasks when a task
+    running in a consumer process calls Apply (e.g., because the top-level
+    call is copying a single large file), the nested call's tasks are spread
+    across processes instead; see _ShouldUseProcessesForNestedCall. Since only
+    the main thread may create processes, the consumer process asks it to
+    create a pool of processes for that level of nesting, which is shared by
+    all later calls at the same level. E.g., if A calls Apply(B), and B calls
+    Apply(C) while other processes are idle, then B executes in the first pool
+    and C in the second:
 
     Pool1 Executes:                B
                                   / \
-    Pool2 Executes:              C   D
-                                /     \
-    Pool3 Executes:            E       F
+    Pool2 Executes:              C   C
 
     Apply's parallelism is generally broken up into 4 cases:
     - If process_count == thread_count == 1, then all tasks will be executed
@@ -1063,6 +1337,9 @@ class Command(object):
 
     Args:
       caller_id: The caller ID unique to this call to command.Apply.
+      adaptive_thread_bounds: (min_thread_count, max_thread_count) if the
+                              number of threads should be adjusted as tasks
+                              run, starting from thread_count, or None.
       See command.Apply for description of other arguments.
     """    
     is_main_thread = self.recursive_apply_level == 0
@@ -1071,42 +1348,27 @@ class Command(object):
     if not IS_WINDOWS and is_main_thread:
       signal.signal(signal.SIGINT, self._HandleMultiProcessingControlC)
 
-    if not len(task_queues):
-      # The process we create will need to access the next recursive level
-      # of task queues if it makes a call to Apply, so we always keep around
-      # one more queue than we know we need. OTOH, if we don't create a new
-      # process, the existing process still needs a task queue to use.
-      task_queues.append(_NewMultiprocessingQueue())
+    # This must happen before we create any consumer processes, since they
+    # will report the status of their tasks to the aggregator in this process.
+    _StartTaskStatusAggregatorIfNeeded()
 
-    if process_count > 1:  # Handle process pool creation.
-      # Check whether this call will need a new set of workers.
-      with need_pool_or_done_cond:
-        if self.recursive_apply_level >= current_max_recursive_level.value:
-          # Only the main thread is allowed to create new processes - otherwise,
-          # we will run into some Python bugs.
-          if is_main_thread:
-            self._CreateNewConsumerPool(process_count, thread_count)
-          else:
-            # Notify the main thread that we need a new consumer pool.
-            new_pool_needed.value = 1
-            need_pool_or_done_cond.notify_all()
-            # The main thread will notify us when it finishes.
-            need_pool_or_done_cond.wait()
-
-    # If we're running in this process, create a separate task queue. Otherwise,
-    # if Apply has already been called with process_count > 1, then there will
-    # be consumer pools trying to use our processes.
     if process_count > 1:
+      # Only the main thread is allowed to create new processes - otherwise,
+      # we will run into some Python bugs.
+      if is_main_thread:
+        if not consumer_pools:
+          self._CreateNewConsumerPool(process_count, thread_count,
+                                      adaptive_thread_bounds)
+      else:
+        self._WaitForConsumerPool(self.recursive_apply_level)
       task_queue = task_queues[self.recursive_apply_level]
     else:
+      # If we're running in this process, create a separate task queue.
       task_queue = _NewMultiprocessingQueue()
 
     # Kick off a producer thread to throw tasks in the global task queue. We
-    # do this asynchronously so that the main thread can be free to create new
-    # consumer pools when needed (otherwise, any thread with a task that needs
-    # a new consumer pool must block until we're completely done producing; in
-    # the worst case, every worker blocks on such a call and the producer fills
-    # up the task queue before it finishes, so we block forever).
+    # do this asynchronously so that the consumers can start on the first
+    # tasks while we're still producing the rest.
     producer_thread = ProducerThread(copy.copy(self), args_iterator, caller_id,
                                      func, task_queue, should_return_results,
                                      exception_handler, arg_checker,
@@ -1114,33 +1376,31 @@ class Command(object):
 
     if process_count > 1:
       # Wait here until either:
-      #   1. We're the main thread and someone needs a new consumer pool - in
-      #      which case we create one and continue waiting.
-      #   2. Someone notifies us that all of the work we requested is done, in
-      #      which case we retrieve the results (if applicable) and stop
-      #      waiting.
+      #   1. We're the main thread and a nested call in a consumer process
+      #      needs a new consumer pool - in which case we create it and
+      #      continue waiting.
+      #   2. Someone notifies us that all of the work we requested is done.
       while True:
-        with need_pool_or_done_cond:
-          # Either our call is done, or someone needs a new level of consumer
-          # pools, or we the wakeup call was meant for someone else. It's
-          # impossible for both conditions to be true, since the main thread is
-          # blocked on any other ongoing calls to Apply, and a thread would not
-          # ask for a new consumer pool unless it had more work to do.
-          if call_completed_map[caller_id]:
+        with call_done_cond:
+          # Note that we must check these before the wait() call; otherwise,
+          # the notification can happen before we start waiting, in which case
+          # we'll block forever.
+          while not (call_completed_map.get(caller_id, False) or
+                     (is_main_thread and
+                      len(consumer_pools) < num_consumer_pools_needed.value)):
+            call_done_cond.wait()
+          if call_completed_map.get(caller_id, False):
             break
-          elif is_main_thread and new_pool_needed.value:
-            new_pool_needed.value = 0
-            self._CreateNewConsumerPool(process_count, thread_count)
-            need_pool_or_done_cond.notify_all()
-            
-          # Note that we must check the above conditions before the wait() call;
-          # otherwise, the notification can happen before we start waiting, in
-          # which case we'll block forever.
-          need_pool_or_done_cond.wait()
+        while len(consumer_pools) < num_consumer_pools_needed.value:
+          self._CreateNewConsumerPool(process_count, thread_count,
+                                      adaptive_thread_bounds)
+        with call_done_cond:
+          call_done_cond.notify_all()
     else:  # Using a single process.
       shard = 0
-      self._ApplyThreads(thread_count, self.recursive_apply_level, shard,
-                         is_blocking_call=True, task_queue=task_queue)
+      self._ApplyThreads(thread_count, task_queue, shard,
+                         is_blocking_call=True,
+                         adaptive_thread_bounds=adaptive_thread_bounds)
 
     # We encountered an exception from the producer thread before any arguments
     # were enqueued, but it wouldn't have been propagated, so we'll now
@@ -1153,8 +1413,8 @@ class Command(object):
     if producer_thread.iterator_exception and fail_on_error:
       raise producer_thread.iterator_exception
 
-  def _ApplyThreads(self, thread_count, recursive_apply_level, shard,
-                    is_blocking_call=False, task_queue=None):
+  def _ApplyThreads(self, thread_count, task_queue, shard,
+                    is_blocking_call=False, adaptive_thread_bounds=None):
     """
     Assigns the work from the global task queue shared among all processes
     to an individual process, for later consumption either by the WorkerThreads
@@ -1163,48 +1423,142 @@ class Command(object):
     Args:
       thread_count: The number of threads used to perform the work. If 1, then
                     perform all work in this thread.
-      recursive_apply_level: The depth in the tree of recursive calls to Apply
-                             of this thread.
+      task_queue: The queue from which to take the work.
       shard: Assigned subset (shard number) for this function.
       is_blocking_call: True iff the call to Apply is blocked on this call
                         (which is true iff process_count == 1), implying that
                         _ApplyThreads must behave as a blocking call.
+      adaptive_thread_bounds: (min_thread_count, max_thread_count) if the
+                              number of threads should be adjusted as tasks
+                              run, starting from thread_count, or None.
     """
     self._ResetConnectionPool()
-    
-    task_queue = task_queue or task_queues[recursive_apply_level]
 
-    if thread_count > 1:
-      worker_pool = WorkerPool(thread_count)
+    use_worker_threads = thread_count > 1 or adaptive_thread_bounds
+    if use_worker_threads:
+      worker_pool = WorkerPool(thread_count,
+                               adaptive_thread_bounds=adaptive_thread_bounds,
+                               logger=self.logger)
     else:
-      worker_pool = SameThreadWorkerPool(self)
+      worker_pool = SameThreadWorkerPool()
 
-    num_enqueued = 0
+    task_status_reporter = _GetTaskStatusReporter()
     while True:
-      task = task_queue.get()
-      if task.args != ZERO_TASKS_TO_DO_ARGUMENT:
-        # If we have no tasks to do and we're performing a blocking call, we
-        # need a special signal to tell us to stop - otherwise, we block on
-        # the call to task_queue.get() forever.
-        worker_pool.AddTask(task)
-        num_enqueued += 1
-
+      worker_pool.WaitForIdleThreads()
       if is_blocking_call:
-        num_to_do = total_tasks[task.caller_id]
-        # The producer thread won't enqueue the last task until after it has
-        # updated total_tasks[caller_id], so we know that num_to_do < 0 implies
-        # we will do this check again.
-        if num_to_do >= 0 and num_enqueued == num_to_do:
-          if thread_count == 1:
-            return
-          else:
-            while True:
-              with need_pool_or_done_cond:
-                if call_completed_map[task.caller_id]:
-                  # We need to check this first, in case the condition was
-                  # notified before we grabbed the lock.
-                  return
-                need_pool_or_done_cond.wait()
+        (caller_id, args_batch) = task_queue.get()
+      else:
+        _SetWaitingForTasks(True)
+        try:
+          (caller_id, args_batch) = task_queue.get()
+        finally:
+          _SetWaitingForTasks(False)
+      if args_batch is not NO_MORE_TASKS:
+        caller_info = _GetCallerInfo(caller_id)
+        worker_pool.AddTasks(
+            [Task(caller_info.func, args, caller_id,
+                  caller_info.exception_handler,
+                  caller_info.should_return_results, caller_info.arg_checker,
+                  caller_info.fail_on_error)
+             for args in args_batch],
+            caller_info.cls.recursive_apply_level)
+        if not use_worker_threads and task_queue.empty():
+          # We're about to block waiting for more work, so don't hold on to
+          # the status of the tasks we've already done.
+          task_status_reporter.Flush()
+      elif is_blocking_call:
+        # The producer enqueues this after all of the tasks for the call, and
+        # nobody else reads from our task queue, so we're done consuming. We
+        # still need to wait for the aggregator to tell us that all of the
+        # tasks are finished before the results are available.
+        task_status_reporter.Flush()
+        while True:
+          with call_done_cond:
+            if call_completed_map.get(caller_id, False):
+              # We need to check this first, in case the condition was
+              # notified before we grabbed the lock.
+              return
+            call_done_cond.wait()
+
+  def _ApplyInWorkerPool(self, func, args_iterator, exception_handler,
+                         shared_attrs, arg_checker, should_return_results,
+                         task_order, scheduler):
+    """
+    Performs a call to Apply that was made by a task running in a WorkerPool,
+    using the threads of that pool rather than new processes or threads. The
+    tasks are added to the pool's _TaskScheduler, where they take priority
+    over the tasks of less deeply nested calls, and rather than blocking until
+    they're done, this thread helps to perform them. Since everything happens
+    in this process, the status of the tasks is kept locally.
+
+    Args:
+      scheduler: The _TaskScheduler of the WorkerPool running this thread.
+      See command.Apply for description of other arguments.
+
+    Returns:
+      (caller_id, task_status), where task_status is the _LocalTaskStatus
+      holding the results of the call.
+    """
+    task_level = self.recursive_apply_level + 1
+    if task_level > MAX_RECURSIVE_DEPTH:
+      raise CommandException('Recursion depth of Apply calls is too great.')
+    caller_id = self._SetUpPerCallerState(func, exception_handler,
+                                          shared_attrs, arg_checker,
+                                          should_return_results, False,
+                                          share_with_other_processes=False)
+    task_status = _LocalTaskStatus(shared_attrs, scheduler)
+    local_task_statuses[caller_id] = task_status
+    shared_vars_updater = _SharedVariablesUpdater()
+    num_tasks = 0
+    producer_exception = None
+    try:
+      args_iterator = iter(self._ReorderTasks(args_iterator, task_order))
+      while True:
+        try:
+          args = args_iterator.next()
+        except StopIteration, e:
+          break
+        except Exception, e:
+          try:
+            exception_handler(self, e)
+          except Exception, e1:
+            self.logger.debug(
+                'Caught exception while handling exception for %s:\n%s',
+                func, traceback.format_exc())
+          task_status.ReportSharedVarDeltas(
+              caller_id,
+              shared_vars_updater.Update(caller_id, self, task_status))
+          continue
+        if arg_checker(self, args):
+          num_tasks += 1
+          scheduler.AddTasks(
+              [Task(func, args, caller_id, exception_handler,
+                    should_return_results, arg_checker, False)],
+              task_level)
+    except Exception, e:
+      # The tasks we've already added still have to finish before we can
+      # clean up after them.
+      producer_exception = e
+
+    task_status.SetTotalTasks(num_tasks)
+    worker_thread = threading.current_thread()
+    try:
+      while True:
+        # Only help with tasks that are at least as deeply nested as ours, so
+        # that we don't start something that takes much longer than our call.
+        task = scheduler.GetTask(min_level=task_level,
+                                 stop_func=task_status.IsDone)
+        if task is None:
+          break
+        worker_thread.PerformTask(
+            task, worker_thread.GetClassForCaller(task.caller_id))
+    finally:
+      del local_task_statuses[caller_id]
+      del cached_caller_info[caller_id]
+
+    if producer_exception:
+      raise producer_exception
+    return (caller_id, task_status)
 
 
 # Below here lie classes and functions related to controlling the flow of tasks
@@ -1259,6 +1613,42 @@ class Task(namedtuple('Task',
   pass
 
 
+class CallerInfo(namedtuple('CallerInfo',
+    'cls func exception_handler should_return_results arg_checker ' +
+    'fail_on_error shared_attrs')):
+  """
+  Everything that's the same for all of the tasks of a call to Apply. This is
+  stored once per caller ID in caller_info_map, rather than being sent along
+  with every task.
+
+  Args:
+    cls: The copy of the calling Command instance that gives context to func.
+    shared_attrs: The names of the shared attributes for the call, or None.
+    See Task for description of other arguments.
+  """
+  pass
+
+
+def _SetWaitingForTasks(waiting):
+  """
+  Records whether this consumer process is waiting for tasks, for
+  Command._ShouldUseProcessesForNestedCall.
+  """
+  global waiting_for_tasks
+  with waiting_consumer_count.get_lock():
+    waiting_consumer_count.value += 1 if waiting else -1
+  waiting_for_tasks = waiting
+
+
+def _GetCallerInfo(caller_id):
+  """Returns the CallerInfo for caller_id, asking the manager at most once."""
+  caller_info = cached_caller_info.get(caller_id, None)
+  if caller_info is None:
+    caller_info = caller_info_map[caller_id]
+    cached_caller_info[caller_id] = caller_info
+  return caller_info
+
+
 class ProducerThread(threading.Thread):
   """Thread used to enqueue work for other processes and threads."""
   def __init__(self, cls, args_iterator, caller_id, func, task_queue,
@@ -1295,6 +1685,10 @@ class ProducerThread(threading.Thread):
     self.should_return_results = should_return_results
     self.fail_on_error = fail_on_error
     self.shared_variables_updater = _SharedVariablesUpdater()
+    self.task_status_reporter = _GetTaskStatusReporter()
+    # The size of the batches of arguments we put in the task queue; see
+    # _EnqueueBatch.
+    self.batch_size = 1
     self.daemon = True
     self.unknown_exception = None
     self.iterator_exception = None
@@ -1302,8 +1696,8 @@ class ProducerThread(threading.Thread):
 
   def run(self):
     num_tasks = 0
-    cur_task = None
-    last_task = None
+    batch = []
+    batch_start_time = None
     try:
       args_iterator = iter(self.args_iterator)
       while True:
@@ -1322,17 +1716,21 @@ class ProducerThread(threading.Thread):
               self.cls.logger.debug(
                   'Caught exception while handling exception for %s:\n%s',
                   self.func, traceback.format_exc())
-            self.shared_variables_updater.Update(self.caller_id, self.cls)
+            self.task_status_reporter.ReportSharedVarDeltas(
+                self.caller_id,
+                self.shared_variables_updater.Update(
+                    self.caller_id, self.cls, self.task_status_reporter))
             continue
 
         if self.arg_checker(self.cls, args):
           num_tasks += 1
-          last_task = cur_task
-          cur_task = Task(self.func, args, self.caller_id,
-                          self.exception_handler, self.should_return_results,
-                          self.arg_checker, self.fail_on_error)
-          if last_task:
-            self.task_queue.put(last_task, self.caller_id)
+          if not batch:
+            batch_start_time = time.time()
+          batch.append(args)
+          if (len(batch) >= self.batch_size or
+              time.time() - batch_start_time >= TASK_BATCH_MAX_DELAY):
+            self._EnqueueBatch(batch)
+            batch = []
     except Exception, e:
       # This will also catch any exception raised due to an error in the
       # iterator when fail_on_error is set, so check that we failed for some
@@ -1340,46 +1738,277 @@ class ProducerThread(threading.Thread):
       if not self.iterator_exception:
         self.unknown_exception = e
     finally:
-      # We need to make sure to update total_tasks[caller_id] before we enqueue
-      # the last task. Otherwise, a worker can retrieve the last task and
-      # complete it, then check total_tasks and determine that we're not done
-      # producing all before we update total_tasks. This approach forces workers
-      # to wait on the last task until after we've updated total_tasks.
-      total_tasks[self.caller_id] = num_tasks
-      if not cur_task:
-        # This happens if there were zero arguments to be put in the queue.
-        cur_task = Task(None, ZERO_TASKS_TO_DO_ARGUMENT, self.caller_id,
-                        None, None, None, None)
-      self.task_queue.put(cur_task, self.caller_id)
-
-      # It's possible that the workers finished before we updated total_tasks,
-      # so we need to check here as well.
-      _NotifyIfDone(self.caller_id,
-                    caller_id_finished_count.get(self.caller_id))
-      
+      if batch:
+        self._EnqueueBatch(batch)
+      # The aggregator can't consider the call finished until it knows how
+      # many tasks there were, so the tasks themselves may be finished before
+      # or after this is reported.
+      self.task_status_reporter.ReportTotalTasks(self.caller_id, num_tasks)
+      self.task_queue.put((self.caller_id, NO_MORE_TASKS))
+
+  def _EnqueueBatch(self, batch):
+    """
+    Puts a batch of arguments in the task queue, and adjusts the size of the
+    next batch. If the consumers haven't yet taken everything we've given them
+    so far, then they're behind and we save work on both ends by sending
+    bigger batches. If they have, then they may be waiting for us, so we send
+    smaller batches so that they get each argument sooner.
+    """
+    if self.task_queue.empty():
+      self.batch_size = max(1, self.batch_size / 2)
+    else:
+      self.batch_size = min(MAX_TASK_BATCH_SIZE, self.batch_size * 2)
+    self.task_queue.put((self.caller_id, batch))
+
 
 class SameThreadWorkerPool(object):
   """Behaves like a WorkerPool, but used for the single-threaded case."""
-  def __init__(self, cls):
-    self.cls = cls
+  def __init__(self):
     self.worker_thread = WorkerThread(None)
   
-  def AddTask(self, task):
-    self.worker_thread.PerformTask(task, self.cls)
+  def AddTasks(self, tasks, level):
+    for task in tasks:
+      self.worker_thread.PerformTask(
+          task, self.worker_thread.GetClassForCaller(task.caller_id))
+
+  def WaitForIdleThreads(self):
+    pass
 
 
 class WorkerPool(object):
   """Pool of worker threads to which tasks can be added."""
-  def __init__(self, thread_count):
-    self.task_queue = _NewThreadsafeQueue()
+  def __init__(self, thread_count, adaptive_thread_bounds=None, logger=None):
+    """
+    Args:
+      thread_count: The number of worker threads to start with.
+      adaptive_thread_bounds: If not None, a tuple of
+                              (min_thread_count, max_thread_count) between
+                              which the number of active threads will be
+                              adjusted by an _AdaptiveConcurrencyController.
+      logger: Logger used to report any such adjustments.
+    """
+    self.scheduler = _TaskScheduler()
     self.threads = []
-    for _ in range(thread_count):
-      worker_thread = WorkerThread(self.task_queue)
+    self.concurrency_controller = None
+    if adaptive_thread_bounds:
+      self.concurrency_controller = _AdaptiveConcurrencyController(
+          thread_count, adaptive_thread_bounds[0], adaptive_thread_bounds[1],
+          self._StartThreads, logger)
+      thread_count = self.concurrency_controller.limit
+    self._StartThreads(thread_count)
+
+  def _StartThreads(self, thread_count):
+    """Makes sure that at least thread_count threads have been started."""
+    while len(self.threads) < thread_count:
+      worker_thread = WorkerThread(
+          self.scheduler, thread_index=len(self.threads),
+          concurrency_controller=self.concurrency_controller)
       self.threads.append(worker_thread)
       worker_thread.start()
 
-  def AddTask(self, task):
-    self.task_queue.put(task)
+  def AddTasks(self, tasks, level):
+    self.scheduler.AddTasks(tasks, level)
+
+  def WaitForIdleThreads(self):
+    """
+    Blocks until there are fewer waiting tasks than active threads, so that
+    this process doesn't take more work from the queue shared with the other
+    consumer processes than it can start on soon.
+    """
+    if self.concurrency_controller:
+      num_threads = self.concurrency_controller.limit
+    else:
+      num_threads = len(self.threads)
+    self.scheduler.WaitUntilFewerThan(num_threads)
+
+
+class _TaskScheduler(object):
+  """
+  Holds the tasks waiting to be performed by the threads of a WorkerPool,
+  including those of any nested calls to Apply made by its tasks. The tasks
+  of the most deeply nested calls are performed first (so that the tasks
+  waiting on them can finish), and tasks at the same level are performed in
+  the order in which they were added.
+  """
+  def __init__(self):
+    lock = threading.RLock()
+    self.cond = threading.Condition(lock)
+    # Notified whenever a task is taken, for WaitUntilFewerThan.
+    self.task_taken_cond = threading.Condition(lock)
+    # Heap of (-level, sequence number, task).
+    self.heap = []
+    self.sequence_number = 0
+    # The number of threads waiting in GetTask for tasks at a minimum level.
+    self.num_waiting_helpers = 0
+
+  def AddTasks(self, tasks, level):
+    """
+    Args:
+      tasks: The Tasks to add.
+      level: The recursive_apply_level of the class instances that will
+             perform the tasks.
+    """
+    with self.cond:
+      for task in tasks:
+        heapq.heappush(self.heap, (-level, self.sequence_number, task))
+        self.sequence_number += 1
+      if self.num_waiting_helpers:
+        # Threads that are helping with a nested call only take some of the
+        # tasks, so they all need a chance to look.
+        self.cond.notify_all()
+      else:
+        self.cond.notify(len(tasks))
+
+  def GetTask(self, min_level=0, stop_func=None):
+    """
+    Blocks until there's a task whose level is at least min_level, and
+    returns it.
+
+    Args:
+      min_level: The lowest level of task to return.
+      stop_func: If not None, a function that's checked while holding
+                 self.cond whenever it's notified; once it returns True,
+                 we stop waiting and return None.
+
+    Returns:
+      The Task, or None if stop_func returned True.
+    """
+    with self.cond:
+      while True:
+        if stop_func and stop_func():
+          return None
+        if self.heap and -self.heap[0][0] >= min_level:
+          self.task_taken_cond.notify()
+          return heapq.heappop(self.heap)[2]
+        if min_level:
+          self.num_waiting_helpers += 1
+          try:
+            self.cond.wait()
+          finally:
+            self.num_waiting_helpers -= 1
+        else:
+          self.cond.wait()
+
+  def WaitUntilFewerThan(self, num_tasks):
+    """Blocks until fewer than num_tasks tasks are waiting to be performed."""
+    with self.task_taken_cond:
+      while len(self.heap) >= num_tasks:
+        self.task_taken_cond.wait()
+
+  def empty(self):
+    return not self.heap
+
+
+def _GetCurrentWorkerScheduler():
+  """
+  Returns the _TaskScheduler of the WorkerPool that the current thread
+  belongs to, or None if it doesn't belong to one.
+  """
+  return getattr(threading.current_thread(), 'scheduler', None)
+
+
+class _AdaptiveConcurrencyController(object):
+  """
+  Adjusts the number of active threads in a WorkerPool, using additive
+  increase and multiplicative decrease (AIMD): after each interval of
+  ADAPTIVE_INTERVAL seconds, we add one thread unless the last interval showed
+  that we have too many, in which case we multiply the number of threads by
+  ADAPTIVE_DECREASE_FACTOR. We have too many threads if the service is
+  overloaded (too many tasks failed with errors like 503 or 429), or if the
+  last thread we added made the throughput worse (e.g., because the disk or
+  the network is saturated).
+
+  Threads are never stopped. Instead, each thread waits before starting a new
+  task while its index is not below the current limit.
+  """
+  def __init__(self, thread_count, min_thread_count, max_thread_count,
+               start_threads_func, logger):
+    """
+    Args:
+      thread_count: The initial number of active threads.
+      min_thread_count: The smallest number of active threads allowed.
+      max_thread_count: The largest number of active threads allowed.
+      start_threads_func: Called with the new limit whenever it increases, so
+                          that the pool can start threads as needed.
+      logger: Logger used to report any adjustments.
+    """
+    self.min_thread_count = min_thread_count
+    self.max_thread_count = max_thread_count
+    self.limit = max(min_thread_count, min(max_thread_count, thread_count))
+    self.start_threads_func = start_threads_func
+    self.logger = logger
+    self.cond = threading.Condition()
+    self.interval_start_time = time.time()
+    self.num_done = 0
+    self.num_overload_errors = 0
+    # Throughput of the last interval, and whether we added a thread after it.
+    self.last_throughput = None
+    self.last_change_was_increase = False
+
+  def WaitUntilActive(self, thread_index):
+    """Blocks until the thread with the given index may start a task."""
+    with self.cond:
+      while thread_index >= self.limit:
+        self.cond.wait()
+
+  def RecordTask(self, exception=None):
+    """
+    Records that a task finished, and adjusts the limit if this is the end of
+    an interval.
+
+    Args:
+      exception: The exception raised by the task, if any.
+    """
+    with self.cond:
+      self.num_done += 1
+      if exception is not None and _IndicatesOverload(exception):
+        self.num_overload_errors += 1
+      now = time.time()
+      elapsed = now - self.interval_start_time
+      if elapsed >= ADAPTIVE_INTERVAL:
+        self._AdjustLimit(self.num_done / elapsed)
+        self.interval_start_time = now
+        self.num_done = 0
+        self.num_overload_errors = 0
+
+  def _AdjustLimit(self, throughput):
+    old_limit = self.limit
+    error_rate = float(self.num_overload_errors) / self.num_done
+    decreased_limit = max(self.min_thread_count,
+                          int(self.limit * ADAPTIVE_DECREASE_FACTOR))
+    if error_rate > ADAPTIVE_MAX_ERROR_RATE:
+      self.limit = decreased_limit
+      reason = '%d of %d tasks failed with overload errors' % (
+          self.num_overload_errors, self.num_done)
+    elif (self.last_change_was_increase and self.last_throughput and
+          throughput < self.last_throughput *
+          (1 - ADAPTIVE_THROUGHPUT_TOLERANCE)):
+      self.limit = decreased_limit
+      reason = 'throughput dropped from %.1f tasks/s' % self.last_throughput
+    else:
+      self.limit = min(self.max_thread_count, self.limit + 1)
+      reason = 'no sign of overload'
+    self.last_throughput = throughput
+    self.last_change_was_increase = self.limit > old_limit
+
+    if self.logger:
+      self.logger.debug(
+          'process %d: thread count %d -> %d at %.1f tasks/s (%s).',
+          os.getpid(), old_limit, self.limit, throughput, reason)
+    if self.limit > old_limit:
+      self.start_threads_func(self.limit)
+      self.cond.notify_all()
+
+
+def _IndicatesOverload(e):
+  """
+  Returns True if the exception e suggests that we're sending requests faster
+  than the service (or the network) can handle them.
+  """
+  status = getattr(e, 'status', None)
+  if isinstance(status, int) and (status == 429 or status >= 500):
+    return True
+  return isinstance(e, socket.error)
 
 
 class WorkerThread(threading.Thread):
@@ -1391,18 +2020,26 @@ class WorkerThread(threading.Thread):
   Note that this thread is NOT started upon instantiation because the function-
   calling logic is also used in the single-threaded case.
   """
-  def __init__(self, task_queue, multiprocessing_is_available=True):
+  def __init__(self, scheduler, task_status=None, thread_index=0,
+               concurrency_controller=None):
     """
     Args:
-      task_queue: The thread-safe queue from which this thread should obtain
-                  its work.
-      multiprocessing_is_available: False iff the multiprocessing module is not
-                                    available, in which case we're using
-                                    _SequentialApply.
+      scheduler: The _TaskScheduler of the WorkerPool from which this thread
+                 should obtain its work, or None if the thread won't be
+                 started.
+      task_status: The object to which the status of each task is reported.
+                   This is the _TaskStatusReporter for this process, unless
+                   we're using _SequentialApply, in which case it's the
+                   _SequentialTaskStatus for that call.
+      thread_index: The index of this thread in its WorkerPool.
+      concurrency_controller: The _AdaptiveConcurrencyController of the
+                              WorkerPool, if any.
     """
     super(WorkerThread, self).__init__()
-    self.task_queue = task_queue
-    self.multiprocessing_is_available = multiprocessing_is_available
+    self.scheduler = scheduler
+    self.task_status = task_status or _GetTaskStatusReporter()
+    self.thread_index = thread_index
+    self.concurrency_controller = concurrency_controller
     self.daemon = True
     self.cached_classes = {}
     self.shared_vars_updater = _SharedVariablesUpdater()
@@ -1417,11 +2054,18 @@ class WorkerThread(threading.Thread):
            by the Task's function. E.g., see _SetAclFuncWrapper.
     """
     caller_id = task.caller_id
+    task_status = self.task_status
+    if self.scheduler:
+      # The task may belong to a nested call that's running in our pool.
+      task_status = local_task_statuses.get(caller_id, task_status)
+    return_values = None
+    exception = None
     try:
       results = task.func(cls, task.args)
       if task.should_return_results:
-        global_return_values_map.update(caller_id, [results], default_value=[])
+        return_values = [results]
     except Exception, e:
+      exception = e
       if task.fail_on_error:
         raise  # Only happens for single thread and process case.
       else:
@@ -1434,28 +2078,37 @@ class WorkerThread(threading.Thread):
               'Caught exception while handling exception for %s:\n%s',
               task, traceback.format_exc())
     finally:
-      self.shared_vars_updater.Update(caller_id, cls)
+      shared_var_deltas = self.shared_vars_updater.Update(caller_id, cls,
+                                                          task_status)
 
     # Even if we encounter an exception, we still need to claim that that
     # the function finished executing. Otherwise, we won't know when to
     # stop waiting and return results.
-    num_done = caller_id_finished_count.update(caller_id, 1)
-    if self.multiprocessing_is_available:
-      _NotifyIfDone(caller_id, num_done)
+    task_status.ReportTaskDone(caller_id, return_values, shared_var_deltas)
+    if self.concurrency_controller:
+      self.concurrency_controller.RecordTask(exception)
+
+  def GetClassForCaller(self, caller_id):
+    """Returns this thread's instance of the calling class for caller_id."""
+    cls = self.cached_classes.get(caller_id, None)
+    if not cls:
+      cls = copy.copy(_GetCallerInfo(caller_id).cls)
+      cls.logger = CreateGsutilLogger(cls.command_name)
+      self.cached_classes[caller_id] = cls
+    return cls
 
   def run(self):
     while True:
-      task = self.task_queue.get()
-      caller_id = task.caller_id
-
+      if self.concurrency_controller:
+        self.concurrency_controller.WaitUntilActive(self.thread_index)
+      task = self.scheduler.GetTask()
       # Get the instance of the command with the appropriate context.
-      cls = self.cached_classes.get(caller_id, None)
-      if not cls:
-        cls = copy.copy(class_map[caller_id])
-        cls.logger = CreateGsutilLogger(cls.command_name)
-        self.cached_classes[caller_id] = cls
+      self.PerformTask(task, self.GetClassForCaller(task.caller_id))
 
-      self.PerformTask(task, cls)
+      if self.scheduler.empty():
+        # We're about to block waiting for more work, so don't hold on to the
+        # status of the tasks we've already done.
+        self.task_status.Flush()
 
 
 class _SharedVariablesUpdater(object):
@@ -1476,17 +2129,28 @@ class _SharedVariablesUpdater(object):
              a dict local to this class) and the current value of the variable
              in the class.
 
-        2.B. Using this delta, we update the last known value locally as well
-             as the globally-consistent value shared across all classes (the
-             globally consistent value is simply increased by the computed
-             delta).
+        2.B. Using this delta, we update the last known value locally, and the
+             delta is reported along with the status of the task. The
+             globally-consistent value is simply the sum of all such deltas.
     """
   def __init__(self):
     self.last_shared_var_values = {}
 
-  def Update(self, caller_id, cls):
-    """Update any shared variables with their deltas."""
-    shared_vars = shared_vars_list_map.get(caller_id, None)
+  def Update(self, caller_id, cls, task_status):
+    """
+    Computes the deltas of any shared variables.
+
+    Args:
+      caller_id: The caller_id of the call to Apply that the task belongs to.
+      cls: This thread's instance of the calling class.
+      task_status: The object that knows the shared attributes for caller_id.
+
+    Returns:
+      Dict from shared variable name to its nonzero delta, or None if there
+      are no such deltas.
+    """
+    deltas = None
+    shared_vars = task_status.GetSharedAttrs(caller_id)
     if shared_vars:
       for name in shared_vars:
         key = (caller_id, name)
@@ -1496,32 +2160,278 @@ class _SharedVariablesUpdater(object):
         # value in the class instance.
         delta = getattr(cls, name) - last_value
         self.last_shared_var_values[key] = delta + last_value
+        if delta:
+          deltas = deltas or {}
+          deltas[name] = delta
+    return deltas
+
+
+class _SequentialTaskStatus(object):
+  """
+  Keeps the status of the tasks for a call to Apply that is performed entirely
+  in the calling thread. It has the same interface as _TaskStatusReporter, but
+  the state is kept locally rather than being sent to the aggregator.
+  """
+  def __init__(self, shared_attrs):
+    self.shared_attrs = shared_attrs
+    self.return_values = []
+    # Map from (caller_id, name) to the value of that shared variable.
+    self.shared_vars = BasicIncrementDict()
 
-        # Update the globally-consistent value by simply increasing it by the
-        # computed delta.
-        shared_vars_map.update(key, delta)
+  def GetSharedAttrs(self, caller_id):
+    return self.shared_attrs
 
+  def ReportTaskDone(self, caller_id, return_values, shared_var_deltas):
+    if return_values:
+      self.return_values.extend(return_values)
+    self.ReportSharedVarDeltas(caller_id, shared_var_deltas)
 
-def _NotifyIfDone(caller_id, num_done):
+  def ReportSharedVarDeltas(self, caller_id, shared_var_deltas):
+    if shared_var_deltas:
+      for (name, delta) in shared_var_deltas.iteritems():
+        self.shared_vars.update((caller_id, name), delta)
+
+  def Flush(self):
+    pass
+
+
+class _LocalTaskStatus(_SequentialTaskStatus):
   """
-  Notify any threads that are waiting for results that something has finished.
-  Each waiting thread will then need to check the call_completed_map to see if
-  its work is done.
-  
-  Note that num_done could be calculated here, but it is passed in as an
-  optimization so that we have one less call to a globally-locked data
-  structure.
-  
+  Keeps the status of the tasks for a call to Apply that runs in a WorkerPool
+  in this process (see Command._ApplyInWorkerPool). Tasks are reported by any
+  of the pool's threads, so everything is done while holding the condition of
+  the pool's _TaskScheduler, which is notified when the call is done.
+  """
+  def __init__(self, shared_attrs, scheduler):
+    super(_LocalTaskStatus, self).__init__(shared_attrs)
+    self.cond = scheduler.cond
+    self.num_done = 0
+    self.total_tasks = None
+
+  def ReportTaskDone(self, caller_id, return_values, shared_var_deltas):
+    with self.cond:
+      super(_LocalTaskStatus, self).ReportTaskDone(caller_id, return_values,
+                                                   shared_var_deltas)
+      self.num_done += 1
+      if self.IsDone():
+        self.cond.notify_all()
+
+  def ReportSharedVarDeltas(self, caller_id, shared_var_deltas):
+    with self.cond:
+      super(_LocalTaskStatus, self).ReportSharedVarDeltas(caller_id,
+                                                          shared_var_deltas)
+
+  def SetTotalTasks(self, total_tasks):
+    with self.cond:
+      self.total_tasks = total_tasks
+      if self.IsDone():
+        self.cond.notify_all()
+
+  def IsDone(self):
+    return self.total_tasks is not None and self.num_done == self.total_tasks
+
+
+class _TaskStatusReporter(object):
+  """
+  Accumulates the status of the tasks performed by the threads in this
+  process, and sends it to the _TaskStatusAggregator in batches. This keeps
+  the manager out of the path of every task: each batch is a single write to
+  task_status_queue, no matter how many tasks and shared variables it covers.
+
+  Each batch is a list of tuples of the form
+  (caller_id, total_tasks, num_done, return_values, shared_var_deltas), where
+  total_tasks is None unless it is being reported by the ProducerThread.
+  """
+  def __init__(self):
+    self.pid = os.getpid()
+    self.lock = threading.Lock()
+    # Map from caller_id to [num_done, return_values, shared_var_deltas].
+    self.pending = {}
+    self.num_pending = 0
+    self.last_flush_time = time.time()
+    self.flush_needed = threading.Event()
+    flush_thread = threading.Thread(target=self._PeriodicallyFlush)
+    flush_thread.daemon = True
+    flush_thread.start()
+
+  def GetSharedAttrs(self, caller_id):
+    return _GetCallerInfo(caller_id).shared_attrs
+
+  def _GetPendingStatus(self, caller_id):
+    status = self.pending.get(caller_id, None)
+    if status is None:
+      status = [0, [], {}]
+      self.pending[caller_id] = status
+    return status
+
+  def ReportTaskDone(self, caller_id, return_values, shared_var_deltas):
+    """Records that a task for caller_id is finished."""
+    with self.lock:
+      status = self._GetPendingStatus(caller_id)
+      status[0] += 1
+      if return_values:
+        status[1].extend(return_values)
+      self._AddSharedVarDeltas(status, shared_var_deltas)
+      self.num_pending += 1
+      if (self.num_pending >= TASK_STATUS_BATCH_SIZE or
+          time.time() - self.last_flush_time >= TASK_STATUS_FLUSH_INTERVAL):
+        self._FlushLocked()
+      else:
+        self.flush_needed.set()
+
+  def ReportSharedVarDeltas(self, caller_id, shared_var_deltas):
+    """Records shared variable deltas that don't belong to a finished task."""
+    if shared_var_deltas:
+      with self.lock:
+        self._AddSharedVarDeltas(self._GetPendingStatus(caller_id),
+                                 shared_var_deltas)
+        self.flush_needed.set()
+
+  def ReportTotalTasks(self, caller_id, total_tasks):
+    """Sends the number of tasks for caller_id, along with anything pending."""
+    with self.lock:
+      batch = self._TakePendingBatch()
+      batch.append((caller_id, total_tasks, 0, None, None))
+      task_status_queue.put(batch)
+
+  def Flush(self):
+    """Sends the status of all tasks that haven't been reported yet."""
+    with self.lock:
+      self._FlushLocked()
+
+  def _AddSharedVarDeltas(self, status, shared_var_deltas):
+    if shared_var_deltas:
+      for (name, delta) in shared_var_deltas.iteritems():
+        status[2][name] = status[2].get(name, 0) + delta
+
+  def _TakePendingBatch(self):
+    batch = [(caller_id, None, num_done, return_values, shared_var_deltas)
+             for (caller_id, (num_done, return_values, shared_var_deltas))
+             in self.pending.iteritems()]
+    self.pending = {}
+    self.num_pending = 0
+    self.last_flush_time = time.time()
+    self.flush_needed.clear()
+    return batch
+
+  def _FlushLocked(self):
+    if self.pending:
+      task_status_queue.put(self._TakePendingBatch())
+
+  def _PeriodicallyFlush(self):
+    """
+    Makes sure that nothing stays pending for long, even if every thread in
+    this process is busy with a long-running task.
+    """
+    while True:
+      self.flush_needed.wait()
+      time.sleep(TASK_STATUS_FLUSH_INTERVAL)
+      self.Flush()
+
+
+def _GetTaskStatusReporter():
+  """Returns the _TaskStatusReporter for the current process."""
+  global task_status_reporter
+  reporter = task_status_reporter
+  # A reporter inherited from the parent process must not be used, since its
+  # lock and flush thread belong to the parent.
+  if reporter is None or reporter.pid != os.getpid():
+    with task_status_reporter_lock:
+      if (task_status_reporter is None or
+          task_status_reporter.pid != os.getpid()):
+        task_status_reporter = _TaskStatusReporter()
+      reporter = task_status_reporter
+  return reporter
+
+
+class _TaskStatusAggregator(threading.Thread):
+  """
+  Thread in the main process that receives the batches sent by each
+  _TaskStatusReporter and keeps track of the progress of each call to Apply.
+  When all of the tasks for a call are finished, it stores the results and
+  shared variable values for the call where the caller can find them, and
+  notifies the caller. These are the only times that task status touches the
+  manager.
+  """
+  def __init__(self, queue):
+    super(_TaskStatusAggregator, self).__init__()
+    self.daemon = True
+    # Keep our own reference to the queue rather than reading the module-level
+    # task_status_queue, which is reset if the multiprocessing variables are
+    # reinitialized while we're running.
+    self.queue = queue
+    # Map from caller_id to [total_tasks, num_done, return_values,
+    # shared_var_deltas], where total_tasks is -1 until the producer is done.
+    self.call_status = {}
+
+  def run(self):
+    while True:
+      try:
+        batch = self.queue.get()
+      except (EOFError, IOError):
+        # The queue was closed because we're exiting.
+        return
+      for (caller_id, total_tasks, num_done, return_values,
+           shared_var_deltas) in batch:
+        status = self.call_status.get(caller_id, None)
+        if status is None:
+          status = [-1, 0, [], {}]
+          self.call_status[caller_id] = status
+        if total_tasks is not None:
+          status[0] = total_tasks
+        status[1] += num_done
+        if return_values:
+          status[2].extend(return_values)
+        if shared_var_deltas:
+          for (name, delta) in shared_var_deltas.iteritems():
+            status[3][name] = status[3].get(name, 0) + delta
+        if status[0] >= 0 and status[0] == status[1]:
+          del self.call_status[caller_id]
+          try:
+            _NotifyDone(caller_id, status[2], status[3])
+          except Exception, e:
+            logging.getLogger().debug(
+                'Caught exception while notifying caller %d:\n%s',
+                caller_id, traceback.format_exc())
+
+
+def _StartTaskStatusAggregatorIfNeeded():
+  """
+  Starts the _TaskStatusAggregator if it isn't running yet. Consumer processes
+  inherit the aggregator, so this only ever starts it in the main process.
+  """
+  global task_status_aggregator, task_status_queue
+  if task_status_aggregator is None:
+    with task_status_reporter_lock:
+      if task_status_aggregator is None:
+        task_status_queue = _NewMultiprocessingQueue()
+        task_status_aggregator = _TaskStatusAggregator(task_status_queue)
+        task_status_aggregator.start()
+  # Make sure this process has its reporter before any processes are forked.
+  _GetTaskStatusReporter()
+
+
+def _NotifyDone(caller_id, return_values, shared_var_values):
+  """
+  Stores the results of a finished call to Apply, and notifies any threads
+  that are waiting for results that something has finished. Each waiting
+  thread will then need to check the call_completed_map to see if its work is
+  done.
+
   Args:
-    caller_id: The caller_id of the function whose progress we're checking.
-    num_done: The number of tasks currently completed for that caller_id.
+    caller_id: The caller_id of the call that finished.
+    return_values: The list of values returned by the call's tasks.
+    shared_var_values: Dict from shared variable name to the total delta
+                       applied by the call's tasks.
   """
-  num_to_do = total_tasks[caller_id]
-  if num_to_do == num_done and num_to_do >= 0:
-    # Notify the Apply call that's sleeping that it's ready to return.
-    with need_pool_or_done_cond:
-      call_completed_map[caller_id] = True
-      need_pool_or_done_cond.notify_all()
+  if return_values:
+    global_return_values_map.put(caller_id, return_values)
+  for (name, value) in shared_var_values.iteritems():
+    shared_vars_map.put((caller_id, name), value)
+  # Notify the Apply call that's sleeping that it's ready to return.
+  with call_done_cond:
+    call_completed_map[caller_id] = True
+    call_done_cond.notify_all()
 
 def ShutDownGsutil():
   """Shut down all processes in consumer pools in preparation for exiting."""
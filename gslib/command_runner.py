@@ -31,6 +31,7 @@ import gslib.commands
 from gslib.command import Command
 from gslib.command import COMMAND_NAME
 from gslib.command import COMMAND_NAME_ALIASES
+from gslib.command import GetCommandClasses
 from gslib.command import OLD_ALIAS_MAP
 from gslib.command import ShutDownGsutil
 from gslib.exception import CommandException
@@ -113,7 +114,7 @@ class CommandRunner(object):
 
     command_map = {}
     # Only include Command subclasses in the dict.
-    for command in Command.__subclasses__():
+    for command in GetCommandClasses():
       command_map[command.command_spec[COMMAND_NAME]] = command
       for command_name_aliases in command.command_spec[COMMAND_NAME_ALIASES]:
         command_map[command_name_aliases] = command
@@ -13,6 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import boto
+import collections
+import itertools
 import re
 import sys
 
@@ -25,6 +28,9 @@ from gslib.command import MIN_ARGS
 from gslib.command import PROVIDER_URIS_OK
 from gslib.command import SUPPORTED_SUB_ARGS
 from gslib.command import URIS_START_ARG
+from gslib.commands.config import DEFAULT_PARALLEL_THREAD_COUNT
+from gslib.daisy_chain_wrapper import DAISY_CHAIN_CHUNK_SIZE
+from gslib.daisy_chain_wrapper import ReadAheadStream
 from gslib.exception import CommandException
 from gslib.help_provider import HELP_NAME
 from gslib.help_provider import HELP_NAME_ALIASES
@@ -32,9 +38,14 @@ from gslib.help_provider import HELP_ONE_LINE_SUMMARY
 from gslib.help_provider import HELP_TEXT
 from gslib.help_provider import HelpType
 from gslib.help_provider import HELP_TYPE
+from gslib.transfer_buffer import GetTransferBufferSize
 from gslib.util import NO_MAX
 from gslib.wildcard_iterator import ContainsWildcard
 
+# Number of DAISY_CHAIN_CHUNK_SIZE chunks of each object that are downloaded
+# ahead of the output.
+CAT_BUFFERED_CHUNKS = 4
+
 _detailed_help_text = ("""
 <B>SYNOPSIS</B>
   gsutil cat [-h] uri...
@@ -76,7 +87,22 @@ _detailed_help_text = ("""
                 gsutil cat -r -5 gs://bucket/object
 
               returns the final 5 bytes of the object.
-""")
+
+
+<B>PARALLEL READ-AHEAD</B>
+  If you use the gsutil -m option, cat downloads the objects that follow the
+  one being output in parallel with it, so that concatenating many small
+  objects isn't limited by the latency of each request:
+
+    gsutil -m cat gs://bucket/logs/2013-10-15/* | parser
+
+  The objects are still output whole and in order. The number of objects
+  downloaded at once is set by the parallel_thread_count value in the boto
+  configuration file. Each object can buffer up to %d MB ahead of the output,
+  so reading ahead of large objects needs that much memory per object.
+  Without -m, each object is downloaded in parallel with the output of the
+  data already received, but objects are downloaded one at a time.
+""" % (CAT_BUFFERED_CHUNKS * DAISY_CHAIN_CHUNK_SIZE / (1024 * 1024)))
 
 
 class CatCommand(Command):
@@ -114,14 +140,65 @@ class CatCommand(Command):
     HELP_TEXT : _detailed_help_text,
   }
 
-  def _UriIterator(self, uri_str):
-    # Generator that returns URI(s) for uri_str. If uri_str is a wildcard we
-    # iterate over matches, else we return a single URI.
+  def _KeyIterator(self, uri_str):
+    """
+    Generator that returns (uri, key) for each object named by uri_str. The
+    keys of objects matching a wildcard come from the bucket listing, so they
+    don't need a HEAD request each.
+    """
     if not ContainsWildcard(uri_str):
-      yield self.suri_builder.StorageUri(uri_str)
+      yield (self.suri_builder.StorageUri(uri_str), None)
     else:
-      for uri in self.WildcardIterator(uri_str).IterUris():
-        yield uri
+      for blr in self.WildcardIterator(uri_str):
+        yield (blr.GetUri(), blr.GetKey() if blr.HasKey() else None)
+
+  def _OpenObject(self, uri, key, request_range):
+    """
+    Returns a ReadAheadStream over the object (or the request_range of it)
+    that has started downloading.
+
+    The whole response is output, rather than the number of bytes implied by
+    the object's size, since the service decompresses gzip-encoded objects
+    (and ignores the range) when the request doesn't accept gzip encoding.
+    """
+    if key is None:
+      key = uri.get_key(False, self.headers)
+      if not key:
+        raise CommandException('"%s" does not exist.' % uri)
+    headers = self.headers.copy() if self.headers else {}
+    if request_range:
+      headers['range'] = 'bytes=%s' % str(request_range)
+    fp = ReadAheadStream(key, headers, CAT_BUFFERED_CHUNKS)
+    fp.StartDownload()
+    return fp
+
+  def _OutputObject(self, pending_object, cat_outfd, show_header, printed_one,
+                    buffer_size):
+    """
+    Writes the contents of an object opened by _OpenObject, and closes it.
+
+    Args:
+      pending_object: (uri, file) tuple for the object.
+      cat_outfd: The file to write the contents to.
+      show_header: Whether to print a header with the object name.
+      printed_one: Whether an object was output before this one.
+      buffer_size: Size of the chunks in which the contents are written.
+    """
+    (uri, fp) = pending_object
+    if show_header:
+      if printed_one:
+        print
+      print '==> %s <==' % uri.__str__()
+    if isinstance(fp, Exception):
+      raise fp
+    try:
+      while True:
+        data = fp.read(buffer_size)
+        if not data:
+          break
+        cat_outfd.write(data)
+    finally:
+      fp.close()
 
   # Command entry point.
   def RunCommand(self):
@@ -140,30 +217,49 @@ class CatCommand(Command):
                            ' needed, and will eventually be removed.\n'
                            % self.command_name)
 
-    printed_one = False
+    # With -m, this many objects are downloaded at once, ahead of the one
+    # being output.
+    read_ahead_count = 1
+    if self.parallel_operations:
+      read_ahead_count = max(1, boto.config.getint(
+          'GSUtil', 'parallel_thread_count', DEFAULT_PARALLEL_THREAD_COUNT))
+    buffer_size = GetTransferBufferSize()
+
     # We manipulate the stdout so that all other data other than the Object
     # contents go to stderr.
     cat_outfd = sys.stdout
     sys.stdout = sys.stderr
     did_some_work = False
-
-    for uri_str in self.args:
-      for uri in self._UriIterator(uri_str):
-        if not uri.names_object():
-          raise CommandException('"%s" command must specify objects.' %
-                                 self.command_name)
+    printed_one = False
+    # (uri, file) for the objects being downloaded, in output order. If an
+    # object can't be opened, its file is the exception, which is raised once
+    # the objects before it have been output.
+    pending = collections.deque()
+    try:
+      for (uri, key) in itertools.chain(*[self._KeyIterator(uri_str)
+                                          for uri_str in self.args]):
         did_some_work = True
-        if show_header:
-          if printed_one:
-            print
-          print '==> %s <==' % uri.__str__()
+        if len(pending) == read_ahead_count:
+          self._OutputObject(pending.popleft(), cat_outfd, show_header,
+                             printed_one, buffer_size)
           printed_one = True
-        key = uri.get_key(False, self.headers)
-        headers = self.headers.copy()
-        if request_range:
-          headers['range'] = 'bytes=%s' % str(request_range)
-        key.get_file(cat_outfd, headers)
-    sys.stdout = cat_outfd
+        try:
+          if not uri.names_object():
+            raise CommandException('"%s" command must specify objects.' %
+                                   self.command_name)
+          pending.append((uri, self._OpenObject(uri, key, request_range)))
+        except Exception, e:
+          pending.append((uri, e))
+          break
+      while pending:
+        self._OutputObject(pending.popleft(), cat_outfd, show_header,
+                           printed_one, buffer_size)
+        printed_one = True
+    finally:
+      for (unused_uri, fp) in pending:
+        if not isinstance(fp, Exception):
+          fp.close()
+      sys.stdout = cat_outfd
     if not did_some_work:
       raise CommandException('No URIs matched')
 
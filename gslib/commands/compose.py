@@ -12,9 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import random
+
+try:
+  from hashlib import md5
+except ImportError:
+  from md5 import md5
+
+from collections import namedtuple
 from gslib.command import Command
 from gslib.command import COMMAND_NAME
 from gslib.command import COMMAND_NAME_ALIASES
+from gslib.command import DummyArgChecker
 from gslib.command import FILE_URIS_OK
 from gslib.command import MAX_ARGS
 from gslib.command import MIN_ARGS
@@ -34,6 +43,26 @@ from boto import storage_uri_for_key
 MAX_COMPONENT_COUNT = 1024
 MAX_COMPOSE_ARITY = 32
 
+# Intermediate objects created while composing more than MAX_COMPOSE_ARITY
+# components are named <random ID><namespace><hash>_<level>_<index>.
+COMPOSE_TEMP_NAMESPACE = (
+    u'/gsutil/tmp/compose_intermediates/for_details_see/gsutil_help_compose/')
+
+# Headers that apply only to the final composite object. Preconditions would
+# fail on the intermediate objects (which don't exist beforehand), and their
+# metadata and ACLs don't matter, since they're deleted.
+INTERMEDIATE_COMPOSE_EXCLUDED_HEADERS = (
+    'cache-control', 'content-disposition', 'content-encoding',
+    'content-language', 'content-md5', 'content-type', 'x-goog-acl')
+INTERMEDIATE_COMPOSE_EXCLUDED_HEADER_PREFIXES = (
+    'if-', 'x-goog-if-', 'x-goog-meta-')
+
+# This tuple is used only to encapsulate the arguments needed for
+# _ComposeIntermediateFn, so that the arguments fit the model of
+# command.Apply().
+ComposeIntermediateArgs = namedtuple(
+    'ComposeIntermediateArgs', 'index dst_uri components headers')
+
 _detailed_help_text = ("""
 <B>SYNOPSIS</B>
   gsutil compose gs://bucket/obj1 gs://bucket/obj2 ... gs://bucket/composite
@@ -78,7 +107,132 @@ _detailed_help_text = ("""
   Note that there is a limit (currently %d) to the number of components for a
   given composite object. This means you can append to each object at most %d
   times.
-""" % (MAX_COMPONENT_COUNT, MAX_COMPONENT_COUNT - 1))
+
+  The service composes at most %d objects in a single request. If you specify
+  more component objects than that, gsutil composes them in groups of %d into
+  temporary intermediate objects (in parallel if you use the gsutil -m
+  option), composes those into the final object, and then deletes the
+  intermediate objects. The temporary objects are named in the following
+  fashion:
+  <random ID>%s<hash>_<level>_<index>
+""" % (MAX_COMPONENT_COUNT, MAX_COMPONENT_COUNT - 1, MAX_COMPOSE_ARITY,
+       MAX_COMPOSE_ARITY, COMPOSE_TEMP_NAMESPACE))
+
+
+def _ComposeIntermediateFn(cls, args):
+  """Composes one group of components into an intermediate object. Designed
+     for use with command.Apply().
+
+  Returns:
+    (index, version-specific StorageUri of the intermediate object).
+  """
+  result_uri = args.dst_uri.compose(args.components, headers=args.headers)
+  return (args.index, result_uri)
+
+
+def _DeleteIntermediateFn(cls, suri):
+  """Wrapper function to be used with command.Apply()."""
+  return suri.delete_key()
+
+
+def _ComposeExceptionHandler(cls, e):
+  """Simple exception handler to allow post-completion status."""
+  cls.logger.error(str(e))
+
+
+def _GetIntermediateComposeHeaders(headers):
+  """Returns the subset of headers to send when composing an intermediate
+     object, leaving out the ones meant for the final composite object.
+  """
+  intermediate_headers = {}
+  for (name, value) in (headers or {}).iteritems():
+    lower_name = name.lower()
+    if (lower_name in INTERMEDIATE_COMPOSE_EXCLUDED_HEADERS or
+        lower_name.startswith(INTERMEDIATE_COMPOSE_EXCLUDED_HEADER_PREFIXES)):
+      continue
+    intermediate_headers[name] = value
+  return intermediate_headers
+
+
+def ComposeHierarchically(cls, dst_uri, components, headers=None,
+                          parallel_operations_override=False):
+  """Composes any number of components (up to MAX_COMPONENT_COUNT) into
+     dst_uri.
+
+  At most MAX_COMPOSE_ARITY components can be composed by a single request,
+  so larger lists are composed into intermediate objects, MAX_COMPOSE_ARITY
+  at a time, level by level, until few enough objects remain to compose into
+  dst_uri. The composes within each level are performed with cls.Apply(), and
+  the intermediate objects are deleted once the final compose is done.
+
+  Args:
+    cls: The Command instance to use for Apply() calls.
+    dst_uri: The StorageUri of the object to create.
+    components: The ordered list of StorageUris to compose.
+    headers: The headers to pass to boto for the final compose request.
+             Preconditions and metadata are left out of the requests that
+             compose intermediate objects.
+    parallel_operations_override: Passed along to cls.Apply().
+
+  Returns:
+    The result of the final dst_uri.compose() call.
+
+  Raises:
+    CommandException: if any of the intermediate composes failed.
+  """
+  if len(components) <= MAX_COMPOSE_ARITY:
+    return dst_uri.compose(components, headers=headers)
+
+  # Use a deterministic hash of the destination name plus a random prefix so
+  # that concurrent composes into the same bucket can't collide.
+  random_prefix = str(random.randint(1, (10 ** 10) - 1))
+  digest = md5(dst_uri.object_name.encode('utf-8')).hexdigest()
+  intermediate_headers = _GetIntermediateComposeHeaders(headers)
+  intermediates = []
+  level = 0
+  try:
+    while len(components) > MAX_COMPOSE_ARITY:
+      compose_args = []
+      next_components = [None] * (
+          (len(components) + MAX_COMPOSE_ARITY - 1) // MAX_COMPOSE_ARITY)
+      for index in range(len(next_components)):
+        group = components[index * MAX_COMPOSE_ARITY:
+                           (index + 1) * MAX_COMPOSE_ARITY]
+        if len(group) == 1:
+          # Nothing to compose; carry the component up to the next level.
+          next_components[index] = group[0]
+          continue
+        tmp_name = '%s%s%s_%d_%d' % (random_prefix, COMPOSE_TEMP_NAMESPACE,
+                                     digest, level, index)
+        compose_args.append(ComposeIntermediateArgs(
+            index, dst_uri.clone_replace_name(tmp_name), group,
+            intermediate_headers))
+      results = cls.Apply(_ComposeIntermediateFn, compose_args,
+                          _ComposeExceptionHandler,
+                          arg_checker=DummyArgChecker,
+                          parallel_operations_override=(
+                              parallel_operations_override),
+                          should_return_results=True)
+      for (index, result_uri) in results:
+        next_components[index] = result_uri
+        intermediates.append(result_uri)
+      if len(results) != len(compose_args):
+        raise CommandException(
+            'Some intermediate objects for %s could not be composed.' %
+            dst_uri)
+      components = next_components
+      level += 1
+    return dst_uri.compose(components, headers=headers)
+  finally:
+    if intermediates:
+      try:
+        cls.Apply(_DeleteIntermediateFn, intermediates,
+                  _ComposeExceptionHandler, arg_checker=DummyArgChecker,
+                  parallel_operations_override=parallel_operations_override)
+      except Exception, e:
+        cls.logger.warning(
+            'Failed to delete some of the following temporary objects:\n' +
+            '\n'.join([str(suri) for suri in intermediates]))
 
 class ComposeCommand(Command):
   """Implementation of gsutil compose command."""
@@ -92,7 +246,7 @@ class ComposeCommand(Command):
     # Min number of args required by this command.
     MIN_ARGS : 2,
     # Max number of args required by this command, or NO_MAX.
-    MAX_ARGS : MAX_COMPOSE_ARITY + 1,
+    MAX_ARGS : MAX_COMPONENT_COUNT + 1,
     # Getopt-style string specifying acceptable sub args.
     SUPPORTED_SUB_ARGS : '',
     # True if file URIs acceptable for this command.
@@ -143,13 +297,13 @@ class ComposeCommand(Command):
       components.append(suri)
       # Avoid expanding too many components, and sanity check each name
       # expansion result.
-      if len(components) > MAX_COMPOSE_ARITY:
+      if len(components) > MAX_COMPONENT_COUNT:
         raise CommandException('"compose" called with too many component '
-                               'objects. Limit is %d.' % MAX_COMPOSE_ARITY)
+                               'objects. Limit is %d.' % MAX_COMPONENT_COUNT)
     if len(components) < 2:
       raise CommandException('"compose" requires at least 2 component objects.')
 
     self.logger.info(
         'Composing %s from %d component objects.' %
         (target_suri, len(components)))
-    target_suri.compose(components, headers=self.headers)
+    ComposeHierarchically(self, target_suri, components, headers=self.headers)
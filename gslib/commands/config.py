@@ -178,12 +178,25 @@ _detailed_help_text = ("""
     [GSUtil]
       resumable_threshold
       resumable_tracker_dir
+      local_database_dir
       software_update_check_period
       parallel_process_count
       parallel_thread_count
+      adaptive_parallel_thread_count
+      min_parallel_thread_count
+      max_parallel_thread_count
+      parallel_task_order
+      parallel_task_order_window
       parallel_composite_upload_threshold
       parallel_composite_upload_component_size
+      sliced_object_download_threshold
+      sliced_object_download_component_size
+      sliced_object_download_max_components
       use_magicfile
+      use_local_hash_cache
+      local_hash_cache_max_entries
+      transfer_buffer_size
+      local_walk_thread_count
       content_language
       check_hashes
       default_api_version
@@ -280,9 +293,26 @@ else:
   DEFAULT_PARALLEL_PROCESS_COUNT = 1
   DEFAULT_PARALLEL_THREAD_COUNT = 24
 
+# Default bounds on the number of Python threads per process when the number
+# of threads is adjusted automatically (see adaptive_parallel_thread_count).
+DEFAULT_MIN_PARALLEL_THREAD_COUNT = 1
+DEFAULT_MAX_PARALLEL_THREAD_COUNT = 4 * DEFAULT_PARALLEL_THREAD_COUNT
+
+DEFAULT_PARALLEL_TASK_ORDER_WINDOW = 1000
+
 DEFAULT_PARALLEL_COMPOSITE_UPLOAD_THRESHOLD = '150M'
 DEFAULT_PARALLEL_COMPOSITE_UPLOAD_COMPONENT_SIZE = '50M'
 
+DEFAULT_SLICED_OBJECT_DOWNLOAD_THRESHOLD = '150M'
+DEFAULT_SLICED_OBJECT_DOWNLOAD_COMPONENT_SIZE = '200M'
+DEFAULT_SLICED_OBJECT_DOWNLOAD_MAX_COMPONENTS = 4
+
+DEFAULT_LOCAL_HASH_CACHE_MAX_ENTRIES = 1000000
+
+DEFAULT_TRANSFER_BUFFER_SIZE = '1M'
+
+DEFAULT_LOCAL_WALK_THREAD_COUNT = 8
+
 CONFIG_BOTO_SECTION_CONTENT = """
 [Boto]
 
@@ -337,7 +367,9 @@ CONFIG_INPUTLESS_GSUTIL_SECTION_CONTENT = """
 #resumable_threshold = %(resumable_threshold)d
 
 # 'resumable_tracker_dir' specifies the base location where resumable
-# transfer tracker files are saved. By default they're in ~/.gsutil
+# transfer trackers are saved (in a database called trackers.sqlite, or in
+# one file per tracker if sqlite isn't available). Trackers that haven't been
+# updated for 30 days are deleted. By default they're in ~/.gsutil
 #resumable_tracker_dir = <file path>
 # gsutil also saves a file called .last_software_update_check in this directory,
 # that tracks the last time a check was made whether a new version of the gsutil
@@ -346,6 +378,17 @@ CONFIG_INPUTLESS_GSUTIL_SECTION_CONTENT = """
 # periodic software update checks.
 #software_update_check_period = 30
 
+# sqlite databases can be corrupted when several processes use them over a
+# network file system such as NFS. So if resumable_tracker_dir is on one,
+# gsutil keeps its databases (the tracker database, the local hash cache and
+# cp -L manifest indexes) on local disk instead, in a subdirectory of
+# 'local_database_dir' for each remote tracker directory. By default that's
+# a directory only readable by you under /var/tmp (or the system's temporary
+# directory if there's no /var/tmp). If it can't be used, trackers are kept
+# in one file each in resumable_tracker_dir, the local hash cache isn't used,
+# and manifest indexes are kept in memory.
+#local_database_dir = <file path>
+
 # 'parallel_process_count' and 'parallel_thread_count' specify the number
 # of OS processes and Python threads, respectively, to use when executing
 # operations in parallel. The default settings should work well as configured,
@@ -358,6 +401,30 @@ CONFIG_INPUTLESS_GSUTIL_SECTION_CONTENT = """
 #parallel_process_count = %(parallel_process_count)d
 #parallel_thread_count = %(parallel_thread_count)d
 
+# If 'adaptive_parallel_thread_count' is set to True, then rather than always
+# using 'parallel_thread_count' threads per process, gsutil starts with that
+# many and adjusts the number as operations run: it keeps adding threads as
+# long as doing so doesn't reduce throughput or cause the service to report
+# that it's overloaded (e.g., with 503 errors), and it quickly backs off when
+# either happens. 'min_parallel_thread_count' and 'max_parallel_thread_count'
+# bound the number of threads per process. Run gsutil with the -D option to
+# see the adjustments that are made.
+#adaptive_parallel_thread_count = False
+#min_parallel_thread_count = %(min_parallel_thread_count)d
+#max_parallel_thread_count = %(max_parallel_thread_count)d
+
+# 'parallel_task_order' specifies the order in which parallel operations (-m)
+# are started. 'fifo' starts them in the order in which the names are listed.
+# 'largest_first' starts the largest objects or files first, so that a large
+# one doesn't start after all the others have finished and leave the
+# remaining threads idle. 'shuffle' starts them in an order that spreads
+# uploads across the key range, rather than concentrating them on adjacent
+# names. Operations are only reordered within a window of
+# 'parallel_task_order_window' names, so that gsutil doesn't have to list
+# every name before it starts.
+#parallel_task_order = fifo
+#parallel_task_order_window = %(parallel_task_order_window)d
+
 # 'parallel_composite_upload_threshold' specifies the maximum size of a file to
 # upload in a single stream. Files larger than this threshold will be
 # partitioned into component parts and uploaded in parallel and then composed
@@ -377,6 +444,21 @@ CONFIG_INPUTLESS_GSUTIL_SECTION_CONTENT = """
 #parallel_composite_upload_threshold = %(parallel_composite_upload_threshold)s
 #parallel_composite_upload_component_size = %(parallel_composite_upload_component_size)s
 
+# 'sliced_object_download_threshold' specifies the maximum size of an object to
+# download in a single stream. Objects larger than this threshold will be
+# downloaded in parallel byte ranges ("slices"), each written directly into
+# its own part of the destination file.
+# The number of slices will be the smaller of
+# ceil(object_size / sliced_object_download_component_size) and
+# 'sliced_object_download_max_components'.
+# If 'sliced_object_download_threshold' is set to 0, then sliced object
+# downloads will never occur.
+# Values can be provided either in bytes or as human-readable values
+# (e.g., "150M" to represent 150 megabytes)
+#sliced_object_download_threshold = %(sliced_object_download_threshold)s
+#sliced_object_download_component_size = %(sliced_object_download_component_size)s
+#sliced_object_download_max_components = %(sliced_object_download_max_components)d
+
 # 'use_magicfile' specifies if the 'file --mime-type <filename>' command should
 # be used to guess content types instead of the default filename extension-based
 # mechanism. Available on UNIX and MacOS (and possibly on Windows, if you're
@@ -385,6 +467,29 @@ CONFIG_INPUTLESS_GSUTIL_SECTION_CONTENT = """
 # robust because it analyzes file contents in addition to extensions.
 #use_magicfile = False
 
+# 'use_local_hash_cache' specifies whether the MD5 and CRC32C hashes of local
+# files should be kept in a cache in the resumable_tracker_dir (or in the
+# local_database_dir, if that's on a network file system), so that files that
+# haven't changed (according to their size and modification time) aren't read
+# again to compute their hashes when they're uploaded or compared with
+# objects. 'local_hash_cache_max_entries' bounds the size of the cache; the
+# least recently used entries are evicted when it's reached.
+#use_local_hash_cache = False
+#local_hash_cache_max_entries = %(local_hash_cache_max_entries)d
+
+# 'transfer_buffer_size' specifies the size of the chunks in which data are
+# read from and written to local files and the network during transfers, and
+# of the reusable buffers used to read local files. Larger buffers reduce the
+# CPU used per byte transferred, at the cost of memory per concurrent transfer.
+#transfer_buffer_size = %(transfer_buffer_size)s
+
+# 'local_walk_thread_count' specifies the number of threads used to list local
+# directories when expanding recursive ('**') wildcards and directories to
+# copy, so that listing large trees on network file systems isn't limited by
+# the latency of each directory read. Setting it to 0 lists directories in
+# the thread that's expanding the names.
+#local_walk_thread_count = %(local_walk_thread_count)d
+
 # 'content_language' specifies the ISO 639-1 language code of the content, to be
 # passed in the Content-Language header. By default no Content-Language is sent.
 # See the ISO 639-1 column of
@@ -419,10 +524,22 @@ content_language = en
 """ % {'resumable_threshold': TWO_MB,
        'parallel_process_count': DEFAULT_PARALLEL_PROCESS_COUNT,
        'parallel_thread_count': DEFAULT_PARALLEL_THREAD_COUNT,
+       'min_parallel_thread_count': DEFAULT_MIN_PARALLEL_THREAD_COUNT,
+       'max_parallel_thread_count': DEFAULT_MAX_PARALLEL_THREAD_COUNT,
+       'parallel_task_order_window': DEFAULT_PARALLEL_TASK_ORDER_WINDOW,
        'parallel_composite_upload_threshold': (
           DEFAULT_PARALLEL_COMPOSITE_UPLOAD_THRESHOLD),
        'parallel_composite_upload_component_size': (
           DEFAULT_PARALLEL_COMPOSITE_UPLOAD_COMPONENT_SIZE),
+       'sliced_object_download_threshold': (
+          DEFAULT_SLICED_OBJECT_DOWNLOAD_THRESHOLD),
+       'sliced_object_download_component_size': (
+          DEFAULT_SLICED_OBJECT_DOWNLOAD_COMPONENT_SIZE),
+       'sliced_object_download_max_components': (
+          DEFAULT_SLICED_OBJECT_DOWNLOAD_MAX_COMPONENTS),
+       'local_hash_cache_max_entries': DEFAULT_LOCAL_HASH_CACHE_MAX_ENTRIES,
+       'transfer_buffer_size': DEFAULT_TRANSFER_BUFFER_SIZE,
+       'local_walk_thread_count': DEFAULT_LOCAL_WALK_THREAD_COUNT,
        'max_component_count': MAX_COMPONENT_COUNT}
 
 CONFIG_OAUTH2_CONFIG_CONTENT = """
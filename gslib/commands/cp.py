@@ -16,6 +16,7 @@
 # Get the system logging module, not our local logging module.
 from __future__ import absolute_import
 
+import base64
 import binascii
 import boto
 import copy
@@ -27,15 +28,14 @@ import gslib
 import gzip
 import hashlib
 import logging
-import mimetypes
 import mmap
-import multiprocessing
 import os
 import platform
 import random
 import re
+import shutil
 import stat
-import subprocess
+import StringIO
 import sys
 import tempfile
 import textwrap
@@ -50,14 +50,17 @@ try:
 except ImportError:
   from md5 import md5
 
+try:
+  import sqlite3
+except ImportError:
+  sqlite3 = None
+
 from boto import config
 from boto.exception import GSResponseError
 from boto.exception import ResumableUploadException
-from boto.gs.resumable_upload_handler import ResumableUploadHandler
-from boto.s3.keyfile import KeyFile
-from boto.s3.resumable_download_handler import ResumableDownloadHandler
 from boto.storage_uri import BucketStorageUri
 from boto.storage_uri import StorageUri
+from collections import deque
 from collections import namedtuple
 from gslib.bucket_listing_ref import BucketListingRef
 from gslib.command import COMMAND_NAME
@@ -69,26 +72,48 @@ from gslib.command import MIN_ARGS
 from gslib.command import PROVIDER_URIS_OK
 from gslib.command import SUPPORTED_SUB_ARGS
 from gslib.command import URIS_START_ARG
+from gslib.commands.compose import ComposeHierarchically
 from gslib.commands.compose import MAX_COMPONENT_COUNT
-from gslib.commands.compose import MAX_COMPOSE_ARITY
 from gslib.commands.config import DEFAULT_PARALLEL_COMPOSITE_UPLOAD_COMPONENT_SIZE
 from gslib.commands.config import DEFAULT_PARALLEL_COMPOSITE_UPLOAD_THRESHOLD
+from gslib.commands.config import DEFAULT_SLICED_OBJECT_DOWNLOAD_COMPONENT_SIZE
+from gslib.commands.config import DEFAULT_SLICED_OBJECT_DOWNLOAD_MAX_COMPONENTS
+from gslib.commands.config import DEFAULT_SLICED_OBJECT_DOWNLOAD_THRESHOLD
+from gslib.content_type_detector import GetContentTypeDetector
+from gslib.daisy_chain_wrapper import DAISY_CHAIN_CHUNK_SIZE
+from gslib.daisy_chain_wrapper import DaisyChainWrapper
 from gslib.exception import CommandException
 from gslib.file_part import FilePart
+from gslib.file_part import OpenFilePart
+from gslib.gzip_stream import GzipCompressingReader
+from gslib.gzip_stream import GzipDecompressingWriter
+from gslib.hashing_helper import HASHING_THREAD_THRESHOLD
+from gslib.hashing_helper import HashingFileUploadWrapper
 from gslib.help_provider import HELP_NAME
 from gslib.help_provider import HELP_NAME_ALIASES
 from gslib.help_provider import HELP_ONE_LINE_SUMMARY
 from gslib.help_provider import HELP_TEXT
 from gslib.help_provider import HelpType
 from gslib.help_provider import HELP_TYPE
+from gslib.local_hash_cache import GetFileHashes
+from gslib.local_hash_cache import GetLocalHashCache
+from gslib.local_hash_cache import GetStatKey
+from gslib.local_hash_cache import RecordFileHashes
 from gslib.name_expansion import NameExpansionIterator
+from gslib.tracker_store import GetTrackerStore
+from gslib.tracker_store import TrackerStoreResumableDownloadHandler
+from gslib.tracker_store import TrackerStoreResumableUploadHandler
+from gslib.transfer_buffer import ConfigureBotoBufferSizes
+from gslib.transfer_buffer import GetTransferBufferSize
+from gslib.transfer_buffer import ReadChunks
 from gslib.util import BOTO_IS_SECURE
 from gslib.util import CreateLock
-from gslib.util import CreateTrackerDirIfNeeded
 from gslib.util import GetConfigFilePath
+from gslib.util import GetSqliteDatabaseDir
 from gslib.util import ParseErrorDetail
 from gslib.util import HumanReadableToBytes
 from gslib.util import IS_WINDOWS
+from gslib.util import KeyMethodAcceptsHashAlgs
 from gslib.util import MakeHumanReadable
 from gslib.util import NO_MAX
 from gslib.util import TWO_MB
@@ -156,6 +181,14 @@ hash the original name.
 # composite uploads.
 MIN_PARALLEL_COMPOSITE_FILE_SIZE = 20971520 # 20 MB
 
+# Objects smaller than this are never downloaded in slices, regardless of the
+# configured threshold.
+MIN_SLICED_DOWNLOAD_OBJECT_SIZE = 20971520 # 20 MB
+
+# Size of the slices downloaded in parallel when streaming an object to
+# stdout. Each slice in flight is buffered in memory until it's output.
+SLICED_STREAMING_DOWNLOAD_SLICE_SIZE = 16 * 1024 * 1024
+
 SYNOPSIS_TEXT = """
 <B>SYNOPSIS</B>
   gsutil cp [OPTION]... src_uri dst_uri
@@ -373,6 +406,45 @@ PARALLEL_COMPOSITE_UPLOADS_TEXT = """
 """ % (PARALLEL_UPLOAD_TEMP_NAMESPACE, 10, MAX_COMPONENT_COUNT - 9,
        MAX_COMPONENT_COUNT)
 
+SLICED_OBJECT_DOWNLOADS_TEXT = """
+<B>SLICED OBJECT DOWNLOADS</B>
+  gsutil automatically uses HTTP Range GET requests to perform "sliced"
+  downloads in parallel for large objects being downloaded to a local file.
+  This means that, by default, a large object will be split into byte ranges
+  ("slices") that will be downloaded in parallel, each one written directly
+  to its own offset of the destination file. The data are written to a
+  temporary file named <file>_.gstmp, which is renamed to the destination
+  file name once all of the slices have been downloaded and the object's
+  checksum has been validated.
+
+  Any object whose size exceeds the "sliced_object_download_threshold" config
+  variable will trigger this feature by default. The ideal size of a slice
+  and the maximum number of slices can also be set with the
+  "sliced_object_download_component_size" and
+  "sliced_object_download_max_components" config variables. See the .boto
+  config file for details about how these values are used.
+
+  Each slice keeps its own resumable download state in ~/.gsutil, so if a
+  sliced download is interrupted, running the same cp command again will
+  only download the portions of the object that were not already
+  downloaded.
+
+  Large objects downloaded to stdout (by using '-' as the destination) are
+  also downloaded in slices, even though the output can't be written out of
+  order: up to "sliced_object_download_max_components" ranges of 16 MB are
+  downloaded in parallel ahead of the output, and each one is written once
+  the data before it has been written, so at most that many ranges are
+  buffered in memory. Since the output can't be removed, the object's
+  checksum is validated after all of it has been written, and gsutil exits
+  with an error if it doesn't match. Streamed slices aren't resumable.
+
+  Objects with Content-Encoding:gzip are never downloaded in slices, since
+  they must be decompressed as a single stream.
+
+  Note that this feature can be completely disabled by setting the
+  "sliced_object_download_threshold" variable in the .boto config file to 0.
+"""
+
 CHANGING_TEMP_DIRECTORIES_TEXT = """
 <B>CHANGING TEMP DIRECTORIES</B>
   gsutil writes data to a temporary directory in several cases:
@@ -430,6 +502,17 @@ OPTIONS_TEXT = """
                 between providers (e.g., to copy data from Google Cloud Storage
                 to another provider).
 
+                In daisy chain mode the download and the upload run
+                concurrently, with a bounded amount of data buffered in memory.
+                When copying from another provider to Google Cloud Storage,
+                objects larger than the parallel_composite_upload_threshold
+                are copied as ranges in parallel and composed, like parallel
+                composite uploads (see "PARALLEL COMPOSITE UPLOADS"). Each range
+                is validated as it's uploaded, but the composed object can only
+                be validated against the source object if the source reports a
+                CRC32C, so if check_hashes is set to "always", such objects are
+                copied sequentially and validated against the source MD5.
+
   -e            Exclude symlinks. When specified, symbolic links will not be
                 copied.
 
@@ -516,7 +599,7 @@ OPTIONS_TEXT = """
                 which in turn reduces storage costs.
 
                 When you specify the -z option, the data from your files is
-                compressed before it is uploaded, but your actual files are left
+                compressed as it is uploaded, but your actual files are left
                 uncompressed on the local disk. The uploaded objects retain the
                 Content-Type and name of the original files but are given a
                 Content-Encoding header with the value "gzip" to indicate that
@@ -538,6 +621,15 @@ OPTIONS_TEXT = """
                   browser will know to uncompress the data based on the
                   Content-Encoding header, and to render it as HTML based on
                   the Content-Type header.
+
+                When gsutil downloads an object with Content-Encoding:gzip, it
+                decompresses the data as it's downloaded. Bucket listings
+                don't include the Content-Encoding, though, so for objects
+                named by wildcards gsutil only finds out that the data is
+                compressed once the download starts. Those objects are
+                downloaded to a temporary file next to the destination and
+                decompressed afterwards, which needs room for both on the
+                local disk.
 """
 
 _detailed_help_text = '\n\n'.join([SYNOPSIS_TEXT,
@@ -548,6 +640,7 @@ _detailed_help_text = '\n\n'.join([SYNOPSIS_TEXT,
                                    RESUMABLE_TRANSFERS_TEXT,
                                    STREAMING_TRANSFERS_TEXT,
                                    PARALLEL_COMPOSITE_UPLOADS_TEXT,
+                                   SLICED_OBJECT_DOWNLOADS_TEXT,
                                    CHANGING_TEMP_DIRECTORIES_TEXT,
                                    OPTIONS_TEXT])
 
@@ -559,11 +652,39 @@ PerformResumableUploadIfAppliesArgs = namedtuple(
     'filename file_start file_length src_uri dst_uri canned_acl headers '
     'tracker_file tracker_file_lock')
 
+# This tuple is used only to encapsulate the arguments needed for
+# _CopyDaisyChainComponent, so that the arguments fit the model of
+# command.Apply().
+PerformDaisyChainComponentUploadArgs = namedtuple(
+    'PerformDaisyChainComponentUploadArgs',
+    'src_uri src_etag start_byte end_byte dst_uri canned_acl headers')
+
 ObjectFromTracker = namedtuple('ObjectFromTracker',
                                'object_name generation')
 
+# This tuple is used only to encapsulate the arguments needed for
+# _DownloadObjectSlice, so that the arguments fit the model of command.Apply().
+PerformSlicedDownloadArgs = namedtuple(
+    'PerformSlicedDownloadArgs',
+    'src_uri download_file_name start_byte end_byte etag headers '
+    'tracker_file')
+
 CP_SUB_ARGS = 'a:cDeIL:MNnpqrRtvz:'
 
+# Number of local files whose content types _PrefetchContentTypes detects in
+# one batch.
+CONTENT_TYPE_PREFETCH_BATCH_SIZE = 100
+
+# Suffix of the files to which each process appends its cp -L manifest rows,
+# which are named <manifest>.<pid><suffix>.
+MANIFEST_PART_SUFFIX = '.part'
+
+# Number of bytes copied at a time when merging manifest part files.
+MANIFEST_COPY_SIZE = 1024 * 1024
+
+# Number of successful sources added to the manifest index at a time.
+MANIFEST_INDEX_BATCH_SIZE = 10000
+
 # The maximum length of a file name can vary wildly between different
 # operating systems, so we always ensure that tracker files are less
 # than 100 characters in order to avoid any such issues.
@@ -574,6 +695,7 @@ class TrackerFileType(object):
   UPLOAD = 1
   DOWNLOAD = 2
   PARALLEL_UPLOAD = 3
+  SLICED_DOWNLOAD = 4
 
 def _CopyFuncWrapper(cls, args):
   cls._CopyFunc(args)
@@ -584,7 +706,8 @@ def _PerformResumableUploadIfAppliesWrapper(cls, args):
      arguments for the wrapped function, and then calls the wrapped function.
      This was designed specifically for use with command.Apply().
   """
-  fp = FilePart(args.filename, args.file_start, args.file_length)
+  # The components of a file share one memory mapping of it.
+  fp = OpenFilePart(args.filename, args.file_start, args.file_length)
   with fp:
     already_split = True
     ret = cls._PerformResumableUploadIfApplies(
@@ -599,6 +722,22 @@ def _PerformResumableUploadIfAppliesWrapper(cls, args):
                                                      args.tracker_file_lock)
   return ret
 
+def _CopyDaisyChainComponentWrapper(cls, args):
+  """A wrapper for cp._CopyDaisyChainComponent, which takes in a
+     PerformDaisyChainComponentUploadArgs and calls the wrapped function with
+     it. This was designed specifically for use with command.Apply().
+  """
+  return cls._CopyDaisyChainComponent(args)
+
+def _PerformSlicedDownloadWrapper(cls, args):
+  """A wrapper for cp._DownloadObjectSlice, which takes in a
+     PerformSlicedDownloadArgs and calls the wrapped function with its fields.
+     This was designed specifically for use with command.Apply().
+  """
+  return cls._DownloadObjectSlice(args.src_uri, args.download_file_name,
+                                  args.start_byte, args.end_byte, args.etag,
+                                  args.headers, args.tracker_file)
+
 def _CopyExceptionHandler(cls, e):
   """Simple exception handler to allow post-completion status."""
   cls.logger.error(str(e))
@@ -639,7 +778,6 @@ class CpCommand(Command):
   DEFAULT_CONTENT_TYPE = 'application/octet-stream'
   USE_MAGICFILE = boto.config.getbool('GSUtil', 'use_magicfile', False)
   # Chunk size to use while unzipping gzip files.
-  GUNZIP_CHUNK_SIZE = 8192
 
   # Command specification (processed by parent class).
   command_spec = {
@@ -717,20 +855,12 @@ class CpCommand(Command):
     elif 'md5' in cloud_hashes and 'md5' in hash_algs_to_compute:
       self.logger.info(
           'Computing MD5 from scratch for resumed download')
-
-      # Open file in binary mode to avoid surprises in Windows.
-      with open(file_name, 'rb') as fp:
-        local_hashes['md5'] = binascii.a2b_hex(key.compute_md5(fp)[0])
+      local_hashes = GetFileHashes(file_name, {'md5': md5})
     elif 'crc32c' in cloud_hashes and 'crc32c' in hash_algs_to_compute:
       self.logger.info(
           'Computing CRC32C from scratch for resumed download')
-
-      # Open file in binary mode to avoid surprises in Windows.
-      with open(file_name, 'rb') as fp:
-        crc32c_alg = lambda: crcmod.predefined.Crc('crc-32c')
-        crc32c_hex = key.compute_hash(
-            fp, algorithm=crc32c_alg)[0]
-        local_hashes['crc32c'] = binascii.a2b_hex(crc32c_hex)
+      crc32c_alg = lambda: crcmod.predefined.Crc('crc-32c')
+      local_hashes = GetFileHashes(file_name, {'crc32c': crc32c_alg})
 
     for alg in local_hashes:
       if alg not in cloud_hashes:
@@ -878,21 +1008,9 @@ class CpCommand(Command):
     cb = None
     num_cb = None
 
-    # Checks whether the destination file is a "special" file, like /dev/null on
-    # Linux platforms or null on Windows platforms, so we can disable resumable
-    # download support since the file size of the destination won't ever be
-    # correct.
-    dst_is_special = False
-    if dst_uri.is_file_uri():
-      # Check explicitly first because os.stat doesn't work on 'nul' in Windows.
-      if dst_uri.object_name == os.devnull:
-        dst_is_special = True
-      try:
-        mode = os.stat(dst_uri.object_name).st_mode
-        if stat.S_ISCHR(mode):
-          dst_is_special = True
-      except OSError:
-        pass
+    # Disable resumable download support for "special" destination files since
+    # the file size of the destination won't ever be correct.
+    dst_is_special = self._IsSpecialFile(dst_uri)
 
     if size >= resumable_threshold and not dst_is_special:
       cb = self._FileCopyCallbackHandler(upload, self.logger).call
@@ -902,7 +1020,7 @@ class CpCommand(Command):
         tracker_file_type = TrackerFileType.UPLOAD
       else:
         tracker_file_type = TrackerFileType.DOWNLOAD
-      tracker_file = self._GetTrackerFilePath(dst_uri, tracker_file_type)
+      tracker_file = self._GetTrackerFileName(dst_uri, tracker_file_type)
 
       if upload:
         if dst_uri.scheme == 'gs':
@@ -914,14 +1032,42 @@ class CpCommand(Command):
                 'this configuration, so large files are being uploaded with '
                 'non-resumable uploads instead.' % GetConfigFilePath())))
           else:
-            transfer_handler = ResumableUploadHandler(tracker_file)
+            transfer_handler = TrackerStoreResumableUploadHandler(
+                tracker_file)
       else:
-        transfer_handler = ResumableDownloadHandler(tracker_file)
+        transfer_handler = TrackerStoreResumableDownloadHandler(tracker_file)
 
     return (cb, num_cb, transfer_handler)
 
-  def _GetTrackerFilePath(self, dst_uri, tracker_file_type, src_uri=None):
-    resumable_tracker_dir = CreateTrackerDirIfNeeded()
+  def _IsSpecialFile(self, dst_uri):
+    """
+    Checks whether the destination file is a "special" file, like /dev/null on
+    Linux platforms or null on Windows platforms.
+
+    Args:
+      dst_uri: the destination URI.
+
+    Returns:
+      True if dst_uri names a special file, False otherwise.
+    """
+    if not dst_uri.is_file_uri():
+      return False
+    # Check explicitly first because os.stat doesn't work on 'nul' in Windows.
+    if dst_uri.object_name == os.devnull:
+      return True
+    try:
+      mode = os.stat(dst_uri.object_name).st_mode
+      if stat.S_ISCHR(mode):
+        return True
+    except OSError:
+      pass
+    return False
+
+  def _GetTrackerFileName(self, dst_uri, tracker_file_type, src_uri=None,
+                          component_num=None):
+    """Returns the name of the tracker for a transfer in the tracker store
+       (see GetTrackerStore), which is the name of its file when trackers are
+       kept in files."""
     if tracker_file_type == TrackerFileType.UPLOAD:
       # Encode the dest bucket and object name into the tracker file name.
       res_tracker_file_name = (
@@ -941,13 +1087,18 @@ class CpCommand(Command):
           re.sub('[/\\\\]', '_', 'parallel_upload__%s__%s__%s.url' %
                  (dst_uri.bucket_name, dst_uri.object_name, src_uri)))
       tracker_file_type_str = "parallel_upload"
+    elif tracker_file_type == TrackerFileType.SLICED_DOWNLOAD:
+      # Encode the fully-qualified dest file name and the component number
+      # into the tracker file name.
+      res_tracker_file_name = (
+          re.sub('[/\\\\]', '_', 'sliced_download__%s__%d.etag' %
+                 (os.path.realpath(dst_uri.object_name), component_num)))
+      tracker_file_type_str = "sliced_download"
 
     res_tracker_file_name = _HashFilename(res_tracker_file_name)
     tracker_file_name = '%s_%s' % (tracker_file_type_str, res_tracker_file_name)
-    tracker_file_path = '%s%s%s' % (resumable_tracker_dir, os.sep,
-                                    tracker_file_name)
     assert(len(tracker_file_name) < MAX_TRACKER_FILE_NAME_LENGTH)
-    return tracker_file_path
+    return tracker_file_name
 
   def _LogCopyOperation(self, src_uri, dst_uri, headers):
     """
@@ -1066,24 +1217,51 @@ class CpCommand(Command):
       return f_frsize * f_bavail
 
   def _PerformResumableUploadIfApplies(self, fp, src_uri, dst_uri, canned_acl,
-                                       headers, file_size, already_split=False):
+                                       headers, file_size, already_split=False,
+                                       src_hashes=None):
     """
     Performs resumable upload if supported by provider and file is above
     threshold, else performs non-resumable upload.
 
+    If src_hashes (a dictionary mapping hash algorithm names to the digests of
+    the source object, for daisy chain copies) is given, the uploaded data is
+    also validated against it.
+
     Returns (elapsed_time, bytes_transferred, version-specific dst_uri).
     """
     start_time = time.time()
     (cb, num_cb, res_upload_handler) = self._GetTransferHandlers(
         dst_uri, file_size, True)
-    if dst_uri.scheme == 'gs':
-      # Resumable upload protocol is Google Cloud Storage-specific.
-      dst_uri.set_contents_from_file(fp, headers, policy=canned_acl,
-                                     cb=cb, num_cb=num_cb,
-                                     res_upload_handler=res_upload_handler)
+    hash_cache_range = self._GetHashCacheRange(fp, src_uri)
+    if res_upload_handler:
+      # Resumable upload protocol is Google Cloud Storage-specific. The file is
+      # hashed as the upload reads it, rather than being read once by
+      # set_contents_from_file() to compute its MD5 and again to send it.
+      dst_uri = self._PerformHashingResumableUpload(
+          fp, dst_uri, canned_acl, headers, file_size, cb, num_cb,
+          res_upload_handler, hash_cache_range, src_hashes)
     else:
-      dst_uri.set_contents_from_file(fp, headers, policy=canned_acl,
-                                     cb=cb, num_cb=num_cb)
+      # Without a resumable upload handler, set_contents_from_file() reads the
+      # file once to compute its MD5 before sending it. Take the MD5 from the
+      # local hash cache instead, if it's there.
+      md5_tuple = None
+      if hash_cache_range:
+        (path, offset, length) = hash_cache_range
+        md5_digest = GetFileHashes(path, {'md5': md5}, offset, length)['md5']
+        md5_tuple = (binascii.b2a_hex(md5_digest),
+                     base64.b64encode(md5_digest))
+      elif src_hashes and 'md5' in src_hashes:
+        # Sending the source object's MD5 as the Content-MD5 makes the service
+        # validate the copy end to end, and saves reading the source twice.
+        md5_tuple = (binascii.b2a_hex(src_hashes['md5']),
+                     base64.b64encode(src_hashes['md5']))
+      if dst_uri.scheme == 'gs':
+        dst_uri.set_contents_from_file(fp, headers, policy=canned_acl,
+                                       cb=cb, num_cb=num_cb, md5=md5_tuple,
+                                       res_upload_handler=res_upload_handler)
+      else:
+        dst_uri.set_contents_from_file(fp, headers, policy=canned_acl,
+                                       cb=cb, num_cb=num_cb, md5=md5_tuple)
     if res_upload_handler:
       # ResumableUploadHandler does not update upload_start_point from its
       # initial value of -1 if transferring the whole file, so clamp at 0
@@ -1099,6 +1277,124 @@ class CpCommand(Command):
     end_time = time.time()
     return (end_time - start_time, bytes_transferred, dst_uri)
 
+  def _GetHashCacheRange(self, fp, src_uri):
+    """
+    Returns the (path, offset, length) of the part of the source file that fp
+    reads, for use with the local hash cache, or None if the cache isn't
+    enabled or fp doesn't read the source file (e.g., it reads a compressed
+    temporary copy).
+    """
+    if not GetLocalHashCache() or not src_uri.is_file_uri():
+      return None
+    if isinstance(fp, FilePart):
+      (path, offset, length) = (fp.filename, fp.offset, fp.length)
+    elif isinstance(fp, file):
+      (path, offset, length) = (fp.name, 0, None)
+    else:
+      return None
+    if path != src_uri.object_name:
+      return None
+    return (path, offset, length)
+
+  def _PerformHashingResumableUpload(self, fp, dst_uri, canned_acl, headers,
+                                     file_size, cb, num_cb,
+                                     res_upload_handler, hash_cache_range=None,
+                                     src_hashes=None):
+    """
+    Performs a resumable upload that computes the MD5 (and CRC32C, if crcmod
+    is fast) of the file in the same pass that sends it, and then validates
+    those digests against the ones reported for the new object (and against
+    src_hashes, the digests of the source object, if given). If
+    hash_cache_range (see _GetHashCacheRange) is given, the validated digests
+    are added to the local hash cache.
+
+    Returns version-specific dst_uri.
+
+    Raises:
+      CommandException: if the digests don't match.
+    """
+    hash_algs = {'md5': md5}
+    if UsingCrcmodExtension(crcmod):
+      hash_algs['crc32c'] = lambda: crcmod.predefined.Crc('crc-32c')
+    headers = headers.copy()
+    if canned_acl:
+      headers[dst_uri.get_provider().acl_header] = canned_acl
+    dst_key = dst_uri.new_key(False, headers)
+    dst_key.path = fp.name
+    dst_key.size = file_size
+    use_hashing_thread = file_size >= HASHING_THREAD_THRESHOLD
+    stat_key = hash_cache_range and GetStatKey(hash_cache_range[0])
+    with HashingFileUploadWrapper(fp, hash_algs,
+                                  use_hashing_thread) as hashing_fp:
+      res_upload_handler.send_file(dst_key, hashing_fp, headers, cb, num_cb,
+                                   hash_algs=hashing_fp.GetHashAlgs())
+      local_hashes = hashing_fp.GetDigests()
+    dst_key.md5 = binascii.b2a_hex(local_hashes['md5'])
+    self._CheckUploadHashes(dst_key, local_hashes)
+    if src_hashes:
+      self._CheckDaisyChainHashes(dst_key, local_hashes, src_hashes)
+    if stat_key:
+      (path, offset, length) = hash_cache_range
+      RecordFileHashes(path, local_hashes, stat_key, offset, length)
+    return dst_uri.clone_replace_key(dst_key)
+
+  def _CheckUploadHashes(self, key, local_hashes):
+    """Validates an upload by comparing the local digests to the cloud's.
+
+    Args:
+      key: The boto Key that was uploaded.
+      local_hashes: Dictionary mapping hash algorithm names to the digests of
+                    the data that was uploaded.
+
+    Raises:
+      CommandException: if cloud digests don't match local digests.
+    """
+    cloud_hashes = dict(getattr(key, 'cloud_hashes', None) or {})
+    etag_md5 = self._GetMD5FromETag(key)
+    if etag_md5:
+      cloud_hashes.setdefault('md5', etag_md5)
+    for alg in local_hashes:
+      if alg not in cloud_hashes:
+        continue
+      local_hexdigest = binascii.b2a_hex(local_hashes[alg])
+      cloud_hexdigest = binascii.b2a_hex(cloud_hashes[alg])
+      self.logger.debug('Comparing local vs cloud %s-checksum. (%s/%s)' % (
+          alg, local_hexdigest, cloud_hexdigest))
+      if local_hexdigest != cloud_hexdigest:
+        key.delete()
+        raise CommandException(
+            '%s signature computed for local file (%s) doesn\'t match '
+            'cloud-supplied digest (%s). Cloud object (%s) deleted.' % (
+            alg, local_hexdigest, cloud_hexdigest, key.name))
+
+  def _CheckDaisyChainHashes(self, key, uploaded_hashes, src_hashes):
+    """Validates a daisy chain copy by comparing the digests of the data that
+       was uploaded to the source object's digests.
+
+    Args:
+      key: The boto Key that was uploaded.
+      uploaded_hashes: Dictionary mapping hash algorithm names to the digests
+                       of the data that was uploaded.
+      src_hashes: Dictionary mapping hash algorithm names to the source
+                  object's digests.
+
+    Raises:
+      CommandException: if the digests don't match.
+    """
+    for alg in uploaded_hashes:
+      if alg not in src_hashes:
+        continue
+      uploaded_hexdigest = binascii.b2a_hex(uploaded_hashes[alg])
+      src_hexdigest = binascii.b2a_hex(src_hashes[alg])
+      self.logger.debug('Comparing source vs copied %s-checksum. (%s/%s)' % (
+          alg, src_hexdigest, uploaded_hexdigest))
+      if uploaded_hexdigest != src_hexdigest:
+        key.delete()
+        raise CommandException(
+            '%s signature of data copied to %s (%s) doesn\'t match the source '
+            'object\'s digest (%s). Copied object deleted.' % (
+            alg, key.name, uploaded_hexdigest, src_hexdigest))
+
   def _PerformStreamingUpload(self, fp, dst_uri, headers, canned_acl=None):
     """
     Performs a streaming upload to the cloud.
@@ -1124,10 +1420,12 @@ class CpCommand(Command):
     end_time = time.time()
     return (end_time - start_time, bytes_transferred, dst_uri)
 
-  def _SetContentTypeHeader(self, src_uri, headers):
+  def _SetContentTypeHeader(self, src_uri, headers,
+                            detected_content_type=None):
     """
     Sets content type header to value specified in '-h Content-Type' option (if
-    specified); else sets using Content-Type detection.
+    specified); else sets using Content-Type detection, unless
+    detected_content_type was already detected by _PrefetchContentTypes.
     """
     if 'content-type' in headers:
       # If empty string specified (i.e., -h "Content-Type:") set header to None,
@@ -1147,25 +1445,18 @@ class CpCommand(Command):
         # Streams (denoted by '-') are expected to be 'application/octet-stream'
         # and 'file' would partially consume them.
         if object_name != '-':
-          if self.USE_MAGICFILE:
-            p = subprocess.Popen(['file', '--mime-type', object_name],
-                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            output, error = p.communicate()
-            if p.returncode != 0 or error:
-              raise CommandException(
-                  'Encountered error running "file --mime-type %s" '
-                  '(returncode=%d).\n%s' % (object_name, p.returncode, error))
-            # Parse output by removing line delimiter and splitting on last ":
-            content_type = output.rstrip().rpartition(': ')[2]
+          if detected_content_type:
+            content_type = detected_content_type
           else:
-            content_type = mimetypes.guess_type(object_name)[0]
+            content_type = GetContentTypeDetector(self.USE_MAGICFILE).Detect(
+                object_name)
         if not content_type:
           content_type = self.DEFAULT_CONTENT_TYPE
         headers['content-type'] = content_type
 
   def _GetFileSize(self, fp):
     """Determines file size different ways for case where fp is actually a
-       wrapper around a Key vs an actual file.
+       wrapper around an object vs an actual file.
 
        Args:
          The file whose size we wish to determine.
@@ -1173,13 +1464,14 @@ class CpCommand(Command):
        Returns:
          The size of the file, in bytes.
     """
-    if isinstance(fp, KeyFile):
-      return fp.getkey().size
+    if isinstance(fp, DaisyChainWrapper):
+      return fp.size
     else:
       return os.path.getsize(fp.name)
 
   def _UploadFileToObject(self, src_key, src_uri, dst_uri, headers,
-                          should_log=True, allow_splitting=True):
+                          should_log=True, allow_splitting=True,
+                          detected_content_type=None, src_file_size=None):
     """Uploads a local file to an object.
 
     Args:
@@ -1188,6 +1480,10 @@ class CpCommand(Command):
       dst_uri: Destination StorageUri.
       headers: The headers dictionary.
       should_log: bool indicator whether we should log this operation.
+      detected_content_type: Content type of the file detected ahead of time,
+                             if any.
+      src_file_size: Size of the file recorded when its directory was walked,
+                     if any. Used to avoid another stat of the file.
     Returns:
       (elapsed_time, bytes_transferred, version-specific dst_uri), excluding
       overhead like initial HEAD.
@@ -1213,7 +1509,7 @@ class CpCommand(Command):
         elif o == '-z':
           gzip_exts = a.split(',')
 
-    self._SetContentTypeHeader(src_uri, headers)
+    self._SetContentTypeHeader(src_uri, headers, detected_content_type)
     if should_log:
       self._LogCopyOperation(src_uri, dst_uri, headers)
 
@@ -1223,7 +1519,30 @@ class CpCommand(Command):
          headers['content-language'] = content_language
 
     fname_parts = src_uri.object_name.split('.')
-    if len(fname_parts) > 1 and fname_parts[-1] in gzip_exts:
+    should_gzip = len(fname_parts) > 1 and fname_parts[-1] in gzip_exts
+    if should_gzip and src_file_size is None:
+      src_file_size = os.path.getsize(src_key.name)
+    if (should_gzip and dst_uri.scheme == 'gs' and src_file_size <
+        config.getint('GSUtil', 'resumable_threshold', TWO_MB)):
+      # The compressed size isn't known in advance, so we compress the data as
+      # we upload it with a chunked transfer (which Google Cloud Storage
+      # supports), rather than writing it to a temporary file first. boto
+      # computes the MD5 of the compressed data as it's sent, and checks it
+      # against the ETag of the resulting object. A chunked transfer can't be
+      # resumed, so larger files are compressed to a temporary file below and
+      # uploaded like any other file, which is resumable.
+      self.logger.debug('Compressing %s while uploading...', src_key)
+      headers['content-encoding'] = 'gzip'
+      gzip_fp = GzipCompressingReader(src_key.fp)
+      cb = self._StreamCopyCallbackHandler(self.logger).call
+      start_time = time.time()
+      dst_key = dst_uri.new_key(False, headers)
+      dst_key.set_contents_from_stream(gzip_fp, headers, policy=canned_acl,
+                                       cb=cb)
+      elapsed_time = time.time() - start_time
+      bytes_transferred = gzip_fp.tell()
+      result_uri = dst_uri.clone_replace_key(dst_key)
+    elif should_gzip:
       self.logger.debug('Compressing %s (to tmp)...', src_key)
       (gzip_fh, gzip_path) = tempfile.mkstemp()
       gzip_fp = None
@@ -1231,8 +1550,7 @@ class CpCommand(Command):
         # Check for temp space. Assume the compressed object is at most 2x
         # the size of the object (normally should compress to smaller than
         # the object)
-        if (self._CheckFreeSpace(gzip_path)
-            < 2*int(os.path.getsize(src_key.name))):
+        if self._CheckFreeSpace(gzip_path) < 2*int(src_file_size):
           raise CommandException('Inadequate temp space available to compress '
                                  '%s' % src_key.name)
         gzip_fp = gzip.open(gzip_path, 'wb')
@@ -1275,7 +1593,9 @@ class CpCommand(Command):
           file_uri.close()
       try:
         fp = src_key.fp
-        file_size = self._GetFileSize(fp)
+        file_size = src_file_size
+        if file_size is None:
+          file_size = self._GetFileSize(fp)
         if self._ShouldDoParallelCompositeUpload(allow_splitting, src_key,
                                                  dst_uri, file_size):
           (elapsed_time, bytes_transferred, result_uri) = (
@@ -1285,7 +1605,7 @@ class CpCommand(Command):
           (elapsed_time, bytes_transferred, result_uri) = (
               self._PerformResumableUploadIfApplies(
                   src_key.fp, src_uri, dst_uri, canned_acl, headers,
-                  self._GetFileSize(src_key.fp)))
+                  file_size))
       finally:
         if src_key.is_stream():
           tmp.close()
@@ -1350,26 +1670,10 @@ class CpCommand(Command):
     (cb, num_cb, res_download_handler) = self._GetTransferHandlers(
         dst_uri, src_key.size, False)
     file_name = dst_uri.object_name
-    dir_name = os.path.dirname(file_name)
-    if dir_name and not os.path.exists(dir_name):
-      # Do dir creation in try block so can ignore case where dir already
-      # exists. This is needed to avoid a race condition when running gsutil
-      # -m cp.
-      try:
-        os.makedirs(dir_name)
-      except OSError, e:
-        if e.errno != errno.EEXIST:
-          raise
-    # For gzipped objects, download to a temp file and unzip.
-    if (hasattr(src_key, 'content_encoding')
-        and src_key.content_encoding == 'gzip'):
-      # We can't use tempfile.mkstemp() here because we need a predictable
-      # filename for resumable downloads.
-      download_file_name = '%s_.gztmp' % file_name
-      need_to_unzip = True
-    else:
-      download_file_name = file_name
-      need_to_unzip = False
+    self._CreateDirForFileIfNeeded(file_name)
+    # Gzipped objects are decompressed as they're downloaded.
+    decompress_while_downloading = (
+        getattr(src_key, 'content_encoding', None) == 'gzip')
 
     hash_algs = self._GetHashAlgs(src_key)
 
@@ -1378,19 +1682,32 @@ class CpCommand(Command):
 
     fp = None
     try:
-      if res_download_handler:
-        fp = open(download_file_name, 'ab')
+      # A partially decompressed file can't be resumed, so in that case the
+      # file is always truncated and a resumable download restarted by a new
+      # process starts from the beginning.
+      if res_download_handler and not decompress_while_downloading:
+        fp = open(file_name, 'ab')
+      else:
+        fp = open(file_name, 'wb')
+      if decompress_while_downloading:
+        # The writer hashes the compressed data itself, so that all of it is
+        # covered even if the download is resumed after a failed attempt.
+        download_fp = GzipDecompressingWriter(fp, hash_algs)
+        download_hash_algs = {}
       else:
-        fp = open(download_file_name, 'wb')
+        download_fp = fp
+        download_hash_algs = hash_algs
       start_time = time.time()
       # Use our hash_algs if get_contents_to_file() will accept them, else the
       # default (md5-only) will suffice.
-      try:
-        src_key.get_contents_to_file(fp, headers, cb=cb, num_cb=num_cb,
+      if KeyMethodAcceptsHashAlgs(src_key, 'get_contents_to_file'):
+        src_key.get_contents_to_file(download_fp, headers, cb=cb,
+                                     num_cb=num_cb,
                                      res_download_handler=res_download_handler,
-                                     hash_algs=hash_algs)
-      except TypeError:
-        src_key.get_contents_to_file(fp, headers, cb=cb, num_cb=num_cb,
+                                     hash_algs=download_hash_algs)
+      else:
+        src_key.get_contents_to_file(download_fp, headers, cb=cb,
+                                     num_cb=num_cb,
                                      res_download_handler=res_download_handler)
 
       # If a custom test method is defined, call it here. For the copy command,
@@ -1404,37 +1721,40 @@ class CpCommand(Command):
       if fp:
         fp.close()
 
-    if (not need_to_unzip and
-        hasattr(src_key, 'content_encoding')
-        and src_key.content_encoding == 'gzip'):
+    download_file_name = file_name
+    need_to_unzip = False
+    if (not decompress_while_downloading and
+        getattr(src_key, 'content_encoding', None) == 'gzip'):
       # TODO: HEAD requests are currently not returning proper Content-Encoding
       # headers when an object is gzip-encoded on-the-fly. Remove this once
       # it's fixed.
-      renamed_file_name = '%s_.gztmp' % file_name
-      os.rename(download_file_name, renamed_file_name)
-      download_file_name = renamed_file_name
+      download_file_name = '%s_.gztmp' % file_name
+      os.rename(file_name, download_file_name)
       need_to_unzip = True
 
-    # Discard all hashes if we are resuming a partial download.
-    if res_download_handler and res_download_handler.download_start_point:
+    computed_hashes = None
+    if decompress_while_downloading:
+      computed_hashes = download_fp.GetHashes()
+    elif res_download_handler and res_download_handler.download_start_point:
+      # Discard all hashes if we are resuming a partial download.
       src_key.local_hashes = {}
 
     # Verify downloaded file checksum matched source object's checksum.
     digest_verified = True
-    computed_hashes = None
     try:
-      self._CheckHashes(src_key, download_file_name, hash_algs)
+      self._CheckHashes(src_key, download_file_name, hash_algs,
+                        computed_hashes=computed_hashes)
     except CommandException, e:
-      # If the digest doesn't match, we'll try checking it again after
-      # unzipping.
-      if (not need_to_unzip or
+      # If the digest doesn't match, we'll try checking it again against the
+      # uncompressed data.
+      if (not (decompress_while_downloading or need_to_unzip) or
           'doesn\'t match cloud-supplied digest' not in str(e)):
         os.unlink(download_file_name)
         raise
       digest_verified = False
-      computed_hashes = dict(
-          (alg, digester())
-          for alg, digester in self._GetHashAlgs(src_key).iteritems())
+    if digest_verified and not (decompress_while_downloading or need_to_unzip):
+      # The digests that were checked are those of the file as written.
+      RecordFileHashes(file_name, getattr(src_key, 'local_hashes', None) or {})
 
     if res_download_handler:
       bytes_transferred = (
@@ -1452,31 +1772,54 @@ class CpCommand(Command):
       # Downloaded gzipped file to a filename w/o .gz extension, so unzip.
       f_in = gzip.open(download_file_name, 'rb')
       with open(file_name, 'wb') as f_out:
-        data = f_in.read(self.GUNZIP_CHUNK_SIZE)
-        while data:
+        for data in ReadChunks(f_in):
           f_out.write(data)
-          if computed_hashes:
-            # Compute digests again on the uncompressed data.
-            for alg in computed_hashes.itervalues():
-              alg.update(data)
-          data = f_in.read(self.GUNZIP_CHUNK_SIZE)
       f_in.close()
 
       os.unlink(download_file_name)
 
-      if not digest_verified:
-        computed_hashes = dict((alg, digester.digest())
-                               for alg, digester in computed_hashes.iteritems())
-        try:
-          self._CheckHashes(
-              src_key, file_name, hash_algs, computed_hashes=computed_hashes)
-        except CommandException, e:
-          os.unlink(file_name)
-          raise
+    if not digest_verified:
+      # Compute digests again on the uncompressed data.
+      digesters = dict(
+          (alg, digester())
+          for alg, digester in self._GetHashAlgs(src_key).iteritems())
+      with open(file_name, 'rb') as f_in:
+        for data in ReadChunks(f_in):
+          for digester in digesters.itervalues():
+            digester.update(data)
+      computed_hashes = dict((alg, digester.digest())
+                             for alg, digester in digesters.iteritems())
+      try:
+        self._CheckHashes(
+            src_key, file_name, hash_algs, computed_hashes=computed_hashes)
+      except CommandException, e:
+        os.unlink(file_name)
+        raise
+      RecordFileHashes(file_name, computed_hashes)
 
     return (end_time - start_time, bytes_transferred, dst_uri)
 
+  def _CreateDirForFileIfNeeded(self, file_name):
+    """Creates the directory that will contain file_name, if it doesn't exist.
+
+    Args:
+      file_name: Name of the local file about to be written.
+    """
+    dir_name = os.path.dirname(file_name)
+    if dir_name and not os.path.exists(dir_name):
+      # Do dir creation in try block so can ignore case where dir already
+      # exists. This is needed to avoid a race condition when running gsutil
+      # -m cp.
+      try:
+        os.makedirs(dir_name)
+      except OSError, e:
+        if e.errno != errno.EEXIST:
+          raise
+
   def _PerformDownloadToStream(self, src_key, src_uri, str_fp, headers):
+    if self._ShouldDoSlicedStreamingDownload(src_key):
+      return self._DoSlicedStreamingDownload(src_key, src_uri, str_fp,
+                                             headers)
     (cb, num_cb, res_download_handler) = self._GetTransferHandlers(
                                 src_uri, src_key.size, False)
     start_time = time.time()
@@ -1486,6 +1829,120 @@ class CpCommand(Command):
     end_time = time.time()
     return (end_time - start_time, bytes_transferred)
 
+  def _ShouldDoSlicedStreamingDownload(self, src_key):
+    """Returns True iff an object streamed to stdout should be downloaded in
+       parallel slices.
+
+       Args:
+         src_key: Corresponding to an object in the cloud.
+    """
+    sliced_object_download_threshold = HumanReadableToBytes(boto.config.get(
+        'GSUtil', 'sliced_object_download_threshold',
+        DEFAULT_SLICED_OBJECT_DOWNLOAD_THRESHOLD))
+    size = getattr(src_key, 'size', None)
+    return (sliced_object_download_threshold > 0
+            and size is not None
+            and size >= sliced_object_download_threshold
+            and size >= MIN_SLICED_DOWNLOAD_OBJECT_SIZE
+            # Gzipped objects have to be decompressed as a single stream.
+            and getattr(src_key, 'content_encoding', None) != 'gzip'
+            # Test methods expect to perturb a single downloaded stream.
+            and not self.test_method)
+
+  def _DoSlicedStreamingDownload(self, src_key, src_uri, str_fp, headers):
+    """Downloads an object to a stream using several ranged GETs at once.
+
+       The object is split into slices of SLICED_STREAMING_DOWNLOAD_SLICE_SIZE,
+       which are downloaded by DaisyChainWrappers. Up to
+       sliced_object_download_max_components slices are downloaded at a time,
+       and each one is written to the stream in order, once the slices before
+       it have been written. The hashes of all of the data written are
+       validated at the end.
+
+       Args:
+         src_key: Source Key.
+         src_uri: Source StorageUri.
+         str_fp: The stream to write the object to.
+         headers: The headers dictionary.
+
+       Returns:
+         (elapsed_time, bytes_transferred), excluding overhead like initial
+         HEAD.
+
+       Raises:
+         CommandException: if the hashes of the data written don't match the
+                           object's.
+    """
+    # Do this before transferring any data, since it raises if the integrity
+    # of the download can't be checked as configured.
+    hash_algs = self._GetHashAlgs(src_key)
+    digesters = dict((alg, hash_algs[alg]()) for alg in hash_algs)
+
+    # Slices are requested as raw byte ranges; never ask the service to
+    # compress them on the fly.
+    slice_headers = headers.copy() if headers else {}
+    for header in slice_headers.keys():
+      if header.lower() == 'accept-encoding':
+        del slice_headers[header]
+
+    max_slices_in_flight = max(1, boto.config.getint(
+        'GSUtil', 'sliced_object_download_max_components',
+        DEFAULT_SLICED_OBJECT_DOWNLOAD_MAX_COMPONENTS))
+    # Let each slice be downloaded entirely before it's output, so the
+    # downloads ahead of the output don't stall.
+    max_buffered_chunks = max(
+        1, SLICED_STREAMING_DOWNLOAD_SLICE_SIZE / DAISY_CHAIN_CHUNK_SIZE)
+    buffer_size = GetTransferBufferSize()
+    slice_starts = iter(xrange(0, src_key.size,
+                               SLICED_STREAMING_DOWNLOAD_SLICE_SIZE))
+
+    start_time = time.time()
+    # DaisyChainWrappers for the slices being downloaded, in output order.
+    slices = deque()
+    try:
+      while True:
+        for start_byte in slice_starts:
+          end_byte = min(start_byte + SLICED_STREAMING_DOWNLOAD_SLICE_SIZE,
+                         src_key.size) - 1
+          fp = DaisyChainWrapper(src_key, slice_headers, start_byte, end_byte,
+                                 max_buffered_chunks)
+          fp.StartDownload()
+          slices.append(fp)
+          if len(slices) == max_slices_in_flight:
+            break
+        if not slices:
+          break
+        fp = slices.popleft()
+        try:
+          while True:
+            data = fp.read(buffer_size)
+            if not data:
+              break
+            for digester in digesters.itervalues():
+              digester.update(data)
+            str_fp.write(data)
+        finally:
+          fp.close()
+    finally:
+      for fp in slices:
+        fp.close()
+    end_time = time.time()
+
+    src_hashes = self._GetSourceObjectHashes(src_key)
+    for alg in digesters:
+      if alg not in src_hashes:
+        continue
+      streamed_hexdigest = digesters[alg].hexdigest()
+      src_hexdigest = binascii.b2a_hex(src_hashes[alg])
+      self.logger.debug('Comparing streamed vs cloud %s-checksum. (%s/%s)' % (
+          alg, streamed_hexdigest, src_hexdigest))
+      if streamed_hexdigest != src_hexdigest:
+        raise CommandException(
+            '%s signature computed for the data streamed from %s (%s) doesn\'t '
+            'match cloud-supplied digest (%s). The output is corrupt.' % (
+            alg, src_uri, streamed_hexdigest, src_hexdigest))
+    return (end_time - start_time, src_key.size)
+
   def _CopyFileToFile(self, src_key, src_uri, dst_uri, headers):
     """Copies a local file to a local file.
 
@@ -1508,15 +1965,22 @@ class CpCommand(Command):
     end_time = time.time()
     return (end_time - start_time, os.path.getsize(src_key.fp.name), dst_uri)
 
-  def _CopyObjToObjDaisyChainMode(self, src_key, src_uri, dst_uri, headers):
+  def _CopyObjToObjDaisyChainMode(self, src_key, src_uri, dst_uri, headers,
+                                  allow_splitting=True):
     """Copies from src_uri to dst_uri in "daisy chain" mode.
        See -D OPTION documentation about what daisy chain mode is.
 
+       The object is downloaded by a separate thread while it's uploaded (see
+       DaisyChainWrapper), and large objects copied to gs are copied as
+       ranges in parallel and composed (see _DoParallelDaisyChainUpload).
+
     Args:
       src_key: Source Key.
       src_uri: Source StorageUri.
       dst_uri: Destination StorageUri.
       headers: A copy of the top-level headers dictionary.
+      allow_splitting: Whether to allow the object to be copied in parallel
+                       ranges.
 
     Returns:
       (elapsed_time, bytes_transferred, version-specific dst_uri) excluding
@@ -1563,10 +2027,20 @@ class CpCommand(Command):
       # parameter (unlike the Bucket.copy_key() API used
       # by_CopyObjToObjInTheCloud).
       acl = src_uri.get_acl(headers=headers)
-    fp = KeyFile(src_key)
-    result = self._PerformResumableUploadIfApplies(fp, src_uri,
-                                                   dst_uri, canned_acl, headers,
-                                                   self._GetFileSize(fp))
+    src_hashes = self._GetSourceObjectHashes(src_key)
+    if self._ShouldDoParallelDaisyChainUpload(allow_splitting, src_key,
+                                              src_uri, dst_uri, src_hashes):
+      result = self._DoParallelDaisyChainUpload(src_key, src_uri, dst_uri,
+                                                headers, canned_acl,
+                                                src_hashes)
+    else:
+      fp = DaisyChainWrapper(src_key, self._GetDaisyChainDownloadHeaders())
+      try:
+        result = self._PerformResumableUploadIfApplies(
+            fp, src_uri, dst_uri, canned_acl, headers, self._GetFileSize(fp),
+            src_hashes=src_hashes)
+      finally:
+        fp.close()
     if preserve_acl:
       # If user specified noclobber flag, we need to remove the
       # x-goog-if-generation-match:0 header that was set when uploading the
@@ -1582,7 +2056,108 @@ class CpCommand(Command):
       dst_uri.set_acl(acl, dst_uri.object_name, headers=headers)
     return result
 
-  def _PerformCopy(self, src_uri, dst_uri, allow_splitting=True):
+  def _GetDaisyChainDownloadHeaders(self):
+    """Returns the headers for downloading the source of a daisy chain copy.
+       The source object's data is copied as stored, so compressed objects
+       stay compressed (and keep their Content-Encoding).
+    """
+    download_headers = self.headers.copy() if self.headers else {}
+    AddAcceptEncoding(download_headers)
+    return download_headers
+
+  def _GetSourceObjectHashes(self, src_key):
+    """Returns a dictionary mapping hash algorithm names to the digests of
+       a source object, as reported by the service.
+    """
+    src_hashes = dict(getattr(src_key, 'cloud_hashes', None) or {})
+    etag_md5 = self._GetMD5FromETag(src_key)
+    if etag_md5:
+      src_hashes.setdefault('md5', etag_md5)
+    return src_hashes
+
+  def _ShouldDoParallelDaisyChainUpload(self, allow_splitting, src_key,
+                                        src_uri, dst_uri, src_hashes):
+    """Returns True iff a daisy chain copy should copy ranges of the source
+       object in parallel and compose them.
+
+       Args:
+         allow_splitting: If false, then this function returns false.
+         src_key: Corresponding to the source object.
+         src_uri: Corresponding to the source object.
+         dst_uri: Corresponding to the destination object.
+         src_hashes: Digests of the source object.
+    """
+    parallel_composite_upload_threshold = HumanReadableToBytes(boto.config.get(
+        'GSUtil', 'parallel_composite_upload_threshold',
+        DEFAULT_PARALLEL_COMPOSITE_UPLOAD_THRESHOLD))
+    if not (allow_splitting  # Don't split the pieces multiple times.
+            and dst_uri.scheme == 'gs'  # Compose is only for gs.
+            # cp -D within gs is used to make non-composite copies of
+            # composite objects.
+            and src_uri.scheme != 'gs'
+            and parallel_composite_upload_threshold > 0
+            and src_key.size >= parallel_composite_upload_threshold
+            and src_key.size >= MIN_PARALLEL_COMPOSITE_FILE_SIZE):
+      return False
+    # The composed object can only be validated against the source object
+    # if the source has a CRC32C (which, unlike the MD5, can be combined from
+    # the components' digests by the service). Otherwise each range is still
+    # validated as it's uploaded, but there's no end-to-end check, so copy
+    # the object sequentially if checking is required.
+    return ('crc32c' in src_hashes or
+            config.get('GSUtil', 'check_hashes',
+                       'if_fast_else_fail') != 'always')
+
+  def _GetKeyFromListedMetadata(self, src_uri, dst_uri, src_key_metadata,
+                                allow_splitting, headers):
+    """Builds the source Key from metadata returned by a bucket listing, if
+       that metadata is sufficient for the requested copy. This avoids a HEAD
+       request per object.
+
+    Args:
+      src_uri: Source StorageUri.
+      dst_uri: Destination StorageUri.
+      src_key_metadata: Dictionary of listed object metadata (see
+                        BucketListingRef.GetListedKeyMetadata()).
+      allow_splitting: Same as for _PerformCopy.
+      headers: The headers dictionary.
+
+    Returns:
+      Key, or None if the object's metadata must be fetched with a HEAD.
+    """
+    if not src_uri.is_cloud_uri() or 'size' not in src_key_metadata:
+      return None
+    if dst_uri.is_cloud_uri():
+      # Daisy chain copies need the object's full metadata (Content-Type etc.)
+      # to create the destination object; copies in the cloud don't.
+      if src_uri.scheme != dst_uri.scheme or self.daisy_chain:
+        return None
+    # Creating a new Key doesn't make a request to the service.
+    src_key = src_uri.new_key(False, headers)
+    for (field, value) in src_key_metadata.iteritems():
+      setattr(src_key, field, value)
+    if src_uri.is_version_specific:
+      # new_key() doesn't carry over the URI's version, without which the
+      # live version of the object would be copied (e.g., with cp -A).
+      src_key.generation = getattr(src_uri, 'generation', None)
+      src_key.version_id = getattr(src_uri, 'version_id', None)
+    # Note that listings don't include Content-Encoding either. A download of
+    # a gzip-encoded object built from the listing only learns of the encoding
+    # from the GET response, so it's decompressed after it's downloaded
+    # rather than while it's downloaded (see _DownloadObjectToFile). That's
+    # cheaper than a HEAD for every object downloaded.
+    if dst_uri.is_file_uri():
+      # Downloads need a hash to validate against (composite objects have no
+      # MD5 etag, and their CRC32C isn't listed), and sliced downloads need to
+      # know the object's Content-Encoding, which isn't listed either.
+      if (not self._GetMD5FromETag(src_key) or
+          self._ShouldDoSlicedDownload(allow_splitting, src_key, dst_uri)):
+        return None
+    return src_key
+
+  def _PerformCopy(self, src_uri, dst_uri, allow_splitting=True,
+                   src_key_metadata=None, detected_content_type=None,
+                   src_file_stat=None):
     """Performs copy from src_uri to dst_uri, handling various special cases.
 
     Args:
@@ -1590,6 +2165,14 @@ class CpCommand(Command):
       dst_uri: Destination StorageUri.
       allow_splitting: Whether to allow the file to be split into component
                        pieces for an parallel composite upload.
+      src_key_metadata: Object metadata for src_uri from the bucket listing
+                        that produced it, if any. Used to avoid a HEAD request
+                        where possible.
+      detected_content_type: Content type of src_uri detected ahead of time by
+                             _PrefetchContentTypes, if any.
+      src_file_stat: FileStat of src_uri recorded when its directory was
+                     walked (see gslib.local_walker), if any. Like
+                     src_key_metadata, used to avoid another stat of the file.
 
     Returns:
       (elapsed_time, bytes_transferred, version-specific dst_uri) excluding
@@ -1605,7 +2188,12 @@ class CpCommand(Command):
     # Add accept encoding for download operation.
     AddAcceptEncoding(download_headers)
 
-    src_key = src_uri.get_key(False, download_headers)
+    src_key = None
+    if src_key_metadata:
+      src_key = self._GetKeyFromListedMetadata(
+          src_uri, dst_uri, src_key_metadata, allow_splitting, download_headers)
+    if not src_key:
+      src_key = src_uri.get_key(False, download_headers)
     if not src_key:
       raise CommandException('"%s" does not exist.' % src_uri)
 
@@ -1648,11 +2236,16 @@ class CpCommand(Command):
         return self._CopyObjToObjInTheCloud(src_key, src_uri, dst_uri, headers)
       else:
         return self._CopyObjToObjDaisyChainMode(src_key, src_uri, dst_uri,
-                                                headers)
+                                                headers, allow_splitting)
     elif src_uri.is_file_uri() and dst_uri.is_cloud_uri():
-      return self._UploadFileToObject(src_key, src_uri, dst_uri,
-                                      download_headers)
+      return self._UploadFileToObject(
+          src_key, src_uri, dst_uri, download_headers,
+          detected_content_type=detected_content_type,
+          src_file_size=src_file_stat and src_file_stat.size)
     elif src_uri.is_cloud_uri() and dst_uri.is_file_uri():
+      if self._ShouldDoSlicedDownload(allow_splitting, src_key, dst_uri):
+        return self._DoSlicedDownload(src_key, src_uri, dst_uri,
+                                      download_headers)
       return self._DownloadObjectToFile(src_key, src_uri, dst_uri,
                                         download_headers)
     elif src_uri.is_file_uri() and dst_uri.is_file_uri():
@@ -1687,7 +2280,7 @@ class CpCommand(Command):
         boto.config.get('GSUtil', 'parallel_composite_upload_component_size',
                         DEFAULT_PARALLEL_COMPOSITE_UPLOAD_COMPONENT_SIZE))
     (num_components, component_size) = _GetPartitionInfo(file_size,
-        MAX_COMPOSE_ARITY, parallel_composite_upload_component_size)
+        MAX_COMPONENT_COUNT, parallel_composite_upload_component_size)
 
     # Make sure that the temporary objects don't already exist.
     tmp_object_headers = copy.deepcopy(headers)
@@ -1759,7 +2352,7 @@ class CpCommand(Command):
 
     # Determine which components, if any, have already been successfully
     # uploaded.
-    tracker_file = self._GetTrackerFilePath(dst_uri,
+    tracker_file = self._GetTrackerFileName(dst_uri,
                                             TrackerFileType.PARALLEL_UPLOAD,
                                             src_uri)
     tracker_file_lock = CreateLock()
@@ -1777,7 +2370,7 @@ class CpCommand(Command):
 
     (components_to_upload, existing_components, existing_objects_to_delete) = (
         FilterExistingComponents(dst_args, existing_components, bucket,
-                                 self.suri_builder))
+                                 self.suri_builder, command=self))
 
     # In parallel, copy all of the file parts that haven't already been
     # uploaded to temporary objects.
@@ -1802,7 +2395,11 @@ class CpCommand(Command):
       components = sorted(
           components, key=lambda component:
               int(component.object_name[component.object_name.rfind('_')+1:]))
-      result_uri = dst_uri.compose(components, headers=headers)
+      # Composes more than MAX_COMPOSE_ARITY components through a tree of
+      # intermediate objects.
+      result_uri = ComposeHierarchically(self, dst_uri, components,
+                                         headers=headers,
+                                         parallel_operations_override=True)
 
       try:
         # Make sure only to delete things that we know were successfully
@@ -1828,8 +2425,7 @@ class CpCommand(Command):
           raise e
       finally:
         with tracker_file_lock:
-          if os.path.exists(tracker_file):
-            os.unlink(tracker_file)
+          GetTrackerStore().Delete([tracker_file])
     else:
       # Some of the components failed to upload. In this case, we want to exit
       # without deleting the objects.
@@ -1839,6 +2435,156 @@ class CpCommand(Command):
 
     return (time.time() - start_time, total_bytes_uploaded, result_uri)
 
+  def _DoParallelDaisyChainUpload(self, src_key, src_uri, dst_uri, headers,
+                                  canned_acl, src_hashes):
+    """Copies an object to an object in Google Cloud Storage in daisy chain
+       mode by copying ranges of the source object to temporary objects in
+       parallel, composing them to form the destination object, and deleting
+       them. This is the daisy chain counterpart of
+       _DoParallelCompositeUpload; since the source can be read again, there is
+       no tracker file, and the temporary objects are always deleted.
+
+       Args:
+         src_key: The Key of the source object.
+         src_uri: The StorageUri of the source object.
+         dst_uri: The StorageUri of the destination object.
+         headers: The headers to pass to boto, if any.
+         canned_acl: The canned acl to apply to the object, if any.
+         src_hashes: Dictionary mapping hash algorithm names to the source
+                     object's digests.
+
+       Returns:
+         (elapsed_time, bytes_transferred, version-specific dst_uri).
+
+       Raises:
+         CommandException: if errors encountered.
+    """
+    start_time = time.time()
+    bucket = 'gs://' + dst_uri.bucket_name
+    if 'content-type' in headers and not headers['content-type']:
+      del headers['content-type']
+    parallel_composite_upload_component_size = HumanReadableToBytes(
+        boto.config.get('GSUtil', 'parallel_composite_upload_component_size',
+                        DEFAULT_PARALLEL_COMPOSITE_UPLOAD_COMPONENT_SIZE))
+    (num_components, component_size) = _GetPartitionInfo(src_key.size,
+        MAX_COMPONENT_COUNT, parallel_composite_upload_component_size)
+
+    random_prefix = str(random.randint(1, (10 ** 10) - 1))
+    encoded_name = (PARALLEL_UPLOAD_STATIC_SALT + src_uri.uri).encode('utf-8')
+    digest = md5(encoded_name).hexdigest()
+    component_args = []
+    for i in range(num_components):
+      temp_file_name = (random_prefix + PARALLEL_UPLOAD_TEMP_NAMESPACE +
+                        digest + '_' + str(i))
+      start_byte = i * component_size
+      if i < (num_components - 1):
+        end_byte = start_byte + component_size - 1
+      else:
+        # The last component just gets all of the remaining bytes.
+        end_byte = src_key.size - 1
+      component_args.append(PerformDaisyChainComponentUploadArgs(
+          src_uri, src_key.etag, start_byte, end_byte,
+          MakeGsUri(bucket, temp_file_name, self.suri_builder), canned_acl,
+          headers))
+
+    components = []
+    try:
+      # In parallel, copy each range of the source object to a temporary
+      # object.
+      cp_results = self.Apply(_CopyDaisyChainComponentWrapper,
+                              component_args,
+                              _CopyExceptionHandler,
+                              ('copy_failure_count',
+                               'total_bytes_transferred'),
+                              arg_checker=gslib.command.DummyArgChecker,
+                              parallel_operations_override=True,
+                              should_return_results=True)
+      total_bytes_uploaded = 0
+      for cp_result in cp_results:
+        total_bytes_uploaded += cp_result[1]
+        components.append(cp_result[2])
+      if len(components) != num_components:
+        raise CommandException(
+            'Some temporary components were not copied successfully. '
+            'Please retry this copy.')
+
+      # Sort the components so that they will be composed in the correct order.
+      components = sorted(
+          components, key=lambda component:
+              int(component.object_name[component.object_name.rfind('_')+1:]))
+      result_uri = ComposeHierarchically(self, dst_uri, components,
+                                         headers=headers,
+                                         parallel_operations_override=True)
+      self._CheckComposedDaisyChainHashes(result_uri, src_hashes)
+    finally:
+      if components:
+        try:
+          self.Apply(_DeleteKeyFn, components, _RmExceptionHandler,
+                     arg_checker=gslib.command.DummyArgChecker,
+                     parallel_operations_override=True)
+        except Exception, e:
+          if (e.message and ('unexpected failure in' in e.message)
+              and ('sub-processes, aborting' in e.message)):
+            # The copy was successful iff the compose call succeeded, so
+            # failing to delete some of the components is only a warning.
+            logging.warning(
+                'Failed to delete some of the following temporary objects:\n' +
+                '\n'.join(str(component) for component in components))
+          else:
+            raise e
+
+    return (time.time() - start_time, total_bytes_uploaded, result_uri)
+
+  def _CopyDaisyChainComponent(self, args):
+    """Copies the byte range [args.start_byte, args.end_byte] of a source
+       object to a temporary object, for _DoParallelDaisyChainUpload.
+
+       Args:
+         args: A PerformDaisyChainComponentUploadArgs.
+
+       Returns:
+         (elapsed_time, bytes_transferred, version-specific dst_uri).
+
+       Raises:
+         CommandException: if errors encountered.
+    """
+    download_headers = self._GetDaisyChainDownloadHeaders()
+    src_key = args.src_uri.get_key(False, download_headers)
+    if not src_key:
+      raise CommandException('"%s" does not exist.' % args.src_uri)
+    if src_key.etag != args.src_etag:
+      raise CommandException(
+          '"%s" changed during the copy. Please retry this copy.' %
+          args.src_uri)
+    fp = DaisyChainWrapper(src_key, download_headers, args.start_byte,
+                           args.end_byte)
+    try:
+      return self._PerformResumableUploadIfApplies(
+          fp, args.src_uri, args.dst_uri, args.canned_acl, args.headers,
+          fp.size, already_split=True)
+    finally:
+      fp.close()
+
+  def _CheckComposedDaisyChainHashes(self, result_uri, src_hashes):
+    """Validates an object composed by _DoParallelDaisyChainUpload against the
+       source object's CRC32C, if both are known.
+
+    Raises:
+      CommandException: if the digests don't match.
+    """
+    if 'crc32c' not in src_hashes:
+      return
+    result_key = result_uri.get_key(False,
+                                    self._GetDaisyChainDownloadHeaders())
+    cloud_hashes = getattr(result_key, 'cloud_hashes', None) or {}
+    if 'crc32c' not in cloud_hashes:
+      self.logger.debug('No CRC32C reported for composed object %s.' %
+                        result_uri)
+      return
+    self._CheckDaisyChainHashes(result_key,
+                                {'crc32c': cloud_hashes['crc32c']},
+                                src_hashes)
+
   def _ShouldDoParallelCompositeUpload(self, allow_splitting, src_key, dst_uri,
                                        file_size):
     """Returns True iff a parallel upload should be performed on the source key.
@@ -1859,6 +2605,213 @@ class CpCommand(Command):
             and file_size >= parallel_composite_upload_threshold
             and file_size >= MIN_PARALLEL_COMPOSITE_FILE_SIZE)
 
+  def _ShouldDoSlicedDownload(self, allow_splitting, src_key, dst_uri):
+    """Returns True iff a sliced download should be performed on the source key.
+
+       Args:
+         allow_splitting: If false, then this function returns false.
+         src_key: Corresponding to an object in the cloud.
+         dst_uri: Corresponding to a local file.
+    """
+    sliced_object_download_threshold = HumanReadableToBytes(boto.config.get(
+        'GSUtil', 'sliced_object_download_threshold',
+        DEFAULT_SLICED_OBJECT_DOWNLOAD_THRESHOLD))
+    size = getattr(src_key, 'size', None)
+    return (allow_splitting
+            and sliced_object_download_threshold > 0
+            and size is not None
+            and size >= sliced_object_download_threshold
+            and size >= MIN_SLICED_DOWNLOAD_OBJECT_SIZE
+            # Gzipped objects have to be decompressed as a single stream.
+            and getattr(src_key, 'content_encoding', None) != 'gzip'
+            and not self._IsSpecialFile(dst_uri)
+            # Test methods expect to perturb a single downloaded stream.
+            and not self.test_method)
+
+  def _PartitionObject(self, src_key, src_uri, dst_uri, download_file_name,
+                       headers):
+    """Partitions an object into byte ranges ("slices") to be downloaded in
+       parallel into the local file download_file_name.
+
+       Args:
+         src_key: The Key of the object to be partitioned.
+         src_uri: The StorageUri of the object to be partitioned.
+         dst_uri: The StorageUri of the destination file.
+         download_file_name: The name of the local file the slices are written
+                             to.
+         headers: The headers which are ultimately passed to boto.
+
+       Returns:
+         A list of PerformSlicedDownloadArgs, one per slice.
+    """
+    component_size = HumanReadableToBytes(boto.config.get(
+        'GSUtil', 'sliced_object_download_component_size',
+        DEFAULT_SLICED_OBJECT_DOWNLOAD_COMPONENT_SIZE))
+    max_components = boto.config.getint(
+        'GSUtil', 'sliced_object_download_max_components',
+        DEFAULT_SLICED_OBJECT_DOWNLOAD_MAX_COMPONENTS)
+    (num_components, component_size) = _GetPartitionInfo(
+        src_key.size, max_components, component_size)
+
+    slice_args = []
+    for i in range(num_components):
+      start_byte = i * component_size
+      # The last slice just gets all of the remaining bytes.
+      end_byte = min(start_byte + component_size, src_key.size) - 1
+      tracker_file = self._GetTrackerFileName(
+          dst_uri, TrackerFileType.SLICED_DOWNLOAD, component_num=i)
+      slice_args.append(PerformSlicedDownloadArgs(
+          src_uri, download_file_name, start_byte, end_byte, src_key.etag,
+          headers, tracker_file))
+    return slice_args
+
+  def _DoSlicedDownload(self, src_key, src_uri, dst_uri, headers):
+    """Downloads an object to a local file in parallel slices. A file of the
+       object's size is created up front and each slice is written to its own
+       offset by a separate call to _DownloadObjectSlice. Once all slices are
+       present, the hashes of the whole file are validated and the file is
+       renamed to its final name.
+
+       Args:
+         src_key: Source Key.
+         src_uri: Source StorageUri.
+         dst_uri: Destination StorageUri.
+         headers: The headers dictionary.
+
+       Returns:
+         (elapsed_time, bytes_transferred, dst_uri), excluding overhead like
+         initial HEAD.
+
+       Raises:
+         CommandException: if errors encountered.
+    """
+    self._LogCopyOperation(src_uri, dst_uri, headers)
+    start_time = time.time()
+    file_name = dst_uri.object_name
+    self._CreateDirForFileIfNeeded(file_name)
+    # Download to a temporary name so that a partially downloaded file (which
+    # already has its final size) is never mistaken for a complete one.
+    download_file_name = '%s_.gstmp' % file_name
+
+    # Do this before transferring any data, since it raises if the integrity
+    # of the download can't be checked as configured.
+    hash_algs = self._GetHashAlgs(src_key)
+
+    # Slices are requested as raw byte ranges; never ask the service to
+    # compress them on the fly.
+    slice_headers = headers.copy()
+    for header in slice_headers.keys():
+      if header.lower() == 'accept-encoding':
+        del slice_headers[header]
+
+    slice_args = self._PartitionObject(src_key, src_uri, dst_uri,
+                                       download_file_name, slice_headers)
+    tracker_files = [args.tracker_file for args in slice_args]
+
+    # Any state left by a non-sliced download of this file is superseded by
+    # the per-slice tracker files.
+    _DeleteTrackerFiles([self._GetTrackerFileName(dst_uri,
+                                                  TrackerFileType.DOWNLOAD)])
+
+    if (not os.path.exists(download_file_name) or
+        os.path.getsize(download_file_name) != src_key.size):
+      # There is nothing to resume, so start over with a file that already
+      # has the object's size, allowing each slice to be written in place.
+      _DeleteTrackerFiles(tracker_files)
+      with open(download_file_name, 'wb') as fp:
+        fp.truncate(src_key.size)
+
+    # In parallel, download all of the slices.
+    cp_results = self.Apply(_PerformSlicedDownloadWrapper, slice_args,
+                            _CopyExceptionHandler, ('copy_failure_count',),
+                            arg_checker=gslib.command.DummyArgChecker,
+                            parallel_operations_override=True,
+                            should_return_results=True)
+    if len(cp_results) != len(slice_args):
+      # Leave the tracker files and the partial file in place so that the
+      # next attempt can resume the slices that failed.
+      raise CommandException(
+          'Some slices of %s were not downloaded successfully. Please retry '
+          'this download.' % src_uri)
+    bytes_transferred = sum(cp_results)
+    _DeleteTrackerFiles(tracker_files)
+
+    # Verify downloaded file checksum matched source object's checksum.
+    try:
+      self._CheckHashes(src_key, download_file_name, hash_algs)
+    except CommandException:
+      os.unlink(download_file_name)
+      raise
+
+    if IS_WINDOWS and os.path.exists(file_name):
+      # os.rename doesn't overwrite existing files on Windows.
+      os.unlink(file_name)
+    os.rename(download_file_name, file_name)
+    return (time.time() - start_time, bytes_transferred, dst_uri)
+
+  def _DownloadObjectSlice(self, src_uri, download_file_name, start_byte,
+                           end_byte, etag, headers, tracker_file):
+    """Downloads the byte range [start_byte, end_byte] of an object into the
+       same range of download_file_name, resuming from the progress recorded
+       in tracker_file if possible.
+
+       Args:
+         src_uri: Source StorageUri.
+         download_file_name: The preallocated local file to write to.
+         start_byte: The first byte of the slice.
+         end_byte: The last byte of the slice (inclusive).
+         etag: The etag of the object when the download was started.
+         headers: The headers dictionary.
+         tracker_file: The path to the tracker file for this slice.
+
+       Returns:
+         The number of bytes downloaded.
+
+       Raises:
+         CommandException: if errors encountered.
+    """
+    bytes_already_downloaded = _ReadSlicedDownloadTrackerFile(tracker_file,
+                                                              etag)
+    download_start = start_byte + bytes_already_downloaded
+    if download_start > end_byte:
+      return 0
+
+    src_key = src_uri.get_key(False, headers)
+    if not src_key:
+      raise CommandException('"%s" does not exist.' % src_uri)
+    if src_key.etag != etag:
+      raise CommandException(
+          '"%s" changed during the download. Please retry this download.' %
+          src_uri)
+
+    slice_headers = headers.copy()
+    slice_headers['Range'] = 'bytes=%d-%d' % (download_start, end_byte)
+    with open(download_file_name, 'r+b') as fp:
+      fp.seek(download_start)
+
+      def _UpdateTrackerFile(bytes_downloaded, unused_total_size):
+        # Make sure the data counted in the tracker file is really on disk, so
+        # a crash can't leave the tracker file claiming bytes that were lost.
+        fp.flush()
+        os.fsync(fp.fileno())
+        _WriteSlicedDownloadTrackerFile(
+            tracker_file, etag, bytes_already_downloaded + bytes_downloaded)
+
+      # boto calls the callback once every num_cb'th part of the object's
+      # total size, so this updates the tracker file about every 2 MB.
+      num_cb = int(src_key.size / TWO_MB) + 2
+      # Hashes are validated over the whole file once all slices are done.
+      if KeyMethodAcceptsHashAlgs(src_key, 'get_file'):
+        src_key.get_file(fp, slice_headers, cb=_UpdateTrackerFile,
+                         num_cb=num_cb, hash_algs={})
+      else:
+        src_key.get_file(fp, slice_headers, cb=_UpdateTrackerFile,
+                         num_cb=num_cb)
+    # Don't leave deferred progress to be written after the trackers of the
+    # completed download are deleted.
+    GetTrackerStore().Flush()
+    return end_byte - download_start + 1
+
   def _ExpandDstUri(self, dst_uri_str):
     """
     Expands wildcard if present in dst_uri_str.
@@ -2088,10 +3041,53 @@ class CpCommand(Command):
       dst_uri = self.suri_builder.StorageUri(trans_uri_str)
     return dst_uri
 
+  def _PrefetchContentTypes(self, name_expansion_iterator):
+    """
+    Generator that detects the content types of the local files yielded by
+    name_expansion_iterator in batches, and records them in the
+    NameExpansionResults. Apply() consumes its arguments in a producer thread,
+    so detection runs ahead of the workers that upload the files, and each
+    batch is classified by a single call to the 'file' process.
+    """
+    batch = []
+    for name_expansion_result in name_expansion_iterator:
+      batch.append(name_expansion_result)
+      if len(batch) >= CONTENT_TYPE_PREFETCH_BATCH_SIZE:
+        self._DetectContentTypes(batch)
+        for result in batch:
+          yield result
+        batch = []
+    self._DetectContentTypes(batch)
+    for result in batch:
+      yield result
+
+  def _DetectContentTypes(self, name_expansion_results):
+    """Detects the content types of the local files in a batch."""
+    paths = {}
+    for name_expansion_result in name_expansion_results:
+      uri_str = name_expansion_result.GetExpandedUriStr()
+      if uri_str and uri_str.startswith('file://'):
+        path = uri_str[len('file://'):]
+        if path != '-' and os.path.isfile(path):
+          paths[name_expansion_result] = path
+    if not paths:
+      return
+    try:
+      content_types = GetContentTypeDetector(True).DetectMany(
+          set(paths.values()))
+    except CommandException, e:
+      # Leave detection (and reporting the error) to the workers.
+      self.logger.debug('Failed to prefetch content types: %s', e)
+      return
+    for name_expansion_result, path in paths.iteritems():
+      name_expansion_result.SetDetectedContentType(content_types[path])
+
   def _CopyFunc(self, name_expansion_result):
     """Worker function for performing the actual copy (and rm, for mv)."""
-    (exp_dst_uri, have_existing_dst_container) = self._ExpandDstUri(
-         self.args[-1])
+    # The destination is expanded once in RunCommand, since expanding it can
+    # require a bucket listing.
+    exp_dst_uri = self.exp_dst_uri
+    have_existing_dst_container = self.have_existing_dst_container
     if self.perform_mv:
       cmd_name = 'mv'
     else:
@@ -2161,7 +3157,12 @@ class CpCommand(Command):
       if self.use_manifest:
         self.manifest.Initialize(exp_src_uri, dst_uri)
       (elapsed_time, bytes_transferred, result_uri) = (
-          self._PerformCopy(exp_src_uri, dst_uri))
+          self._PerformCopy(
+              exp_src_uri, dst_uri, src_key_metadata=(
+                  name_expansion_result.GetExpandedKeyMetadata()),
+              detected_content_type=(
+                  name_expansion_result.GetDetectedContentType()),
+              src_file_stat=name_expansion_result.GetExpandedFileStat()))
       if self.use_manifest:
         if hasattr(dst_uri, 'md5'):
           self.manifest.Set(exp_src_uri, 'md5', dst_uri.md5)
@@ -2210,6 +3211,7 @@ class CpCommand(Command):
   # Command entry point.
   def RunCommand(self):
     self._ParseArgs()
+    ConfigureBotoBufferSizes()
 
     self.total_elapsed_time = self.total_bytes_transferred = 0
     if self.args[-1] == '-' or self.args[-1] == 'file://-':
@@ -2252,6 +3254,13 @@ class CpCommand(Command):
         self.recursion_requested or self.perform_mv,
         have_existing_dst_container=have_existing_dst_container,
         all_versions=all_versions)
+    if (self.USE_MAGICFILE and exp_dst_uri.is_cloud_uri()
+        and not (self.headers and 'content-type' in self.headers)):
+      name_expansion_iterator = self._PrefetchContentTypes(
+          name_expansion_iterator)
+    # Share the expanded destination with _CopyFunc in all worker threads and
+    # processes (each of which gets a copy of this command instance).
+    self.exp_dst_uri = exp_dst_uri
     self.have_existing_dst_container = have_existing_dst_container
 
     # Use a lock to ensure accurate statistics in the face of
@@ -2271,8 +3280,12 @@ class CpCommand(Command):
     # Perform copy requests in parallel (-m) mode, if requested, using
     # configured number of parallel processes and threads. Otherwise,
     # perform requests with sequential function calls in current process.
-    self.Apply(_CopyFuncWrapper, name_expansion_iterator,
-               _CopyExceptionHandler, shared_attrs, fail_on_error=True)
+    try:
+      self.Apply(_CopyFuncWrapper, name_expansion_iterator,
+                 _CopyExceptionHandler, shared_attrs, fail_on_error=True)
+    finally:
+      if self.use_manifest:
+        self.manifest.Close()
     self.logger.debug(
         'total_bytes_transferred: %d', self.total_bytes_transferred)
 
@@ -2308,7 +3321,11 @@ class CpCommand(Command):
 
     return 0
 
-  def _ParseArgs(self):
+  def _SetDefaultCopyOptions(self):
+    """
+    Sets the options used while copying to their defaults. Commands built on
+    cp (like rsync) call this instead of parsing cp's options.
+    """
     self.perform_mv = False
     self.exclude_symlinks = False
     self.no_clobber = False
@@ -2318,6 +3335,9 @@ class CpCommand(Command):
     self.print_ver = False
     self.use_manifest = False
 
+  def _ParseArgs(self):
+    self._SetDefaultCopyOptions()
+
     # self.recursion_requested initialized in command.py (so can be checked
     # in parent class for all commands).
     if self.sub_opts:
@@ -2483,53 +3503,38 @@ class CpCommand(Command):
 
 
 class _Manifest(object):
-  """Stores the manifest items for the CpCommand class."""
+  """
+  Stores the manifest items for the CpCommand class.
+
+  Each process appends the rows for the items it finishes to its own part
+  file next to the manifest (see _ManifestLogWriter), so processes don't
+  contend for a lock. The part files are appended to the manifest when the
+  copy finishes (see Close()), or by the next run if this one is interrupted.
+
+  Items already copied by earlier runs are looked up in a _ManifestIndex
+  rather than being loaded into memory.
+  """
 
   def __init__(self, path):
-    # self.items contains a dictionary of rows
+    # self.items contains a dictionary of rows for the items being copied by
+    # the threads of this process. Each item is set and written by a single
+    # thread, so this doesn't need to be shared with other processes.
     self.items = {}
-    self.manifest_filter = {}
-    self.lock = multiprocessing.Manager().Lock()
 
     self.manifest_path = os.path.expanduser(path)
-    self._ParseManifest()
+    _MergeManifestParts(self.manifest_path)
     self._CreateManifestFile()
-      
-  def _ParseManifest(self):
-    """
-    Load and parse a manifest file. This information will be used to skip
-    any files that have a skip or OK status.
-    """
-    try:
-      if os.path.exists(self.manifest_path):
-        with open(self.manifest_path, 'rb') as f:
-          first_row = True
-          reader = csv.reader(f)
-          for row in reader:
-            if first_row:
-              try:
-                source_index = row.index('Source')
-                result_index = row.index('Result')
-              except ValueError:
-                # No header and thus not a valid manifest file.
-                raise CommandException(
-                    'Missing headers in manifest file: %s' % self.manifest_path)
-            first_row = False
-            source = row[source_index]
-            result = row[result_index]
-            if result in ['OK', 'skip']:
-              # We're always guaranteed to take the last result of a specific
-              # source uri.
-              self.manifest_filter[source] = result
-    except IOError as ex:
-      raise CommandException('Could not parse %s' % path)
+    self.index = _ManifestIndex(self.manifest_path)
+    self.index.Update()
+    self.writer = None
+    self.writer_lock = threading.Lock()
 
   def WasSuccessful(self, src):
     """ Returns whether the specified src uri was marked as successful."""
-    return src in self.manifest_filter
+    return self.index.WasSuccessful(src)
 
   def _CreateManifestFile(self):
-    """Opens the manifest file and assigns it to the file pointer."""
+    """Creates the manifest file with a header row, if needed."""
     try:
       if ((not os.path.exists(self.manifest_path))
           or (os.stat(self.manifest_path).st_size == 0)):
@@ -2575,6 +3580,25 @@ class _Manifest(object):
     self._WriteRowToManifestFile(source_uri)
     self._RemoveItemFromManifest(source_uri)
 
+  def Close(self):
+    """
+    Appends the rows written by all processes to the manifest. Must only be
+    called from the main process, once all of the items have been copied.
+    """
+    with self.writer_lock:
+      if self.writer:
+        self.writer.Close()
+        self.writer = None
+    _MergeManifestParts(self.manifest_path)
+
+  def _GetWriter(self):
+    """Returns the _ManifestLogWriter for this process."""
+    with self.writer_lock:
+      if not self.writer or self.writer.pid != os.getpid():
+        # A writer inherited from the parent process belongs to the parent.
+        self.writer = _ManifestLogWriter(self.manifest_path)
+      return self.writer
+
   def _WriteRowToManifestFile(self, uri):
     row_item = self.items[uri]
     data = [
@@ -2588,13 +3612,7 @@ class _Manifest(object):
       str(row_item['bytes']) if 'bytes' in row_item else '',
       row_item['result'],
       row_item['description']]
-
-    # Aquire a lock to prevent multiple threads writing to the same file at
-    # the same time. This would cause a garbled mess in the manifest file.
-    with self.lock:
-      with open(self.manifest_path, 'a', 1) as f:  # 1 == line buffered
-        writer = csv.writer(f)
-        writer.writerow(data)
+    self._GetWriter().WriteRow(data)
 
   def _RemoveItemFromManifest(self, uri):
     # Remove the item from the dictionary since we're done with it and
@@ -2603,6 +3621,185 @@ class _Manifest(object):
     del self.items[uri]
 
 
+class _ManifestLogWriter(object):
+  """
+  Appends manifest rows to the part file of the current process, committing
+  the rows of concurrent threads with a single write: a thread that finds
+  another thread writing waits for it, and then writes its own row along with
+  any rows queued up in the meantime. Each row is written by the time
+  WriteRow() returns.
+  """
+
+  def __init__(self, manifest_path):
+    self.pid = os.getpid()
+    self.path = '%s.%d%s' % (manifest_path, self.pid, MANIFEST_PART_SUFFIX)
+    try:
+      self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                        0600)
+    except OSError:
+      raise CommandException('Could not create manifest file.')
+    # Protects self.pending.
+    self.pending_lock = threading.Lock()
+    # Held by the thread that's writing.
+    self.write_lock = threading.Lock()
+    self.pending = []
+
+  def WriteRow(self, data):
+    buf = StringIO.StringIO()
+    csv.writer(buf).writerow(data)
+    with self.pending_lock:
+      self.pending.append(buf.getvalue())
+    with self.write_lock:
+      with self.pending_lock:
+        rows = self.pending
+        self.pending = []
+      if rows:
+        data = ''.join(rows)
+        while data:
+          data = data[os.write(self.fd, data):]
+
+  def Close(self):
+    with self.write_lock:
+      os.close(self.fd)
+
+
+def _MergeManifestParts(manifest_path):
+  """Appends the part files written by _ManifestLogWriters to the manifest."""
+  (manifest_dir, manifest_name) = os.path.split(manifest_path)
+  part_paths = []
+  for name in os.listdir(manifest_dir or os.curdir):
+    if (name.startswith(manifest_name + '.')
+        and name.endswith(MANIFEST_PART_SUFFIX)
+        and name[len(manifest_name) + 1:-len(MANIFEST_PART_SUFFIX)].isdigit()):
+      part_paths.append(os.path.join(manifest_dir, name))
+  if not part_paths:
+    return
+  try:
+    with open(manifest_path, 'ab') as manifest_file:
+      for part_path in sorted(part_paths):
+        with open(part_path, 'rb') as part_file:
+          shutil.copyfileobj(part_file, manifest_file, MANIFEST_COPY_SIZE)
+        manifest_file.flush()
+        os.unlink(part_path)
+  except (IOError, OSError) as e:
+    raise CommandException('Could not merge manifest part files into %s: %s'
+                           % (manifest_path, e))
+
+
+class _ManifestIndex(object):
+  """
+  On-disk index of the sources that a manifest marks as successfully copied
+  (or skipped), so that a run can skip them without loading the manifest into
+  memory.
+
+  The index is a sqlite database in the directory given by
+  GetSqliteDatabaseDir() (normally the tracker directory), and records how
+  much of the manifest it covers, so each run only parses the rows appended
+  since the last one. If the manifest was replaced or truncated, the index is
+  rebuilt. If sqlite3 or that directory isn't available, the sources are
+  kept in memory.
+  """
+
+  def __init__(self, manifest_path):
+    self.manifest_path = manifest_path
+    abs_path = os.path.abspath(manifest_path)
+    database_dir = GetSqliteDatabaseDir()
+    self.use_sqlite = bool(sqlite3) and database_dir is not None
+    self.index_path = None
+    if self.use_sqlite:
+      self.index_path = os.path.join(
+          database_dir, 'manifest_index_%s.sqlite' %
+          md5(abs_path.encode('utf-8')).hexdigest())
+    self.sources = None
+    self.lock = threading.Lock()
+    self.conn = None
+    self.conn_pid = None
+
+  def _Connect(self):
+    """Returns this process's connection to the index. Must hold self.lock."""
+    if self.conn is None or self.conn_pid != os.getpid():
+      # sqlite connections mustn't be used by more than one process.
+      self.conn = sqlite3.connect(self.index_path, check_same_thread=False)
+      self.conn_pid = os.getpid()
+    return self.conn
+
+  def WasSuccessful(self, src):
+    if self.sources is not None:
+      return src in self.sources
+    with self.lock:
+      return self._Connect().execute(
+          'SELECT 1 FROM succeeded WHERE source = ?',
+          (sqlite3.Binary(src),)).fetchone() is not None
+
+  def Update(self):
+    """Indexes the rows appended to the manifest since the last update."""
+    if not self.use_sqlite:
+      self.sources = set()
+      self._Parse(0, None, None, self.sources.update)
+      return
+    stat_result = os.stat(self.manifest_path)
+    identity = '%d:%d' % (stat_result.st_dev, stat_result.st_ino)
+    with self.lock:
+      conn = self._Connect()
+      conn.execute('CREATE TABLE IF NOT EXISTS succeeded '
+                   '(source TEXT PRIMARY KEY)')
+      conn.execute('CREATE TABLE IF NOT EXISTS state (identity TEXT, '
+                   'offset INTEGER, source_index INTEGER, '
+                   'result_index INTEGER)')
+      row = conn.execute('SELECT identity, offset, source_index, result_index '
+                         'FROM state').fetchone()
+      if row and row[0] == identity and row[1] <= stat_result.st_size:
+        (offset, source_index, result_index) = row[1:]
+      else:
+        conn.execute('DELETE FROM succeeded')
+        (offset, source_index, result_index) = (0, None, None)
+
+      def _AddSources(sources):
+        conn.executemany('INSERT OR IGNORE INTO succeeded VALUES (?)',
+                         ((sqlite3.Binary(source),) for source in sources))
+      (offset, source_index, result_index) = self._Parse(
+          offset, source_index, result_index, _AddSources)
+      conn.execute('DELETE FROM state')
+      conn.execute('INSERT INTO state VALUES (?, ?, ?, ?)',
+                   (identity, offset, source_index, result_index))
+      conn.commit()
+
+  def _Parse(self, offset, source_index, result_index, add_sources):
+    """
+    Parses the manifest from offset (which must be the start of a row) to the
+    end, passing the successful sources to add_sources in batches.
+
+    Returns:
+      (offset of the end of the manifest, source_index, result_index).
+    """
+    try:
+      with open(self.manifest_path, 'rb') as f:
+        end_offset = os.fstat(f.fileno()).st_size
+        f.seek(offset)
+        reader = csv.reader(f)
+        if offset == 0:
+          try:
+            header = reader.next()
+            source_index = header.index('Source')
+            result_index = header.index('Result')
+          except (StopIteration, ValueError):
+            # No header and thus not a valid manifest file.
+            raise CommandException(
+                'Missing headers in manifest file: %s' % self.manifest_path)
+        sources = []
+        min_row_length = max(source_index, result_index) + 1
+        for row in reader:
+          if len(row) >= min_row_length and row[result_index] in ['OK', 'skip']:
+            sources.append(row[source_index])
+            if len(sources) >= MANIFEST_INDEX_BATCH_SIZE:
+              add_sources(sources)
+              sources = []
+        add_sources(sources)
+    except IOError as ex:
+      raise CommandException('Could not parse %s' % self.manifest_path)
+    return (end_offset, source_index, result_index)
+
+
 class ItemExistsError(Exception):
   """Exception class for objects that are skipped because they already exist."""
   pass
@@ -2694,6 +3891,43 @@ def _GetPartitionInfo(file_size, max_components, default_component_size):
   component_size = _DivideAndCeil(file_size, num_components)
   return (num_components, component_size)
 
+def _ReadSlicedDownloadTrackerFile(tracker_file, etag):
+  """Returns the number of bytes of a slice that a previous sliced download
+     already wrote to disk, or 0 if there is no usable tracker file.
+
+  Args:
+    tracker_file: The name of the tracker for the slice.
+    etag: The etag of the object being downloaded. Trackers written for a
+          different version of the object are ignored.
+  """
+  contents = GetTrackerStore().Get(tracker_file)
+  if contents is None:
+    return 0
+  lines = contents.splitlines()
+  if len(lines) != 2 or lines[0] != etag:
+    return 0
+  try:
+    return int(lines[1])
+  except ValueError:
+    return 0
+
+def _WriteSlicedDownloadTrackerFile(tracker_file, etag, bytes_downloaded):
+  """Records that the first bytes_downloaded bytes of a slice are on disk.
+
+  Args:
+    tracker_file: The name of the tracker for the slice.
+    etag: The etag of the object being downloaded.
+    bytes_downloaded: The number of bytes of the slice written so far.
+  """
+  # Progress that isn't recorded is just downloaded again, so the write can be
+  # batched with others.
+  GetTrackerStore().PutDeferred(tracker_file,
+                                '%s\n%d\n' % (etag, bytes_downloaded))
+
+def _DeleteTrackerFiles(tracker_files):
+  """Deletes each of the given trackers, if it exists."""
+  GetTrackerStore().Delete(tracker_files)
+
 def _DeleteKeyFn(cls, key):
   """Wrapper function to be used with command.Apply()."""
   return key.delete_key()
@@ -2715,23 +3949,15 @@ def _ParseParallelUploadTrackerFile(tracker_file, tracker_file_lock):
                          the set of files that have already been uploaded.
   """
   existing_objects = []
-  try:
-    with tracker_file_lock:
-      f = open(tracker_file, 'r')
-      lines = f.readlines()
-      lines = [line.strip() for line in lines]
-      f.close()
-  except IOError as e:
-    # We can't read the tracker file, so generate a new random prefix.
+  with tracker_file_lock:
+    contents = GetTrackerStore().Get(tracker_file)
+  if contents:
+    lines = [line.strip() for line in contents.splitlines()]
+  else:
+    # There is no tracker (the first time an upload is attempted on a file),
+    # or it can't be read, so generate a new random prefix.
     lines = [str(random.randint(1, (10 ** 10) - 1))]
 
-    # Ignore non-existent file (happens first time an upload
-    # is attempted on a file), but warn user for other errors.
-    if e.errno != errno.ENOENT:
-      # Will restart because we failed to read in the file.
-      print('Couldn\'t read parallel upload tracker file (%s): %s. '
-            'Restarting upload from scratch.' % (tracker_file, e.strerror))
-
   # The first line contains the randomly-generated prefix.
   random_prefix = lines[0]
 
@@ -2757,10 +3983,9 @@ def _AppendComponentTrackerToParallelUploadTrackerFile(tracker_file, component,
      existing tracker file, following the format described in
      _CreateParallelUploadTrackerFile."""
   lines = _GetParallelUploadTrackerFileLinesForComponents([component])
-  lines = [line + '\n' for line in lines]
   with tracker_file_lock:
-    with open(tracker_file, 'a') as f:
-      f.writelines(lines)
+    GetTrackerStore().Append(tracker_file,
+                             ''.join(line + '\n' for line in lines))
 
 def _CreateParallelUploadTrackerFile(tracker_file, random_prefix, components,
                                      tracker_file_lock):
@@ -2778,18 +4003,16 @@ def _CreateParallelUploadTrackerFile(tracker_file, random_prefix, components,
      where N is the number of components that have been successfully uploaded.
 
      Args:
-       tracker_file: The name of the parallel upload tracker file.
+       tracker_file: The name of the parallel upload tracker.
        random_prefix: The randomly-generated prefix that was used for
                       for uploading any existing components.
        components: A list of ObjectFromTracker objects that were uploaded.
   """
   lines = [random_prefix]
   lines += _GetParallelUploadTrackerFileLinesForComponents(components)
-  lines = [line + '\n' for line in lines]
   with tracker_file_lock:
-    open(tracker_file, 'w').close()  # Clear the file.
-    with open(tracker_file, 'w') as f:
-      f.writelines(lines)
+    GetTrackerStore().Put(tracker_file,
+                          ''.join(line + '\n' for line in lines))
 
 def _GetParallelUploadTrackerFileLinesForComponents(components):
   """Return a list of the lines that should appear in the parallel composite
@@ -2805,7 +4028,7 @@ def _GetParallelUploadTrackerFileLinesForComponents(components):
   return lines
 
 def FilterExistingComponents(dst_args, existing_components,
-                             bucket_name, suri_builder):
+                             bucket_name, suri_builder, command=None):
   """Given the list of all target objects based on partitioning the file and
      the list of objects that have already been uploaded successfully,
      this function determines which objects should be uploaded, which
@@ -2818,6 +4041,9 @@ def FilterExistingComponents(dst_args, existing_components,
        existing_components: A list of ObjectFromTracker objects that have been
                             uploaded in the past.
        bucket_name: The name of the bucket in which the components exist.
+       suri_builder: StorageUriBuilder used to form URIs in the bucket.
+       command: If specified, the Command whose Apply() is used to hash the
+                file parts in parallel. Otherwise they're hashed sequentially.
 
      Returns:
        components_to_upload: List of components that need to be uploaded.
@@ -2829,21 +4055,22 @@ def FilterExistingComponents(dst_args, existing_components,
                                    therefore should be deleted.
   """
   components_to_upload = []
-  existing_component_names = [component.object_name
-                              for component in existing_components]
+  existing_component_names = set(component.object_name
+                                 for component in existing_components)
   for component_name in dst_args:
     if not (component_name in existing_component_names):
       components_to_upload.append(dst_args[component_name])
 
-  objects_already_chosen = []
+  objects_already_chosen = set()
 
   # Don't reuse any temporary components whose MD5 doesn't match the current
   # MD5 of the corresponding part of the file. If the bucket is versioned,
   # also make sure that we delete the existing temporary version.
   existing_objects_to_delete = []
   uploaded_components = []
+  components_to_check = []
   for tracker_object in existing_components:
-    if ((not tracker_object.object_name in dst_args.keys())
+    if ((not tracker_object.object_name in dst_args)
         or tracker_object.object_name in objects_already_chosen):
       # This could happen if the component size has changed. This also serves
       # to handle object names that get duplicated in the tracker file due
@@ -2854,24 +4081,33 @@ def FilterExistingComponents(dst_args, existing_components,
       uri.generation = tracker_object.generation
       existing_objects_to_delete.append(uri)
       continue
+    components_to_check.append(tracker_object)
+    objects_already_chosen.add(tracker_object.object_name)
+
+  dst_args_to_check = [dst_args[tracker_object.object_name]
+                       for tracker_object in components_to_check]
+  etags = _ListComponentEtags(dst_args_to_check, bucket_name, suri_builder)
+  # Only hash the file parts whose components still exist.
+  dst_args_to_hash = [dst_arg for dst_arg in dst_args_to_check
+                      if _GetComponentName(dst_arg) in etags]
+  if command:
+    md5_results = command.Apply(_CalculateComponentMd5, dst_args_to_hash,
+                                _ComponentMd5ExceptionHandler,
+                                arg_checker=gslib.command.DummyArgChecker,
+                                parallel_operations_override=True,
+                                should_return_results=True)
+  else:
+    md5_results = [_CalculateComponentMd5(None, dst_arg)
+                   for dst_arg in dst_args_to_hash]
+  content_md5s = dict(md5_results)
 
+  for tracker_object in components_to_check:
     dst_arg = dst_args[tracker_object.object_name]
-    file_part = FilePart(dst_arg.filename, dst_arg.file_start,
-                         dst_arg.file_length)
-    # TODO: calculate MD5's in parallel when possible.
-    content_md5 = _CalculateMd5FromContents(file_part)
-
-    try:
-      # Get the MD5 of the currently-existing component.
-      blr = BucketListingRef(dst_arg.dst_uri)
-      etag = blr.GetKey().etag
-    except Exception as e:
-      # We don't actually care what went wrong - we couldn't retrieve the
-      # object to check the MD5, so just upload it again.
-      etag = None
-    if etag != (('"%s"') % content_md5):
+    etag = etags.get(_GetComponentName(dst_arg))
+    content_md5 = content_md5s.get(
+        (dst_arg.filename, dst_arg.file_start, dst_arg.file_length))
+    if not content_md5 or etag != (('"%s"') % content_md5):
       components_to_upload.append(dst_arg)
-      objects_already_chosen.append(tracker_object.object_name)
       if tracker_object.generation:
         # If the old object doesn't have a generation (i.e., it isn't in a
         # versioned bucket), then we will just overwrite it anyway.
@@ -2882,7 +4118,6 @@ def FilterExistingComponents(dst_args, existing_components,
       uri = copy.deepcopy(dst_arg.dst_uri)
       uri.generation = tracker_object.generation
       uploaded_components.append(uri)
-      objects_already_chosen.append(tracker_object.object_name)
 
   if uploaded_components:
     logging.info(("Found %d existing temporary components to reuse.")
@@ -2891,22 +4126,60 @@ def FilterExistingComponents(dst_args, existing_components,
   return (components_to_upload, uploaded_components,
           existing_objects_to_delete)
 
-def MakeGsUri(bucket, filename, suri_builder):
-  """Returns a StorageUri for an object in GCS."""
-  return suri_builder.StorageUri(bucket + '/' + filename)
+def _GetComponentName(dst_arg):
+  """Returns the object name of a component's destination, or None."""
+  return getattr(dst_arg.dst_uri, 'object_name', None)
 
-def _CalculateMd5FromContents(file):
-  """Calculates the MD5 hash of the contents of a file.
+def _ListComponentEtags(dst_args, bucket_name, suri_builder):
+  """Fetches the ETags of existing temporary components with a single listing
+     of the longest prefix their names share, rather than a GET per component.
 
      Args:
-       file: An already-open file object.
+       dst_args: The PerformResumableUploadIfAppliesArgs of the components.
+       bucket_name: The name of the bucket in which the components exist.
+       suri_builder: StorageUriBuilder used to form the bucket URI.
+
+     Returns:
+       A dictionary mapping the names of the components that exist to their
+       ETags.
+  """
+  names = set(_GetComponentName(dst_arg) for dst_arg in dst_args)
+  names.discard(None)
+  if not names:
+    return {}
+  if not bucket_name.startswith('gs://'):
+    bucket_name = 'gs://' + bucket_name
+  etags = {}
+  try:
+    bucket_uri = suri_builder.StorageUri(bucket_name)
+    for key in bucket_uri.list_bucket(prefix=os.path.commonprefix(list(names))):
+      if key.name in names:
+        etags[key.name] = key.etag
+  except Exception as e:
+    # We don't actually care what went wrong - we couldn't list the objects to
+    # check their MD5s, so just upload them again.
+    logging.debug('Failed to list temporary components: %s', e)
+    return {}
+  return etags
+
+def _CalculateComponentMd5(cls, dst_arg):
+  """Calculates the MD5 of the file part corresponding to a component. This was
+     designed for use with command.Apply().
+
+     Returns:
+       ((filename, file_start, file_length), hex MD5 of the file part).
   """
-  current_md5 = md5()
-  file.seek(0)
-  while True:
-    data = file.read(8192)
-    if not data:
-      break
-    current_md5.update(data)
-  file.seek(0)
-  return current_md5.hexdigest()
+  content_md5 = binascii.b2a_hex(GetFileHashes(
+      dst_arg.filename, {'md5': md5}, dst_arg.file_start,
+      dst_arg.file_length)['md5'])
+  return ((dst_arg.filename, dst_arg.file_start, dst_arg.file_length),
+          content_md5)
+
+def _ComponentMd5ExceptionHandler(cls, e):
+  """Exception handler for _CalculateComponentMd5. A component whose file part
+     can't be hashed is simply uploaded again."""
+  cls.logger.debug('Failed to hash temporary component: %s', e)
+
+def MakeGsUri(bucket, filename, suri_builder):
+  """Returns a StorageUri for an object in GCS."""
+  return suri_builder.StorageUri(bucket + '/' + filename)
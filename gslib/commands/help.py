@@ -26,6 +26,7 @@ from gslib.command import Command
 from gslib.command import COMMAND_NAME
 from gslib.command import COMMAND_NAME_ALIASES
 from gslib.command import FILE_URIS_OK
+from gslib.command import GetCommandClasses
 from gslib.command import MAX_ARGS
 from gslib.command import MIN_ARGS
 from gslib.command import OLD_ALIAS_MAP
@@ -260,7 +261,7 @@ class HelpCommand(Command):
       help_type_map[s] = []
     # Only include HelpProvider subclasses in the dict.
     for help_prov in itertools.chain(
-        HelpProvider.__subclasses__(), Command.__subclasses__()):
+        HelpProvider.__subclasses__(), GetCommandClasses()):
       if help_prov is Command:
         # Skip the Command base class itself; we just want its subclasses,
         # where the help command text lives (in addition to non-Command
@@ -0,0 +1,537 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Get the system stat module, not our local stat command module.
+from __future__ import absolute_import
+
+import binascii
+import calendar
+import os
+import re
+import stat
+import time
+
+try:
+  from hashlib import md5
+except ImportError:
+  from md5 import md5
+
+from collections import namedtuple
+from gslib.command import COMMAND_NAME
+from gslib.command import COMMAND_NAME_ALIASES
+from gslib.command import DummyArgChecker
+from gslib.command import FILE_URIS_OK
+from gslib.command import MAX_ARGS
+from gslib.command import MIN_ARGS
+from gslib.command import PROVIDER_URIS_OK
+from gslib.command import SUPPORTED_SUB_ARGS
+from gslib.command import URIS_START_ARG
+from gslib.commands.cp import _CopyExceptionHandler
+from gslib.commands.cp import CpCommand
+from gslib.exception import CommandException
+from gslib.help_provider import HELP_NAME
+from gslib.help_provider import HELP_NAME_ALIASES
+from gslib.help_provider import HELP_ONE_LINE_SUMMARY
+from gslib.help_provider import HELP_TEXT
+from gslib.help_provider import HelpType
+from gslib.help_provider import HELP_TYPE
+from gslib.local_hash_cache import GetFileHashes
+from gslib.transfer_buffer import ConfigureBotoBufferSizes
+from gslib.util import CreateLock
+from gslib.wildcard_iterator import ContainsWildcard
+from gslib.wildcard_iterator import wildcard_iterator
+
+_detailed_help_text = ("""
+<B>SYNOPSIS</B>
+  gsutil rsync [-c] [-d] [-n] [-R] [-a canned_acl] [-p] [-z ext,...]
+      src_uri dst_uri
+
+
+<B>DESCRIPTION</B>
+  The gsutil rsync command makes the contents of dst_uri the same as the
+  contents of src_uri, by copying only the files/objects that are missing or
+  differ (and, with the -d option, deleting the ones that don't exist at the
+  source). src_uri and dst_uri can each name a local directory, a bucket, or a
+  bucket subdirectory. For example, to make gs://my_bucket/data mirror the
+  local directory tree data you could do:
+
+    gsutil -m rsync -R data gs://my_bucket/data
+
+  Running the same command again copies only the files that were added or
+  changed since the last run, so it's much faster than re-running gsutil cp.
+  You can also synchronize in the other direction, or between buckets:
+
+    gsutil -m rsync -R gs://my_bucket/data data
+    gsutil -m rsync -d -R gs://my_bucket gs://my_backup_bucket
+
+
+<B>HOW CHANGES ARE DETECTED</B>
+  The rsync command lists the source and the destination in sorted order and
+  walks the two listings side by side, so it only needs to hold a small part
+  of either listing in memory, no matter how many files/objects there are. A
+  file/object that exists at both the source and the destination is copied
+  if:
+
+    - the sizes differ, or
+    - the MD5 hashes of both are available from the listings (which is the
+      case for most objects) and differ, or
+    - otherwise, the source was modified more recently than the destination.
+
+  Because comparing modification times can miss changes (for example, a file
+  whose modification time was preserved while its contents changed, with the
+  same size), you can use the -c option to compare checksums instead: rsync
+  then computes the MD5 hash of any local file whose size matches the other
+  side, which is slower because it needs to read those files.
+
+  Objects whose names end with "/" or "_$folder$" (which some tools use to
+  represent directories) are ignored. Symbolic links to directories are not
+  followed.
+
+
+<B>OPTIONS</B>
+  -a canned_acl  Sets named canned_acl when uploaded objects created. See
+                 'gsutil help acls' for further details.
+
+  -c            Compare checksums (rather than modification times) of
+                files/objects whose sizes match.
+
+  -d            Delete extra files/objects at the destination that don't
+                exist at the source. Use this option with care: for example,
+                running "gsutil rsync -d -R dir gs://my_bucket" with the wrong
+                directory will delete most of the objects in the bucket. You
+                may want to run the command with -n first.
+
+  -n            Dry run: print what would be copied or deleted, without
+                actually copying or deleting anything.
+
+  -p            Causes ACLs to be preserved when synchronizing in the cloud.
+                See the -p option of "gsutil help cp" for details.
+
+  -R, -r        Synchronize the directories/subdirectories recursively. By
+                default only the files/objects at the top level of src_uri
+                are synchronized.
+
+  -z ext,...    Compresses files with the given extensions when uploading
+                them. See the -z option of "gsutil help cp" for details.
+""")
+
+RSYNC_SUB_ARGS = 'a:cdnpRrz:'
+
+# Suffix some tools use for objects that represent directories.
+_FOLDER_PLACEHOLDER_SUFFIX = '_$folder$'
+
+# This tuple describes one file/object in a sorted listing. name is the
+# UTF-8 encoded path of the file/object relative to the listed directory,
+# using '/' as separator. md5 is the hex MD5 hash of the contents if it's
+# known without reading the contents, and key_metadata is the object
+# metadata from the bucket listing (see
+# BucketListingRef.GetListedKeyMetadata()), for objects.
+ListingEntry = namedtuple('ListingEntry', 'name size mtime md5 key_metadata')
+
+# This tuple is used only to encapsulate the arguments of one operation
+# performed by _RsyncFunc, so that the arguments fit the model of
+# command.Apply().
+RsyncTask = namedtuple(
+    'RsyncTask', 'op src_uri_str dst_uri_str src_key_metadata src_md5 dst_md5')
+
+
+class RsyncOp(object):
+  # Copy the source to the destination.
+  COPY = 'copy'
+  # Copy the source to the destination if their checksums differ.
+  CHECKSUM = 'checksum'
+  # Delete the destination.
+  DELETE = 'delete'
+
+
+def _RsyncFuncWrapper(cls, args):
+  cls._RsyncFunc(args)
+
+
+class RsyncCommand(CpCommand):
+  """
+  Implementation of gsutil rsync command.
+
+  RsyncCommand subclasses CpCommand so that it copies files/objects exactly
+  like gsutil cp does, but rather than copying everything that names expand
+  to, it feeds Apply only the differences found by a merge-join of sorted
+  source and destination listings.
+  """
+
+  # Command specification (processed by parent class).
+  command_spec = {
+    # Name of command.
+    COMMAND_NAME : 'rsync',
+    # List of command name aliases.
+    COMMAND_NAME_ALIASES : ['sync'],
+    # Min number of args required by this command.
+    MIN_ARGS : 2,
+    # Max number of args required by this command, or NO_MAX.
+    MAX_ARGS : 2,
+    # Getopt-style string specifying acceptable sub args.
+    SUPPORTED_SUB_ARGS : RSYNC_SUB_ARGS,
+    # True if file URIs acceptable for this command.
+    FILE_URIS_OK : True,
+    # True if provider-only URIs acceptable for this command.
+    PROVIDER_URIS_OK : False,
+    # Index in args of first URI arg.
+    URIS_START_ARG : 0,
+  }
+  help_spec = {
+    # Name of command or auxiliary help info for which this help applies.
+    HELP_NAME : 'rsync',
+    # List of help name aliases.
+    HELP_NAME_ALIASES : ['sync'],
+    # Type of help:
+    HELP_TYPE : HelpType.COMMAND_HELP,
+    # One line summary of this help.
+    HELP_ONE_LINE_SUMMARY : 'Synchronize content of two directories/buckets',
+    # The full help text.
+    HELP_TEXT : _detailed_help_text,
+  }
+
+  def _RsyncFunc(self, task):
+    """Worker function for performing one copy or delete."""
+    if task.op == RsyncOp.DELETE:
+      if self.dry_run:
+        self.logger.info('Would remove %s', task.dst_uri_str)
+        return
+      self.logger.info('Removing %s...', task.dst_uri_str)
+      dst_uri = self.suri_builder.StorageUri(task.dst_uri_str)
+      if dst_uri.is_file_uri():
+        os.unlink(dst_uri.object_name)
+      else:
+        dst_uri.delete_key(validate=False, headers=self.headers)
+      return
+
+    if task.op == RsyncOp.CHECKSUM:
+      src_md5 = task.src_md5 or self._CalculateLocalMd5(task.src_uri_str)
+      dst_md5 = task.dst_md5 or self._CalculateLocalMd5(task.dst_uri_str)
+      if src_md5 and src_md5 == dst_md5:
+        return
+
+    if self.dry_run:
+      self.logger.info('Would copy %s to %s', task.src_uri_str,
+                       task.dst_uri_str)
+      return
+    src_uri = self.suri_builder.StorageUri(task.src_uri_str)
+    dst_uri = self.suri_builder.StorageUri(task.dst_uri_str)
+    if dst_uri.is_file_uri():
+      self._CreateDirForFileIfNeeded(dst_uri.object_name)
+    (elapsed_time, bytes_transferred, unused_result_uri) = self._PerformCopy(
+        src_uri, dst_uri, src_key_metadata=task.src_key_metadata)
+    with self.stats_lock:
+      self.total_elapsed_time += elapsed_time
+      self.total_bytes_transferred += bytes_transferred
+
+  def _CalculateLocalMd5(self, uri_str):
+    """Returns the hex MD5 of a local file, or None for cloud URIs."""
+    uri = self.suri_builder.StorageUri(uri_str)
+    if not uri.is_file_uri():
+      return None
+    return binascii.b2a_hex(
+        GetFileHashes(uri.object_name, {'md5': md5})['md5'])
+
+  def _IterListing(self, uri):
+    """Returns an iterator over the sorted listing of a directory/bucket."""
+    if uri.is_file_uri():
+      return _IterSortedLocalFiles(uri.object_name, self.recursion_requested)
+    return _IterSortedCloudObjects(
+        uri, self.recursion_requested, self.proj_id_handler,
+        self.bucket_storage_uri_class, self.headers, self.debug)
+
+  def _IterRsyncTasks(self, src_uri, dst_uri):
+    """
+    Merge-joins the sorted source and destination listings, yielding an
+    RsyncTask for each file/object that needs to be copied or deleted.
+    """
+    for (name, src_entry, dst_entry) in _MergeSortedListings(
+        _CheckSorted(self._IterListing(src_uri), src_uri),
+        _CheckSorted(self._IterListing(dst_uri), dst_uri)):
+      dst_uri_str = _MakeUriStr(dst_uri, name)
+      if src_entry is None:
+        if self.delete_extras:
+          yield RsyncTask(RsyncOp.DELETE, None, dst_uri_str, None, None, None)
+        continue
+      if dst_entry is None:
+        op = RsyncOp.COPY
+      else:
+        op = _ComputeRsyncOp(src_entry, dst_entry, self.compute_checksums)
+      if op:
+        yield RsyncTask(op, _MakeUriStr(src_uri, name), dst_uri_str,
+                        src_entry.key_metadata, src_entry.md5,
+                        dst_entry and dst_entry.md5)
+
+  def _CheckRsyncUri(self, uri, is_src):
+    if ContainsWildcard(uri):
+      raise CommandException('The rsync command does not support wildcards '
+                             '(%s).' % uri)
+    if uri.names_provider():
+      raise CommandException('The rsync command does not allow provider-only '
+                             'URIs (%s).' % uri)
+    if uri.is_file_uri():
+      if is_src and not os.path.isdir(uri.object_name):
+        raise CommandException('"%s" is not a directory.' % uri)
+      if not is_src and os.path.exists(uri.object_name) and (
+          not os.path.isdir(uri.object_name)):
+        raise CommandException('"%s" is not a directory.' % uri)
+    elif uri.is_version_specific:
+      raise CommandException('The rsync command does not support '
+                             'version-specific URIs (%s).' % uri)
+
+  # Command entry point.
+  def RunCommand(self):
+    self._ParseArgs()
+    ConfigureBotoBufferSizes()
+    src_uri = self.suri_builder.StorageUri(self.args[0])
+    dst_uri = self.suri_builder.StorageUri(self.args[1])
+    self._CheckRsyncUri(src_uri, True)
+    self._CheckRsyncUri(dst_uri, False)
+    if _MakeUriStr(src_uri, '') == _MakeUriStr(dst_uri, ''):
+      raise CommandException('rsync: "%s" and "%s" are the same - abort.' %
+                             (src_uri, dst_uri))
+
+    # Use a lock to ensure accurate statistics in the face of
+    # multi-threading/multi-processing.
+    self.stats_lock = CreateLock()
+    self.total_elapsed_time = self.total_bytes_transferred = 0
+    # Tracks if any copies failed.
+    self.copy_failure_count = 0
+    # Tuple of attributes to share/manage across multiple processes in
+    # parallel (-m) mode.
+    shared_attrs = ('copy_failure_count', 'total_bytes_transferred')
+
+    # The task iterator is consumed lazily by Apply, so neither listing is
+    # ever held in memory in full.
+    self.Apply(_RsyncFuncWrapper, self._IterRsyncTasks(src_uri, dst_uri),
+               _CopyExceptionHandler, shared_attrs,
+               arg_checker=DummyArgChecker, fail_on_error=True)
+    self.logger.debug(
+        'total_bytes_transferred: %d', self.total_bytes_transferred)
+
+    if self.copy_failure_count:
+      plural_str = ''
+      if self.copy_failure_count > 1:
+        plural_str = 's'
+      raise CommandException('%d file%s/object%s could not be transferred.' % (
+                             self.copy_failure_count, plural_str, plural_str))
+    return 0
+
+  def _ParseArgs(self):
+    self._SetDefaultCopyOptions()
+    self.compute_checksums = False
+    self.delete_extras = False
+    self.dry_run = False
+    self.recursion_requested = False
+    if self.sub_opts:
+      for o, unused_a in self.sub_opts:
+        if o == '-c':
+          self.compute_checksums = True
+        elif o == '-d':
+          self.delete_extras = True
+        elif o == '-n':
+          self.dry_run = True
+        elif o == '-r' or o == '-R':
+          self.recursion_requested = True
+        # -a, -p and -z are handled while copying, as they are for cp.
+
+
+def _MakeUriStr(base_uri, name):
+  """
+  Returns the URI string for the file/object called name (as in ListingEntry)
+  under the directory/bucket base_uri.
+  """
+  if base_uri.is_file_uri():
+    path = base_uri.object_name
+    if name:
+      path = os.path.join(path, *name.split('/'))
+    return 'file://%s' % path
+  return '%s://%s/%s%s' % (base_uri.scheme, base_uri.bucket_name,
+                           _GetObjectNamePrefix(base_uri), name)
+
+
+def _GetObjectNamePrefix(base_uri):
+  """
+  Returns the UTF-8 encoded prefix shared by the names of all objects under
+  the bucket/subdirectory base_uri.
+  """
+  prefix = base_uri.object_name or ''
+  if isinstance(prefix, unicode):
+    prefix = prefix.encode('utf-8')
+  if prefix and not prefix.endswith('/'):
+    prefix += '/'
+  return prefix
+
+
+def _ListDirSorted(dir_path, rel_prefix):
+  """
+  Lists the regular files and directories in dir_path, in the order in which
+  their paths sort (a directory 'a' sorts as 'a/', ahead of any file 'a0'
+  and after 'a.txt', so that the files it contains can be listed in place).
+
+  Returns:
+    List of (rel_name, path, is_dir, stat_result) tuples.
+  """
+  entries = []
+  for name in os.listdir(dir_path):
+    path = os.path.join(dir_path, name)
+    try:
+      st = os.lstat(path)
+      if stat.S_ISLNK(st.st_mode):
+        # Follow links to files, but not to directories, like os.walk.
+        st = os.stat(path)
+        if stat.S_ISDIR(st.st_mode):
+          continue
+    except OSError:
+      # The file was removed while listing, or is a broken link.
+      continue
+    is_dir = stat.S_ISDIR(st.st_mode)
+    if not is_dir and not stat.S_ISREG(st.st_mode):
+      continue
+    entries.append((rel_prefix + name, path, is_dir, st))
+  entries.sort(key=lambda entry: entry[0] + '/' if entry[2] else entry[0])
+  return entries
+
+
+def _IterSortedLocalFiles(base_dir, recurse):
+  """
+  Yields a ListingEntry for each file under base_dir, sorted by name. Only one
+  directory per level of the tree is listed in memory at a time.
+  """
+  stack = [iter(_ListDirSorted(base_dir, ''))]
+  while stack:
+    try:
+      (rel_name, path, is_dir, st) = stack[-1].next()
+    except StopIteration:
+      stack.pop()
+      continue
+    if is_dir:
+      if recurse:
+        stack.append(iter(_ListDirSorted(path, rel_name + '/')))
+    else:
+      yield ListingEntry(rel_name, st.st_size, st.st_mtime, None, None)
+
+
+def _IterSortedCloudObjects(base_uri, recurse, proj_id_handler,
+                            bucket_storage_uri_class, headers, debug):
+  """
+  Yields a ListingEntry for each object under base_uri, in the order in which
+  the bucket listing returns them (which is sorted by UTF-8 encoded name). The
+  entries are built from the bucket listing alone, without HEAD requests.
+  """
+  prefix_len = len(_GetObjectNamePrefix(base_uri))
+  wildcard = _MakeUriStr(base_uri, '**' if recurse else '*')
+  for blr in wildcard_iterator(
+      wildcard, proj_id_handler,
+      bucket_storage_uri_class=bucket_storage_uri_class, headers=headers,
+      debug=debug):
+    if not blr.HasKey():
+      # Prefix (subdirectory) of a non-recursive listing.
+      continue
+    name = blr.GetKey().name
+    if isinstance(name, unicode):
+      name = name.encode('utf-8')
+    name = name[prefix_len:]
+    if (not name or name.endswith('/')
+        or name.endswith(_FOLDER_PLACEHOLDER_SUFFIX)):
+      continue
+    key_metadata = blr.GetListedKeyMetadata()
+    yield ListingEntry(name, key_metadata.get('size'),
+                       _ParseLastModified(key_metadata.get('last_modified')),
+                       _GetListedMd5(key_metadata), key_metadata)
+
+
+def _ParseLastModified(last_modified):
+  """Converts an ISO 8601 listing timestamp to seconds since the epoch."""
+  if not last_modified:
+    return None
+  return calendar.timegm(time.strptime(last_modified[:19],
+                                       '%Y-%m-%dT%H:%M:%S'))
+
+
+def _GetListedMd5(key_metadata):
+  """Returns the hex MD5 from listed object metadata, or None if unknown."""
+  possible_md5 = key_metadata.get('etag', '').strip('"\'').lower()
+  if re.match(r'^[0-9a-f]{32}$', possible_md5):
+    return possible_md5
+  cloud_hashes = key_metadata.get('cloud_hashes') or {}
+  if 'md5' in cloud_hashes:
+    return binascii.b2a_hex(cloud_hashes['md5'])
+  return None
+
+
+def _CheckSorted(listing, uri):
+  """
+  Passes through the entries of listing, raising CommandException if they
+  aren't strictly sorted by name (which the merge-join depends on).
+  """
+  prev_name = None
+  for entry in listing:
+    if prev_name is not None and entry.name <= prev_name:
+      raise CommandException(
+          'The listing of %s is not sorted ("%s" was listed after "%s").' %
+          (uri, entry.name, prev_name))
+    prev_name = entry.name
+    yield entry
+
+
+def _MergeSortedListings(src_listing, dst_listing):
+  """
+  Merge-joins two listings sorted by name.
+
+  Yields:
+    (name, src_entry, dst_entry) for each name in either listing, in sorted
+    order, where the entry for a name missing from one listing is None.
+  """
+  src_listing = iter(src_listing)
+  dst_listing = iter(dst_listing)
+  src_entry = next(src_listing, None)
+  dst_entry = next(dst_listing, None)
+  while src_entry is not None or dst_entry is not None:
+    if dst_entry is None or (
+        src_entry is not None and src_entry.name < dst_entry.name):
+      yield (src_entry.name, src_entry, None)
+      src_entry = next(src_listing, None)
+    elif src_entry is None or dst_entry.name < src_entry.name:
+      yield (dst_entry.name, None, dst_entry)
+      dst_entry = next(dst_listing, None)
+    else:
+      yield (src_entry.name, src_entry, dst_entry)
+      src_entry = next(src_listing, None)
+      dst_entry = next(dst_listing, None)
+
+
+def _ComputeRsyncOp(src_entry, dst_entry, compute_checksums):
+  """
+  Decides how to synchronize a file/object that exists at both the source and
+  the destination.
+
+  Returns:
+    RsyncOp.COPY or RsyncOp.CHECKSUM, or None if the destination is up to
+    date.
+  """
+  if src_entry.size != dst_entry.size:
+    return RsyncOp.COPY
+  if src_entry.md5 and dst_entry.md5:
+    if src_entry.md5 == dst_entry.md5:
+      return None
+    return RsyncOp.COPY
+  if compute_checksums:
+    return RsyncOp.CHECKSUM
+  if src_entry.mtime is None or dst_entry.mtime is None:
+    return RsyncOp.COPY
+  # Listings only report modification times to the second.
+  if int(src_entry.mtime) > int(dst_entry.mtime):
+    return RsyncOp.COPY
+  return None
@@ -0,0 +1,188 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import mimetypes
+import os
+import subprocess
+import threading
+
+from gslib.exception import CommandException
+
+# Number of bytes at the start of a file that, along with its extension,
+# identify its content type in the cache. Files smaller than this are
+# identified by their entire contents.
+SIGNATURE_SIZE = 4096
+
+# Maximum number of entries in the cache, which is cleared when it fills up.
+MAX_CACHE_ENTRIES = 100000
+
+# Maximum number of paths sent to the 'file' co-process in one batch. Keeping
+# batches small ensures that neither pipe can fill up while the other is being
+# written, which would deadlock.
+MAX_BATCH_SIZE = 100
+
+_FILE_COMMAND = ['file', '--mime-type', '--brief', '--no-buffer',
+                 '--files-from', '-']
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def GetContentTypeDetector(use_magicfile):
+  """
+  Returns the ContentTypeDetector shared by all threads of this process, so
+  that they share one cache and one 'file' process.
+  """
+  with _detectors_lock:
+    if use_magicfile not in _detectors:
+      _detectors[use_magicfile] = ContentTypeDetector(use_magicfile)
+    return _detectors[use_magicfile]
+
+
+class ContentTypeDetector(object):
+  """
+  Detects the content types of local files.
+
+  When use_magicfile is True, content types are detected by a single
+  long-lived 'file --mime-type' process that's fed one path per line, rather
+  than by starting a new process for every file. The results are cached by
+  file extension and signature (the first SIGNATURE_SIZE bytes of the file),
+  so that files that look alike are only classified once.
+
+  Otherwise content types are guessed from the file extension.
+
+  Instances are thread-safe. A process that inherits an instance through fork
+  starts its own 'file' process.
+  """
+
+  def __init__(self, use_magicfile):
+    self.use_magicfile = use_magicfile
+    self._lock = threading.Lock()
+    self._cache = {}
+    self._proc = None
+    self._proc_pid = None
+
+  def Detect(self, path):
+    """Returns the content type of the file at path, or None if unknown.
+
+    Raises:
+      CommandException: if the 'file' command fails.
+    """
+    return self.DetectMany([path])[path]
+
+  def DetectMany(self, paths):
+    """
+    Returns a dictionary mapping each of the given paths to its content type
+    (or None if unknown), classifying all of the paths that aren't cached in
+    as few calls to the 'file' process as possible.
+
+    Raises:
+      CommandException: if the 'file' command fails.
+    """
+    if not self.use_magicfile:
+      return dict((path, mimetypes.guess_type(path)[0]) for path in paths)
+    results = {}
+    uncached = {}
+    for path in paths:
+      key = self._GetCacheKey(path)
+      if key in self._cache:
+        results[path] = self._cache[key]
+      else:
+        uncached[path] = key
+    if uncached:
+      with self._lock:
+        detected = self._RunFile(list(uncached))
+        if len(self._cache) + len(detected) > MAX_CACHE_ENTRIES:
+          self._cache.clear()
+        for path, content_type in detected.iteritems():
+          if uncached[path]:
+            self._cache[uncached[path]] = content_type
+          results[path] = content_type
+    return results
+
+  def Close(self):
+    """Stops the 'file' process, if one is running."""
+    with self._lock:
+      self._StopProcess()
+
+  def _GetCacheKey(self, path):
+    """Returns the cache key for path, or None if the file can't be read."""
+    try:
+      with open(path, 'rb') as fp:
+        signature = fp.read(SIGNATURE_SIZE)
+    except (IOError, OSError):
+      return None
+    return (os.path.splitext(path)[1].lower(),
+            hashlib.md5(signature).digest())
+
+  def _RunFile(self, paths):
+    """Classifies paths with the 'file' process. Must hold self._lock."""
+    results = {}
+    # 'file' reads one path per line, so paths containing newlines have to be
+    # classified by a process of their own.
+    batch_paths = []
+    for path in paths:
+      if '\n' in path or '\r' in path:
+        results[path] = self._RunFileOnce(path)
+      else:
+        batch_paths.append(path)
+    for i in range(0, len(batch_paths), MAX_BATCH_SIZE):
+      batch = batch_paths[i:i + MAX_BATCH_SIZE]
+      try:
+        results.update(self._RunFileBatch(batch))
+      except (IOError, OSError, ValueError):
+        # The 'file' process died; fall back to one process per path, which
+        # reports errors in detail.
+        self._StopProcess()
+        for path in batch:
+          results[path] = self._RunFileOnce(path)
+    return results
+
+  def _RunFileBatch(self, paths):
+    if self._proc is None or self._proc_pid != os.getpid():
+      self._proc = subprocess.Popen(_FILE_COMMAND, stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=open(os.devnull, 'w'))
+      self._proc_pid = os.getpid()
+    self._proc.stdin.write(''.join('%s\n' % path for path in paths))
+    self._proc.stdin.flush()
+    results = {}
+    for path in paths:
+      line = self._proc.stdout.readline()
+      if not line:
+        raise IOError('The "file" process exited unexpectedly.')
+      results[path] = line.rstrip('\r\n') or None
+    return results
+
+  def _StopProcess(self):
+    if self._proc is not None and self._proc_pid == os.getpid():
+      try:
+        self._proc.stdin.close()
+        self._proc.wait()
+      except (IOError, OSError):
+        pass
+    self._proc = None
+    self._proc_pid = None
+
+  def _RunFileOnce(self, path):
+    p = subprocess.Popen(['file', '--mime-type', path],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, error = p.communicate()
+    if p.returncode != 0 or error:
+      raise CommandException(
+          'Encountered error running "file --mime-type %s" '
+          '(returncode=%d).\n%s' % (path, p.returncode, error))
+    # Parse output by removing line delimiter and splitting on last ":
+    return output.rstrip().rpartition(': ')[2] or None
@@ -0,0 +1,320 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import os
+import Queue
+import threading
+
+from gslib.util import KeyMethodAcceptsHashAlgs
+
+# Amount of data the download thread accumulates before handing it to the
+# upload side.
+DAISY_CHAIN_CHUNK_SIZE = 1024 * 1024
+
+# Maximum number of chunks waiting to be uploaded, which bounds the memory
+# used when the upload is slower than the download.
+DAISY_CHAIN_MAX_BUFFERED_CHUNKS = 16
+
+# Forward seeks of up to this many bytes are done by discarding downloaded
+# data, rather than by starting a new download at the new position.
+DAISY_CHAIN_MAX_SKIP_SIZE = (DAISY_CHAIN_CHUNK_SIZE *
+                             DAISY_CHAIN_MAX_BUFFERED_CHUNKS)
+
+# Seconds between checks for cancellation while the buffer is full.
+_PUT_TIMEOUT = 1
+
+
+class _DownloadCancelled(Exception):
+  """Raised in the download thread when the download is no longer needed."""
+
+
+class _ChunkQueueWriter(object):
+  """
+  File-like object that boto's Key.get_file() writes the downloaded data to,
+  which groups the data into chunks and queues them for the upload side.
+  """
+
+  def __init__(self, chunk_queue, cancelled):
+    self._queue = chunk_queue
+    self._cancelled = cancelled
+    self._pending = []
+    self._pending_size = 0
+
+  def write(self, data):
+    self._pending.append(data)
+    self._pending_size += len(data)
+    if self._pending_size >= DAISY_CHAIN_CHUNK_SIZE:
+      self.flush()
+
+  def flush(self):
+    if self._pending:
+      self.Put(''.join(self._pending))
+      self._pending = []
+      self._pending_size = 0
+
+  def Put(self, item):
+    """Queues item, waiting for room in the queue unless cancelled."""
+    while True:
+      if self._cancelled.is_set():
+        raise _DownloadCancelled()
+      try:
+        self._queue.put(item, timeout=_PUT_TIMEOUT)
+        return
+      except Queue.Full:
+        pass
+
+
+class _DownloadThread(threading.Thread):
+  """
+  Thread that downloads a byte range of an object into a chunk queue. If
+  start_byte and end_byte are None, the response to the given headers is
+  downloaded as is.
+  """
+
+  def __init__(self, src_key, headers, start_byte, end_byte,
+               max_buffered_chunks):
+    super(_DownloadThread, self).__init__()
+    self.daemon = True
+    self.queue = Queue.Queue(max_buffered_chunks)
+    self.cancelled = threading.Event()
+    # Each download uses its own copy of the Key, since a Key can only stream
+    # one response at a time.
+    self._src_key = copy.copy(src_key)
+    self._src_key.resp = None
+    self._headers = headers.copy()
+    if start_byte is not None:
+      self._headers['Range'] = 'bytes=%d-%d' % (start_byte, end_byte)
+
+  def run(self):
+    writer = _ChunkQueueWriter(self.queue, self.cancelled)
+    try:
+      # Hashes are validated by the upload side.
+      if KeyMethodAcceptsHashAlgs(self._src_key, 'get_file'):
+        self._src_key.get_file(writer, self._headers, hash_algs={})
+      else:
+        self._src_key.get_file(writer, self._headers)
+      writer.flush()
+      writer.Put(None)
+    except _DownloadCancelled:
+      pass
+    except Exception, e:
+      try:
+        writer.Put(e)
+      except _DownloadCancelled:
+        pass
+
+  def Stop(self):
+    """Stops the download, discarding any data it queued."""
+    self.cancelled.set()
+    while self.is_alive():
+      try:
+        self.queue.get(timeout=_PUT_TIMEOUT)
+      except Queue.Empty:
+        pass
+    self.join()
+
+
+class DaisyChainWrapper(object):
+  """
+  Read-only file-like object over a byte range of a cloud object, used as the
+  source of the upload in daisy chain mode.
+
+  The object is downloaded by a separate thread into a bounded buffer, so the
+  download and the upload proceed concurrently: the download only waits for
+  the upload when the buffer is full, and the upload only waits for the
+  download when it's empty. Seeking backwards (e.g., when boto restarts an
+  upload) starts a new download at the new position; seeking to the end is
+  supported so that the size can be determined with tell().
+
+  Call close() once done, to stop the download thread.
+  """
+
+  def __init__(self, src_key, headers=None, start_byte=0, end_byte=None,
+               max_buffered_chunks=DAISY_CHAIN_MAX_BUFFERED_CHUNKS):
+    """
+    Args:
+      src_key: Key of the source object, whose size must be set.
+      headers: Headers to send with the download requests.
+      start_byte: The first byte of the range to read.
+      end_byte: The last byte of the range to read (inclusive), or None to
+                read to the end of the object.
+      max_buffered_chunks: Maximum number of DAISY_CHAIN_CHUNK_SIZE chunks
+                           downloaded ahead of the reader.
+    """
+    self._src_key = src_key
+    self._headers = headers or {}
+    self._start = start_byte
+    if end_byte is None:
+      end_byte = src_key.size - 1
+    self.size = end_byte - start_byte + 1
+    self.name = src_key.name
+    self._max_buffered_chunks = max_buffered_chunks
+    self._position = 0
+    # Position (relative to start_byte) of the next byte the download thread
+    # will provide, and the unread remainder of the current chunk.
+    self._download_position = 0
+    self._chunk = ''
+    self._chunk_offset = 0
+    self._thread = None
+
+  def read(self, size=-1):
+    remaining = self.size - self._position
+    if size >= 0:
+      remaining = min(size, remaining)
+    if remaining <= 0:
+      return ''
+    if (self._thread is None or self._position < self._download_position or
+        self._position - self._download_position > DAISY_CHAIN_MAX_SKIP_SIZE):
+      self._StartDownload(self._position)
+    parts = []
+    while remaining > 0:
+      if self._chunk_offset == len(self._chunk):
+        self._NextChunk()
+      data = self._chunk[self._chunk_offset:self._chunk_offset + remaining]
+      self._chunk_offset += len(data)
+      self._download_position += len(data)
+      if self._download_position <= self._position:
+        # Data skipped over by a forward seek.
+        continue
+      skip = len(data) - (self._download_position - self._position)
+      if skip:
+        data = data[skip:]
+      parts.append(data)
+      self._position += len(data)
+      remaining -= len(data)
+    return ''.join(parts)
+
+  def tell(self):
+    return self._position
+
+  def seek(self, offset, whence=os.SEEK_SET):
+    if whence == os.SEEK_END:
+      offset += self.size
+    elif whence == os.SEEK_CUR:
+      offset += self._position
+    if offset < 0:
+      raise IOError('Invalid seek to offset %d' % offset)
+    # The download is moved (if needed) by the next read.
+    self._position = offset
+
+  def close(self):
+    self._StopDownload()
+
+  def StartDownload(self):
+    """
+    Starts downloading from the current position, ahead of the first read, if
+    the download isn't already under way.
+    """
+    if self._thread is None and self._position < self.size:
+      self._StartDownload(self._position)
+
+  def _StartDownload(self, position):
+    self._StopDownload()
+    self._thread = _DownloadThread(self._src_key, self._headers,
+                                   self._start + position,
+                                   self._start + self.size - 1,
+                                   self._max_buffered_chunks)
+    self._thread.start()
+    self._download_position = position
+
+  def _StopDownload(self):
+    if self._thread:
+      self._thread.Stop()
+      self._thread = None
+    self._chunk = ''
+    self._chunk_offset = 0
+
+  def _NextChunk(self):
+    """Waits for the next chunk from the download thread."""
+    item = self._thread.queue.get()
+    if isinstance(item, Exception):
+      self._thread.join()
+      self._thread = None
+      raise item
+    if item is None:
+      self._thread.join()
+      self._thread = None
+      raise IOError('Reached the end of %s after %d of %d bytes.' %
+                    (self.name, self._download_position, self.size))
+    self._chunk = item
+    self._chunk_offset = 0
+
+
+class ReadAheadStream(object):
+  """
+  Read-only, sequential file-like object over the response to a single GET of
+  a cloud object, which a separate thread downloads ahead of the reader into
+  a bounded buffer.
+
+  Unlike DaisyChainWrapper, it returns all of the response rather than a byte
+  range of known size. That matters when the service decompresses a
+  gzip-encoded object on the fly: the data served is then longer than the
+  object's size, and Range headers are ignored. It can't seek, and failed
+  downloads aren't retried.
+
+  Call close() once done, to stop the download thread.
+  """
+
+  def __init__(self, src_key, headers=None,
+               max_buffered_chunks=DAISY_CHAIN_MAX_BUFFERED_CHUNKS):
+    """
+    Args:
+      src_key: Key of the object to download.
+      headers: Headers to send with the download request, including any Range
+               header.
+      max_buffered_chunks: Maximum number of DAISY_CHAIN_CHUNK_SIZE chunks
+                           downloaded ahead of the reader.
+    """
+    self.name = src_key.name
+    self._thread = _DownloadThread(src_key, headers or {}, None, None,
+                                   max_buffered_chunks)
+    self._started = False
+    self._done = False
+    self._chunk = ''
+    self._chunk_offset = 0
+
+  def StartDownload(self):
+    """Starts the download ahead of the first read, if it hasn't started."""
+    if not self._started:
+      self._started = True
+      self._thread.start()
+
+  def read(self, size=-1):
+    self.StartDownload()
+    parts = []
+    while size != 0 and not self._done:
+      if self._chunk_offset == len(self._chunk):
+        item = self._thread.queue.get()
+        if isinstance(item, Exception):
+          self._done = True
+          raise item
+        if item is None:
+          self._done = True
+          break
+        self._chunk = item
+        self._chunk_offset = 0
+      if size < 0:
+        data = self._chunk[self._chunk_offset:]
+      else:
+        data = self._chunk[self._chunk_offset:self._chunk_offset + size]
+        size -= len(data)
+      self._chunk_offset += len(data)
+      parts.append(data)
+    return ''.join(parts)
+
+  def close(self):
+    if self._started:
+      self._thread.Stop()
+    self._done = True
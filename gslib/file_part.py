@@ -12,7 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import mmap
 import os
+import threading
+
+# Memory mappings shared by the MappedFileParts open in this process, keyed by
+# the file name and the identity of its contents (see _AcquireMapping).
+_mappings = {}
+_mappings_pid = None
+_mappings_lock = threading.Lock()
+
 
 class FilePart(file):
   """
@@ -31,6 +40,8 @@ class FilePart(file):
       length: The total number of bytes in the FilePart.
     """
     self._fp = open(filename, 'rb')
+    self.filename = filename
+    self.offset = offset
     self.length = length
     self._start = offset
     self._end = self._start + self.length
@@ -51,6 +62,12 @@ class FilePart(file):
     size = min(size, self._end - self._fp.tell()) # Only read to our EOF
     return self._fp.read(max(0, size))
 
+  def readinto(self, b):
+    size = min(len(b), self._end - self._fp.tell()) # Only read to our EOF
+    if size <= 0:
+      return 0
+    return self._fp.readinto(memoryview(b)[:size])
+
   def seek(self, offset, whence=os.SEEK_SET):
     if whence == os.SEEK_END:
       return self._fp.seek(offset + self._end)
@@ -91,3 +108,130 @@ class FilePart(file):
   
   def writelines(self, size=None):
     raise NotImplementedError('writelines is not implemented in FilePart.')
+
+
+class MappedFilePart(FilePart):
+  """
+  FilePart whose data is read from a read-only memory mapping of the file,
+  shared by all of the MappedFileParts of the same file that are open in this
+  process (e.g., the components of a parallel composite upload that different
+  threads upload at once). Reads are served from the page cache without a file
+  handle or buffered reader per part, and GetView() exposes the part's data
+  without copying it, e.g. for hashing.
+
+  Like any memory mapping, truncating the file while it's mapped makes reads
+  of the truncated data fail with SIGBUS rather than return short reads.
+  """
+
+  def __init__(self, filename, offset, length):
+    """
+    Args:
+      filename: The name of the existing file, of which this object represents
+                a part.
+      offset: The position (in bytes) in the original file that corresponds to
+              the first byte of the MappedFilePart.
+      length: The total number of bytes in the MappedFilePart.
+
+    Raises:
+      EnvironmentError, ValueError or OverflowError if the file can't be
+      mapped (e.g., it's empty, or too large for the address space).
+    """
+    self.filename = filename
+    self.offset = offset
+    self.length = length
+    self._start = offset
+    self._end = self._start + self.length
+    self._pos = 0
+    (self._mapping_key, self._mapping) = _AcquireMapping(filename)
+
+  def tell(self):
+    return self._pos
+
+  def _GetRange(self, offset, size):
+    """Returns the [start, stop) range of the mapping to read, clamped to our
+       EOF, for size bytes (or all, if negative) from offset in the part.
+    """
+    start = self._start + offset
+    stop = min(self._end, len(self._mapping))
+    if size >= 0:
+      stop = min(stop, start + size)
+    return (start, max(start, stop))
+
+  def GetView(self, offset=0, size=-1):
+    """Returns a read-only buffer over size bytes (or all, if negative) of the
+       part's data, starting at offset in the part, without copying them.
+    """
+    (start, stop) = self._GetRange(offset, size)
+    return buffer(self._mapping, start, stop - start)
+
+  def read(self, size=-1):
+    (start, stop) = self._GetRange(self._pos, size)
+    self._pos += stop - start
+    return self._mapping[start:stop]
+
+  def readinto(self, b):
+    view = self.GetView(self._pos, len(b))
+    memoryview(b)[:len(view)] = view
+    self._pos += len(view)
+    return len(view)
+
+  def seek(self, offset, whence=os.SEEK_SET):
+    if whence == os.SEEK_END:
+      self._pos = self.length + offset
+    elif whence == os.SEEK_CUR:
+      self._pos += offset
+    else:
+      self._pos = offset
+
+  def close(self):
+    if self._mapping:
+      self._mapping = None
+      _ReleaseMapping(self._mapping_key)
+
+
+def OpenFilePart(filename, offset, length):
+  """Returns a MappedFilePart for the given part of a file, or a FilePart if
+     the file can't be mapped (e.g., it's too large to map into a 32-bit
+     address space).
+  """
+  try:
+    return MappedFilePart(filename, offset, length)
+  except (EnvironmentError, ValueError, OverflowError):
+    return FilePart(filename, offset, length)
+
+
+def _AcquireMapping(filename):
+  """Returns (key, mapping) for a read-only mapping of the current contents of
+     filename, creating it if no MappedFilePart in this process has it open.
+     Each call must be paired with a call to _ReleaseMapping(key).
+  """
+  global _mappings_pid
+  with open(filename, 'rb') as fp:
+    stat_result = os.fstat(fp.fileno())
+    # A file that was replaced or modified since it was mapped gets a new
+    # mapping.
+    key = (filename, stat_result.st_dev, stat_result.st_ino,
+           stat_result.st_size, stat_result.st_mtime)
+    with _mappings_lock:
+      if _mappings_pid != os.getpid():
+        # Mappings inherited from a parent process aren't shared with it.
+        _mappings.clear()
+        _mappings_pid = os.getpid()
+      entry = _mappings.get(key)
+      if entry is None:
+        entry = [mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ), 0]
+        _mappings[key] = entry
+      entry[1] += 1
+      return (key, entry[0])
+
+
+def _ReleaseMapping(key):
+  """Unmaps the file mapped by _AcquireMapping once it's no longer used."""
+  with _mappings_lock:
+    entry = _mappings.get(key)
+    if entry is None:
+      return
+    entry[1] -= 1
+    if not entry[1]:
+      del _mappings[key]
+      entry[0].close()
@@ -0,0 +1,196 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import os
+import time
+import zlib
+
+# Number of bytes of the source file that are compressed at a time.
+READ_SIZE = 64 * 1024
+
+# zlib window bits value that makes zlib parse (and skip) a gzip header.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class _CompressedDataBuffer(object):
+  """The file object to which GzipFile writes the compressed data."""
+
+  def __init__(self):
+    self.chunks = []
+    self.size = 0
+
+  def write(self, data):
+    if data:
+      self.chunks.append(data)
+      self.size += len(data)
+
+  def flush(self):
+    pass
+
+  def Take(self, size):
+    """Removes and returns up to size bytes from the front of the buffer."""
+    data = ''.join(self.chunks)
+    self.chunks = [data[size:]] if len(data) > size else []
+    self.size = max(0, len(data) - size)
+    return data[:size]
+
+
+class GzipCompressingReader(object):
+  """
+  Read-only file-like object whose contents are the gzip-compressed contents
+  of another file, which are compressed as they're read. This allows a file
+  to be uploaded with Content-Encoding: gzip without first compressing it to
+  a temporary file.
+
+  The compressed size isn't known until the whole file has been read, so this
+  can only be uploaded as a stream. Seeking is supported (by compressing the
+  file again from the beginning, which produces the same data since the gzip
+  header's timestamp is fixed when this object is created), so that boto can
+  retry a failed upload.
+  """
+
+  def __init__(self, fp, compresslevel=9):
+    """
+    Args:
+      fp: The file whose contents to compress. It must be positioned at the
+          start of the data, and it must support seek() in order for the
+          data to be compressed again.
+      compresslevel: The zlib compression level to use.
+    """
+    self._fp = fp
+    self._start = fp.tell()
+    self._compresslevel = compresslevel
+    self._mtime = int(time.time())
+    self._Reset()
+
+  def _Reset(self):
+    self._buffer = _CompressedDataBuffer()
+    self._gzip_file = gzip.GzipFile(filename='', mode='wb',
+                                    compresslevel=self._compresslevel,
+                                    fileobj=self._buffer, mtime=self._mtime)
+    self._pos = 0
+    self._done = False
+
+  def tell(self):
+    return self._pos
+
+  def read(self, size=-1):
+    while not self._done and (size < 0 or self._buffer.size < size):
+      data = self._fp.read(READ_SIZE)
+      if data:
+        self._gzip_file.write(data)
+      else:
+        # This writes the gzip trailer to the buffer.
+        self._gzip_file.close()
+        self._done = True
+    if size < 0:
+      size = self._buffer.size
+    data = self._buffer.Take(size)
+    self._pos += len(data)
+    return data
+
+  def seek(self, offset, whence=os.SEEK_SET):
+    if whence != os.SEEK_SET:
+      raise IOError('GzipCompressingReader only supports absolute seeks.')
+    if offset < self._pos:
+      self._fp.seek(self._start)
+      self._Reset()
+    while self._pos < offset:
+      if not self.read(min(offset - self._pos, READ_SIZE)):
+        break
+
+  def close(self):
+    self._fp.close()
+
+
+class GzipDecompressingWriter(object):
+  """
+  Write-only file-like object that inflates the gzip-compressed data written
+  to it and writes the uncompressed data to another file. This allows an
+  object stored with Content-Encoding: gzip to be decompressed as it's
+  downloaded, rather than downloading it to a temporary file and
+  decompressing that afterwards.
+
+  The hashes of the compressed data are computed as it's written, so that the
+  download can be validated against the cloud-supplied digests. tell() and
+  seek(0, os.SEEK_END) report the number of compressed bytes written, which
+  is what boto's ResumableDownloadHandler uses to resume a failed download
+  where it left off. The decompressor's state can't be saved, though, so a
+  download that's restarted by a new process starts again from the
+  beginning.
+  """
+
+  def __init__(self, fp, hash_algs=None):
+    """
+    Args:
+      fp: The file to which the uncompressed data is written. It must be
+          positioned at its start.
+      hash_algs: Dictionary mapping hash algorithm names to digester
+                 constructors, for the hashes to compute over the compressed
+                 data.
+    """
+    self._fp = fp
+    self._hash_algs = hash_algs or {}
+    self.truncate(0)
+
+  @property
+  def name(self):
+    return self._fp.name
+
+  def tell(self):
+    return self._pos
+
+  def seek(self, offset, whence=os.SEEK_SET):
+    if whence in (os.SEEK_CUR, os.SEEK_END):
+      offset += self._pos
+    if offset != self._pos:
+      raise IOError('GzipDecompressingWriter only supports seeking to the end '
+                    'of the data written so far.')
+
+  def truncate(self, size=0):
+    """Discards all the data written so far (size must be 0)."""
+    if size:
+      raise IOError('GzipDecompressingWriter can only be truncated to 0.')
+    self._fp.seek(0)
+    self._fp.truncate(0)
+    self._decompressor = zlib.decompressobj(GZIP_WBITS)
+    self._digesters = dict(
+        (alg, digester()) for alg, digester in self._hash_algs.iteritems())
+    self._pos = 0
+
+  def write(self, data):
+    self._pos += len(data)
+    for digester in self._digesters.itervalues():
+      digester.update(data)
+    while data:
+      self._fp.write(self._decompressor.decompress(data))
+      # A gzip file can consist of several concatenated members, each of which
+      # needs a new decompressor. Members may be followed by zero padding.
+      data = self._decompressor.unused_data.lstrip('\0')
+      if data:
+        self._decompressor = zlib.decompressobj(GZIP_WBITS)
+
+  def flush(self):
+    self._fp.flush()
+
+  def GetHashes(self):
+    """Returns a dictionary mapping hash algorithm names to the digests of the
+       compressed data written so far."""
+    return dict((alg, digester.digest())
+                for alg, digester in self._digesters.iteritems())
+
+  def close(self):
+    self.flush()
+    self._fp.close()
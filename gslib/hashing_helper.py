@@ -0,0 +1,208 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import binascii
+import os
+import Queue
+import threading
+
+# Amount of data that's accumulated before it's handed to the hashing thread,
+# so that the cost of the handoff is amortized over many reads. hashlib
+# releases the GIL while hashing buffers this large, so the hashing thread can
+# run while the uploading thread is sending data.
+HASHING_THREAD_BATCH_SIZE = 1024 * 1024
+
+# Maximum number of batches waiting to be hashed, which bounds the memory used
+# when hashing is slower than reading.
+HASHING_THREAD_MAX_QUEUED_BATCHES = 4
+
+# Uploads at least this large hash their data in a separate thread.
+HASHING_THREAD_THRESHOLD = 8 * 1024 * 1024
+
+# Number of bytes read at a time when hashing data that was skipped over.
+CATCH_UP_READ_SIZE = 64 * 1024
+
+
+class _HashingThread(threading.Thread):
+  """Thread that updates digesters with the data queued for them."""
+
+  def __init__(self):
+    super(_HashingThread, self).__init__()
+    self.daemon = True
+    self.queue = Queue.Queue(HASHING_THREAD_MAX_QUEUED_BATCHES)
+
+  def run(self):
+    while True:
+      item = self.queue.get()
+      try:
+        if item is None:
+          return
+        (digesters, data) = item
+        for digester in digesters:
+          digester.update(data)
+      finally:
+        self.queue.task_done()
+
+  def Stop(self):
+    self.queue.put(None)
+    self.join()
+
+
+class _DigesterView(object):
+  """
+  Digester handed to boto, which reports the hash of the data that a
+  HashingFileUploadWrapper has read rather than hashing the data itself.
+  """
+
+  def __init__(self, wrapper, alg):
+    self._wrapper = wrapper
+    self._alg = alg
+
+  def update(self, data):
+    # The wrapper already hashed this data when it was read.
+    pass
+
+  def copy(self):
+    return self
+
+  def digest(self):
+    return self._wrapper.GetDigest(self._alg)
+
+  def hexdigest(self):
+    return binascii.b2a_hex(self.digest())
+
+
+class HashingFileUploadWrapper(object):
+  """
+  Read-only file-like object that hashes the data of another file as it's
+  read, so that an upload can be validated without reading the file twice
+  (once to compute the MD5 to send and once to send the data).
+
+  The digests cover the data from the position fp had when this object was
+  created up to the furthest position read so far. Data that's read again
+  (e.g., when boto retries a request after seeking back to the start) isn't
+  hashed again, and data that's skipped over by a forward seek is hashed when
+  the data after it is read, so the digests match the data that was uploaded
+  no matter how boto moves around in the file.
+
+  Use this object as a context manager, so that the thread used to hash the
+  data (if any) is stopped.
+  """
+
+  def __init__(self, fp, hash_algs, use_hashing_thread=False):
+    """
+    Args:
+      fp: The file being uploaded.
+      hash_algs: Dictionary mapping hash algorithm names to digester
+                 constructors.
+      use_hashing_thread: If True, the data is hashed by a separate thread,
+                          so that hashing overlaps network I/O.
+    """
+    self._fp = fp
+    self._start = fp.tell()
+    self._pos = self._start
+    self._hashed_pos = self._start
+    self._digesters = dict((alg, digester())
+                           for alg, digester in hash_algs.iteritems())
+    self._hashing_thread = None
+    if use_hashing_thread and self._digesters:
+      self._hashing_thread = _HashingThread()
+      self._hashing_thread.start()
+    self._pending = []
+    self._pending_size = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    if self._hashing_thread:
+      self._hashing_thread.Stop()
+      self._hashing_thread = None
+
+  @property
+  def name(self):
+    return self._fp.name
+
+  def GetHashAlgs(self):
+    """
+    Returns a dictionary mapping hash algorithm names to digester constructors,
+    as accepted by boto's send_file() methods, whose digesters report the
+    hashes computed by this object.
+    """
+    return dict((alg, lambda alg=alg: _DigesterView(self, alg))
+                for alg in self._digesters)
+
+  def GetDigest(self, alg):
+    """Returns the digest computed with the given algorithm."""
+    self._Flush()
+    return self._digesters[alg].digest()
+
+  def GetDigests(self):
+    """Returns a dictionary mapping hash algorithm names to digests."""
+    self._Flush()
+    return dict((alg, digester.digest())
+                for alg, digester in self._digesters.iteritems())
+
+  def _Hash(self, data):
+    if not self._hashing_thread:
+      for digester in self._digesters.itervalues():
+        digester.update(data)
+      return
+    self._pending.append(data)
+    self._pending_size += len(data)
+    if self._pending_size >= HASHING_THREAD_BATCH_SIZE:
+      self._SubmitPending()
+
+  def _SubmitPending(self):
+    if self._pending:
+      self._hashing_thread.queue.put(
+          (self._digesters.values(), ''.join(self._pending)))
+      self._pending = []
+      self._pending_size = 0
+
+  def _Flush(self):
+    """Waits until all the data read so far has been hashed."""
+    if self._hashing_thread:
+      self._SubmitPending()
+      self._hashing_thread.queue.join()
+
+  def _CatchUp(self):
+    """Hashes the data between the hashed position and the current one."""
+    self._fp.seek(self._hashed_pos)
+    while self._hashed_pos < self._pos:
+      data = self._fp.read(min(CATCH_UP_READ_SIZE,
+                               self._pos - self._hashed_pos))
+      if not data:
+        break
+      self._Hash(data)
+      self._hashed_pos += len(data)
+    self._fp.seek(self._pos)
+
+  def read(self, size=-1):
+    if self._pos > self._hashed_pos:
+      self._CatchUp()
+    data = self._fp.read(size)
+    end = self._pos + len(data)
+    if end > self._hashed_pos:
+      self._Hash(data[self._hashed_pos - self._pos:])
+      self._hashed_pos = end
+    self._pos = end
+    return data
+
+  def tell(self):
+    return self._pos
+
+  def seek(self, offset, whence=os.SEEK_SET):
+    self._fp.seek(offset, whence)
+    self._pos = self._fp.tell()
@@ -0,0 +1,304 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Persistent cache of the MD5 and CRC32C hashes of local files."""
+
+import os
+import threading
+import time
+
+from boto import config
+from gslib.commands.config import DEFAULT_LOCAL_HASH_CACHE_MAX_ENTRIES
+from gslib.file_part import OpenFilePart
+from gslib.transfer_buffer import ReadChunks
+from gslib.util import GetSqliteDatabaseDir
+
+try:
+  import sqlite3
+except ImportError:
+  sqlite3 = None
+
+# Hash algorithms whose digests are cached.
+CACHED_HASH_ALGS = ('md5', 'crc32c')
+
+# When the cache is full, the least recently used entries are evicted until
+# it's this fraction smaller than its limit, so evictions are infrequent.
+EVICTION_FRACTION = 0.1
+
+# Number of entries added by a process between checks of the cache size.
+EVICTION_CHECK_INTERVAL = 1000
+
+# An entry's last use time is only updated if it's older than this many
+# seconds, so that most cache hits don't need a write transaction.
+LAST_USED_RESOLUTION = 24 * 60 * 60
+
+# Seconds to wait for another process's write transaction to finish.
+SQLITE_TIMEOUT = 60
+
+# A file whose modification time is a whole number of seconds may be on a
+# file system with coarse timestamps, where it could be modified again
+# without changing its modification time. Such files aren't cached until
+# their modification time is at least this many seconds old.
+COARSE_MTIME_MIN_AGE = 2
+
+_NANOS_PER_SECOND = 1000000000
+
+_cache = None
+_cache_pid = None
+# The pid of the process that found that it can't have a cache, so that it
+# doesn't look again for every file.
+_cache_disabled_pid = None
+_cache_lock = threading.Lock()
+
+
+def GetLocalHashCache():
+  """
+  Returns the LocalHashCache shared by all threads of this process, or None
+  if the cache isn't enabled (with the use_local_hash_cache option in the
+  [GSUtil] section of the boto config), sqlite3 isn't available, or there's
+  no directory for the database (see GetSqliteDatabaseDir).
+  """
+  global _cache, _cache_pid, _cache_disabled_pid
+  if not sqlite3 or not config.getbool('GSUtil', 'use_local_hash_cache',
+                                       False):
+    return None
+  if _cache_disabled_pid == os.getpid():
+    return None
+  with _cache_lock:
+    if _cache is None or _cache_pid != os.getpid():
+      # sqlite connections mustn't be used by more than one process.
+      database_dir = GetSqliteDatabaseDir()
+      if database_dir is None:
+        _cache_disabled_pid = os.getpid()
+        return None
+      _cache = LocalHashCache(
+          os.path.join(database_dir, 'local_hash_cache.sqlite'),
+          config.getint('GSUtil', 'local_hash_cache_max_entries',
+                        DEFAULT_LOCAL_HASH_CACHE_MAX_ENTRIES))
+      _cache_pid = os.getpid()
+    return _cache
+
+
+def GetStatKey(path):
+  """
+  Returns the (device, inode, size, mtime_ns) key identifying the current
+  contents of the file at path, or None if the file's hashes can't safely be
+  cached.
+  """
+  try:
+    stat_result = os.stat(path)
+  except OSError:
+    return None
+  if not stat_result.st_ino:
+    # Python 2 doesn't report inode numbers on Windows.
+    return None
+  mtime = stat_result.st_mtime
+  if mtime == int(mtime) and time.time() - mtime < COARSE_MTIME_MIN_AGE:
+    return None
+  return (stat_result.st_dev, stat_result.st_ino, stat_result.st_size,
+          int(round(mtime * _NANOS_PER_SECOND)))
+
+
+def GetFileHashes(path, hash_algs, offset=0, length=None):
+  """
+  Returns the digests of a file (or of length bytes of it, starting at
+  offset), from the local hash cache if possible. Digests that had to be
+  computed are added to the cache.
+
+  Args:
+    path: Name of the local file.
+    hash_algs: Dictionary mapping hash algorithm names to digester
+               constructors.
+    offset: Position of the first byte to hash.
+    length: Number of bytes to hash, or None to hash to the end of the file.
+
+  Returns:
+    Dictionary mapping hash algorithm names to (binary) digests.
+  """
+  cache = GetLocalHashCache()
+  stat_key = cache and GetStatKey(path)
+  if stat_key:
+    cached_hashes = cache.Get(stat_key, offset, length)
+    if all(alg in cached_hashes for alg in hash_algs):
+      return dict((alg, cached_hashes[alg]) for alg in hash_algs)
+  digesters = dict((alg, hash_algs[alg]()) for alg in hash_algs)
+  if length is None:
+    fp = open(path, 'rb')
+    fp.seek(offset)
+  else:
+    # Ranges are the components of parallel composite uploads, which are
+    # hashed straight from the memory mapping shared with their uploads.
+    fp = OpenFilePart(path, offset, length)
+  with fp:
+    for data in ReadChunks(fp):
+      for digester in digesters.itervalues():
+        digester.update(data)
+  hashes = dict((alg, digester.digest())
+                for alg, digester in digesters.iteritems())
+  if stat_key and GetStatKey(path) == stat_key:
+    cache.Put(stat_key, hashes, offset, length)
+  return hashes
+
+
+def RecordFileHashes(path, hashes, stat_key=None, offset=0, length=None):
+  """
+  Adds digests that were computed while transferring a file (or part of one)
+  to the local hash cache, if it's enabled.
+
+  Args:
+    path: Name of the local file.
+    hashes: Dictionary mapping hash algorithm names to (binary) digests of the
+            file's contents.
+    stat_key: GetStatKey(path) from before the contents were read, or None if
+              the contents were just written. The digests aren't cached if
+              the file changed since.
+    offset: Position of the first byte that was hashed.
+    length: Number of bytes that were hashed, or None for the rest of the
+            file.
+  """
+  cache = GetLocalHashCache()
+  if not cache:
+    return
+  current_stat_key = GetStatKey(path)
+  if current_stat_key and current_stat_key == (stat_key or current_stat_key):
+    cache.Put(current_stat_key, hashes, offset, length)
+
+
+class LocalHashCache(object):
+  """
+  Cache of the MD5 and CRC32C digests of local files (and of ranges within
+  them), so that unchanged files don't have to be read again to upload or
+  compare them.
+
+  Entries are keyed by the file's device and inode numbers, and store the
+  size and modification time the file had when it was hashed, so an entry is
+  ignored (and later replaced) as soon as the file changes. The cache is a
+  sqlite database that many gsutil processes can use at once. When it grows
+  past max_entries, the least recently used entries are evicted.
+
+  Failing to read or update the cache (for example because another process
+  holds a lock on it for too long) is never an error: the file is just hashed
+  again.
+  """
+
+  def __init__(self, path, max_entries):
+    self.path = path
+    self.max_entries = max_entries
+    self.lock = threading.Lock()
+    self.conn = None
+    self.puts_since_eviction_check = 0
+
+  def _Connect(self):
+    """Returns the connection to the cache database. Must hold self.lock."""
+    if self.conn is None:
+      conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT,
+                             check_same_thread=False)
+      try:
+        # Lets processes read the cache while another one updates it.
+        conn.execute('PRAGMA journal_mode=WAL')
+      except sqlite3.Error:
+        pass
+      with conn:
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            'dev INTEGER, ino INTEGER, offset INTEGER, length INTEGER, '
+            'size INTEGER, mtime_ns INTEGER, md5 BLOB, crc32c BLOB, '
+            'last_used REAL, PRIMARY KEY (dev, ino, offset, length))')
+        conn.execute('CREATE INDEX IF NOT EXISTS hashes_last_used '
+                     'ON hashes (last_used)')
+      self.conn = conn
+    return self.conn
+
+  def Get(self, stat_key, offset=0, length=None):
+    """
+    Returns a dictionary mapping hash algorithm names to the cached digests
+    of the file identified by stat_key (see GetStatKey()), which is empty if
+    none are cached.
+    """
+    (dev, ino, size, mtime_ns) = stat_key
+    if length is None:
+      length = size - offset
+    try:
+      with self.lock:
+        conn = self._Connect()
+        row = conn.execute(
+            'SELECT size, mtime_ns, md5, crc32c, last_used FROM hashes '
+            'WHERE dev = ? AND ino = ? AND offset = ? AND length = ?',
+            (dev, ino, offset, length)).fetchone()
+        if not row or (row[0], row[1]) != (size, mtime_ns):
+          return {}
+        now = time.time()
+        if now - row[4] > LAST_USED_RESOLUTION:
+          with conn:
+            conn.execute(
+                'UPDATE hashes SET last_used = ? WHERE dev = ? AND ino = ? '
+                'AND offset = ? AND length = ?',
+                (now, dev, ino, offset, length))
+    except sqlite3.Error:
+      return {}
+    return dict((alg, str(digest))
+                for (alg, digest) in zip(CACHED_HASH_ALGS, row[2:4])
+                if digest is not None)
+
+  def Put(self, stat_key, hashes, offset=0, length=None):
+    """
+    Caches the digests of the file identified by stat_key (see GetStatKey()),
+    keeping any other digests cached for the same contents.
+    """
+    (dev, ino, size, mtime_ns) = stat_key
+    if length is None:
+      length = size - offset
+    hashes = dict((alg, hashes[alg]) for alg in CACHED_HASH_ALGS
+                  if alg in hashes)
+    if not hashes:
+      return
+    try:
+      with self.lock:
+        conn = self._Connect()
+        with conn:
+          row = conn.execute(
+              'SELECT size, mtime_ns, md5, crc32c FROM hashes '
+              'WHERE dev = ? AND ino = ? AND offset = ? AND length = ?',
+              (dev, ino, offset, length)).fetchone()
+          if row and (row[0], row[1]) == (size, mtime_ns):
+            for (alg, digest) in zip(CACHED_HASH_ALGS, row[2:4]):
+              if digest is not None:
+                hashes.setdefault(alg, str(digest))
+          conn.execute(
+              'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+              (dev, ino, offset, length, size, mtime_ns) +
+              tuple(_ToBlob(hashes.get(alg)) for alg in CACHED_HASH_ALGS) +
+              (time.time(),))
+        self.puts_since_eviction_check += 1
+        if self.puts_since_eviction_check >= EVICTION_CHECK_INTERVAL:
+          self.puts_since_eviction_check = 0
+          self._EvictIfNeeded(conn)
+    except sqlite3.Error:
+      pass
+
+  def _EvictIfNeeded(self, conn):
+    """Evicts the least recently used entries if the cache is too big."""
+    count = conn.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+    if count <= self.max_entries:
+      return
+    num_to_evict = count - int(self.max_entries * (1 - EVICTION_FRACTION))
+    with conn:
+      conn.execute('DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM '
+                   'hashes ORDER BY last_used LIMIT ?)', (num_to_evict,))
+
+
+def _ToBlob(digest):
+  if digest is None:
+    return None
+  return sqlite3.Binary(digest)
@@ -0,0 +1,236 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Walker that lists local directory trees using several threads."""
+
+import os
+import Queue
+import stat
+import threading
+
+from boto import config
+from collections import namedtuple
+
+try:
+  # scandir returns each entry's type along with its name (so directories can
+  # be told apart from files without a stat call), and is much faster than
+  # os.listdir plus os.lstat. It's part of the standard library (as
+  # os.scandir) from Python 3.5.
+  from scandir import scandir
+except ImportError:
+  scandir = None
+
+# Maximum number of directories the walker threads list ahead of the caller.
+MAX_BUFFERED_DIRS = 1000
+
+# The stat information of a file found by WalkFiles. This is pickleable, so it
+# can be passed to other processes along with the name of the file.
+FileStat = namedtuple('FileStat', 'size mtime mode')
+
+
+def GetLocalWalkThreadCount():
+  """
+  Returns the number of threads WalkFiles uses to list directories, from the
+  local_walk_thread_count option in the [GSUtil] section of the boto config.
+  """
+  # Imported here because gslib.commands.config imports gslib.command, which
+  # imports this module (via gslib.wildcard_iterator).
+  from gslib.commands.config import DEFAULT_LOCAL_WALK_THREAD_COUNT
+  return config.getint('GSUtil', 'local_walk_thread_count',
+                       DEFAULT_LOCAL_WALK_THREAD_COUNT)
+
+
+def WalkFiles(base_dir, thread_count=None):
+  """
+  Generator that yields every file under base_dir, in the same order as
+  os.walk (top-down, with the files in each directory ahead of the files in
+  its subdirectories). Like os.walk, it follows links to files but not links
+  to directories, and ignores directories that can't be listed.
+
+  The directories are listed by thread_count threads, which read ahead of the
+  caller, so listing trees on network file systems isn't limited by the
+  latency of each directory read. Each file is stat'ed while its directory is
+  listed, and its FileStat yielded along with it, so the caller needn't stat
+  it again.
+
+  Args:
+    base_dir: The directory to walk.
+    thread_count: Number of threads listing directories, or None for
+                  GetLocalWalkThreadCount(). With 0, directories are listed by
+                  the calling thread as they're reached.
+
+  Yields:
+    (path, rel_path, file_stat) for each file, where rel_path is the path
+    relative to base_dir and file_stat is None if the file couldn't be
+    stat'ed (e.g., because it's a broken link).
+  """
+  if thread_count is None:
+    thread_count = GetLocalWalkThreadCount()
+  walker = _ParallelWalker(thread_count)
+  try:
+    for result in walker.Walk(_DirListing(base_dir, '')):
+      yield result
+  finally:
+    walker.Stop()
+
+
+class _DirListing(object):
+  """The contents of one directory, which are filled in by _ListDir."""
+
+  def __init__(self, path, rel_path):
+    self.path = path
+    self.rel_path = rel_path
+    # Set once a thread has started listing the directory.
+    self.claimed = False
+    # Whether the listing was done by a walker thread (rather than the
+    # caller), and so holds a slot in MAX_BUFFERED_DIRS.
+    self.buffered = False
+    self.done = threading.Event()
+    self.files = None
+    self.subdirs = None
+    self.error = None
+
+
+def _ListDir(listing):
+  """Lists listing.path, filling in listing.files and listing.subdirs."""
+  files = []
+  subdirs = []
+  try:
+    if scandir:
+      for entry in scandir(listing.path):
+        rel_path = os.path.join(listing.rel_path, entry.name)
+        try:
+          is_dir = entry.is_dir()
+        except OSError:
+          is_dir = False
+        if is_dir:
+          if not entry.is_symlink():
+            subdirs.append(_DirListing(entry.path, rel_path))
+          continue
+        try:
+          st = entry.stat()
+        except OSError:
+          st = None
+        files.append((entry.path, rel_path, st))
+    else:
+      for name in os.listdir(listing.path):
+        path = os.path.join(listing.path, name)
+        rel_path = os.path.join(listing.rel_path, name)
+        try:
+          st = os.lstat(path)
+          if stat.S_ISLNK(st.st_mode):
+            st = os.stat(path)
+            if stat.S_ISDIR(st.st_mode):
+              continue
+          elif stat.S_ISDIR(st.st_mode):
+            subdirs.append(_DirListing(path, rel_path))
+            continue
+        except OSError:
+          st = None
+        files.append((path, rel_path, st))
+  except OSError:
+    # The directory was removed, or can't be read.
+    pass
+  listing.files = [
+      (path, rel_path,
+       st and FileStat(st.st_size, st.st_mtime, st.st_mode))
+      for (path, rel_path, st) in files]
+  listing.subdirs = subdirs
+
+
+class _ParallelWalker(object):
+  """
+  Lists directories in pre-order using a pool of threads.
+
+  Each listed directory's subdirectories are queued for the threads in a LIFO
+  queue, so the threads list the directories the caller will reach next. The
+  caller lists a directory itself if no thread has started it by the time
+  it's reached, so the walk can't stall waiting for threads that are blocked
+  on MAX_BUFFERED_DIRS.
+  """
+
+  def __init__(self, thread_count):
+    self.queue = Queue.LifoQueue()
+    self.lock = threading.Lock()
+    self.buffered_dirs = threading.Semaphore(MAX_BUFFERED_DIRS)
+    self.stopped = False
+    self.threads = []
+    for _ in range(thread_count):
+      thread = threading.Thread(target=self._ListDirsFromQueue)
+      thread.daemon = True
+      thread.start()
+      self.threads.append(thread)
+
+  def Walk(self, root):
+    """Yields the files under the root _DirListing, in pre-order."""
+    stack = [root]
+    while stack:
+      listing = stack.pop()
+      if self._Claim(listing):
+        self._List(listing)
+      else:
+        # Wait with a timeout, so the wait can be interrupted by signals.
+        while not listing.done.wait(1):
+          pass
+      if listing.buffered:
+        self.buffered_dirs.release()
+      if listing.error:
+        raise listing.error
+      for result in listing.files:
+        yield result
+      stack.extend(reversed(listing.subdirs))
+      listing.files = listing.subdirs = None
+
+  def Stop(self):
+    """Stops the threads."""
+    self.stopped = True
+    for _ in self.threads:
+      self.buffered_dirs.release()
+      self.queue.put(None)
+    for thread in self.threads:
+      thread.join()
+
+  def _Claim(self, listing):
+    """Returns True if the calling thread should list the directory."""
+    with self.lock:
+      if listing.claimed:
+        return False
+      listing.claimed = True
+      return True
+
+  def _List(self, listing):
+    try:
+      _ListDir(listing)
+      if self.threads:
+        for subdir in reversed(listing.subdirs):
+          self.queue.put(subdir)
+    except Exception, e:
+      listing.error = e
+    finally:
+      listing.done.set()
+
+  def _ListDirsFromQueue(self):
+    while True:
+      # Wait for room to buffer a listing before taking a directory from the
+      # queue, so that a directory is never claimed by a thread that can't
+      # list it.
+      self.buffered_dirs.acquire()
+      listing = self.queue.get()
+      if listing is None or self.stopped:
+        return
+      if self._Claim(listing):
+        listing.buffered = True
+        self._List(listing)
+      else:
+        self.buffered_dirs.release()
@@ -13,13 +13,13 @@
 # limitations under the License.
 
 import copy
-import multiprocessing
 import wildcard_iterator
 
 from bucket_listing_ref import BucketListingRef
 from gslib.exception import CommandException
 from gslib.plurality_checkable_iterator import PluralityCheckableIterator
 from gslib.storage_uri_builder import StorageUriBuilder
+from gslib.util import CreateLock
 from wildcard_iterator import ContainsWildcard
 
 """
@@ -50,7 +50,8 @@ class NameExpansionResult(object):
 
   def __init__(self, src_uri_str, is_multi_src_request,
                src_uri_expands_to_multi, names_container, expanded_uri_str,
-               have_existing_dst_container=None, is_latest=False):
+               have_existing_dst_container=None, is_latest=False,
+               expanded_key_metadata=None, expanded_file_stat=None):
     """
     Args:
       src_uri_str: string representation of StorageUri that was expanded.
@@ -67,6 +68,13 @@ class NameExpansionResult(object):
           other than cp).
       is_latest: Bool indicating that the result represents the object's current
           version.
+      expanded_key_metadata: dictionary of the object metadata returned by the
+          bucket listing for expanded_uri_str (see
+          BucketListingRef.GetListedKeyMetadata()), or None if the name was
+          not expanded by listing a bucket.
+      expanded_file_stat: gslib.local_walker.FileStat of the file named by
+          expanded_uri_str, recorded when its directory was walked, or None if
+          not available.
     """
     self.src_uri_str = src_uri_str
     self.is_multi_src_request = is_multi_src_request
@@ -75,6 +83,11 @@ class NameExpansionResult(object):
     self.expanded_uri_str = expanded_uri_str
     self.have_existing_dst_container = have_existing_dst_container
     self.is_latest = is_latest
+    self.expanded_key_metadata = expanded_key_metadata
+    self.expanded_file_stat = expanded_file_stat
+    # Content type of the expanded local file, if it was detected ahead of
+    # time (see SetDetectedContentType()).
+    self.detected_content_type = None
 
   def __repr__(self):
     return '%s' % self.expanded_uri_str
@@ -115,6 +128,31 @@ class NameExpansionResult(object):
     """
     return self.expanded_uri_str
 
+  def GetExpandedKeyMetadata(self):
+    """
+    Returns the listed object metadata for the expanded StorageUri, or None if
+    not available.
+    """
+    return self.expanded_key_metadata
+
+  def GetExpandedFileStat(self):
+    """
+    Returns the FileStat of the expanded local file recorded when its
+    directory was walked, or None if not available.
+    """
+    return self.expanded_file_stat
+
+  def GetDetectedContentType(self):
+    """
+    Returns the content type detected for the expanded local file, or None if
+    it wasn't detected ahead of time.
+    """
+    return self.detected_content_type
+
+  def SetDetectedContentType(self, content_type):
+    """Records the content type detected for the expanded local file."""
+    self.detected_content_type = content_type
+
   def HaveExistingDstContainer(self):
     """Returns bool indicator whether this is a copy request to an
        existing bucket, bucket subdir, or directory, or None if not
@@ -264,7 +302,10 @@ class _NameExpansionIterator(object):
                                     src_uri_expands_to_multi, names_container,
                                     blr.GetUriString(),
                                     self.have_existing_dst_container,
-                                    is_latest=blr.IsLatest())
+                                    is_latest=blr.IsLatest(),
+                                    expanded_key_metadata=(
+                                        blr.GetListedKeyMetadata()),
+                                    expanded_file_stat=blr.GetFileStat())
           continue
         if not self.recursion_requested:
           if blr.GetUri().is_file_uri():
@@ -297,7 +338,10 @@ class _NameExpansionIterator(object):
                                     src_uri_expands_to_multi, True,
                                     blr.GetUriString(),
                                     self.have_existing_dst_container,
-                                    is_latest=blr.IsLatest())
+                                    is_latest=blr.IsLatest(),
+                                    expanded_key_metadata=(
+                                        blr.GetListedKeyMetadata()),
+                                    expanded_file_stat=blr.GetFileStat())
 
   def _WildcardIterator(self, uri_or_str):
     """
@@ -407,7 +451,7 @@ class NameExpansionIteratorQueue(object):
   def __init__(self, name_expansion_iterator, final_value):
     self.name_expansion_iterator = name_expansion_iterator
     self.final_value = final_value
-    self.lock = multiprocessing.Manager().Lock()
+    self.lock = CreateLock()
 
   def qsize(self):
     raise NotImplementedError(
@@ -14,9 +14,19 @@
 
 """Utility classes for the parallelism framework."""
 
+import hashlib
+import heapq
 import multiprocessing
+import os
 import threading
 
+# Policies for the order in which Command.Apply dispatches its tasks (see
+# ReorderingIterator).
+TASK_ORDER_FIFO = 'fifo'
+TASK_ORDER_LARGEST_FIRST = 'largest_first'
+TASK_ORDER_SHUFFLE = 'shuffle'
+TASK_ORDERS = (TASK_ORDER_FIFO, TASK_ORDER_LARGEST_FIRST, TASK_ORDER_SHUFFLE)
+
 class BasicIncrementDict(object):
   """
   Dictionary meant for storing any values for which the "+" operation is
@@ -83,4 +93,95 @@ class ThreadAndProcessSafeDict(object):
       
   def get(self, key, default_value=None):
     with self.lock:
-      return self.dict.get(key, default_value)
\ No newline at end of file
+      return self.dict.get(key, default_value)
+
+
+def GetTaskSize(args):
+  """
+  Returns the number of bytes that the task for args is expected to process,
+  for ordering purposes. For NameExpansionResults, this is the size from the
+  bucket listing, or for local files, the size recorded when their directory
+  was walked (or else from stat). Other arguments have size 0.
+  """
+  metadata = getattr(args, 'expanded_key_metadata', None)
+  if metadata and 'size' in metadata:
+    return int(metadata['size'])
+  get_file_stat = getattr(args, 'GetExpandedFileStat', None)
+  file_stat = get_file_stat() if get_file_stat else None
+  if file_stat:
+    return file_stat.size
+  uri_str = getattr(args, 'expanded_uri_str', None)
+  if uri_str and uri_str.startswith('file://'):
+    try:
+      return os.path.getsize(uri_str[len('file://'):])
+    except OSError:
+      # Let the task itself report the problem.
+      pass
+  return 0
+
+
+def GetTaskShuffleKey(args):
+  """
+  Returns a key for args that is unrelated to the lexical order of the names,
+  so that tasks on adjacent names are spread out.
+  """
+  name = getattr(args, 'expanded_uri_str', None)
+  if name is None:
+    name = repr(args)
+  if isinstance(name, unicode):
+    name = name.encode('utf-8')
+  return hashlib.md5(name).digest()
+
+
+class ReorderingIterator(object):
+  """
+  Iterator that reorders the arguments produced by another iterator within a
+  bounded window, so that at most window_size arguments are buffered at a
+  time. Once the window is full, each argument read from the wrapped iterator
+  causes the first argument in the window (according to the order policy) to
+  be returned:
+    TASK_ORDER_FIFO: the arguments are returned unchanged, in order.
+    TASK_ORDER_LARGEST_FIRST: the argument with the largest GetTaskSize, so
+        that long tasks don't start after everything else has finished.
+    TASK_ORDER_SHUFFLE: the argument with the smallest GetTaskShuffleKey,
+        which spreads requests across key ranges.
+
+  Exceptions raised by the wrapped iterator are passed through without losing
+  any buffered arguments, so that the caller can handle them and keep
+  iterating, as it would with the wrapped iterator.
+  """
+  def __init__(self, args_iterator, order, window_size):
+    self.args_iterator = iter(args_iterator)
+    self.order = order
+    self.window_size = max(1, window_size)
+    # Heap of (sort key, sequence number, args). The sequence number keeps
+    # the order stable for equal keys and means args are never compared.
+    self.heap = []
+    self.sequence_number = 0
+    self.exhausted = False
+
+  def __iter__(self):
+    return self
+
+  def _GetSortKey(self, args):
+    if self.order == TASK_ORDER_LARGEST_FIRST:
+      return -GetTaskSize(args)
+    elif self.order == TASK_ORDER_SHUFFLE:
+      return GetTaskShuffleKey(args)
+    return 0
+
+  def next(self):
+    if self.order == TASK_ORDER_FIFO:
+      return self.args_iterator.next()
+    while not self.exhausted and len(self.heap) < self.window_size:
+      try:
+        args = self.args_iterator.next()
+      except StopIteration:
+        self.exhausted = True
+        break
+      heapq.heappush(self.heap,
+                     (self._GetSortKey(args), self.sequence_number, args))
+      self.sequence_number += 1
+    if not self.heap:
+      raise StopIteration
+    return heapq.heappop(self.heap)[2]
@@ -67,3 +67,40 @@ class TestCat(testcase.GsUtilIntegrationTestCase):
     stderr = self.RunGsUtil(['cat', uri2.version_specific_uri + '23'],
                             return_stderr=True, expected_status=1)
     self.assertIn('InvalidUriError', stderr)
+
+  def test_cat_multiple_objects_in_order(self):
+    bucket_uri = self.CreateBucket()
+    for i in range(10):
+      self.CreateObject(bucket_uri=bucket_uri, object_name='obj%d' % i,
+                        contents='data%d\n' % i)
+    expected = ''.join('data%d\n' % i for i in range(10))
+    stdout = self.RunGsUtil(['cat', suri(bucket_uri, 'obj*')],
+                            return_stdout=True)
+    self.assertEqual(expected, stdout)
+    # With -m, the objects are read ahead in parallel, but output in order.
+    stdout = self.RunGsUtil(['-m', 'cat', suri(bucket_uri, 'obj*')],
+                            return_stdout=True)
+    self.assertEqual(expected, stdout)
+    stdout = self.RunGsUtil(['-m', 'cat', '-r', '-2', suri(bucket_uri, 'obj*')],
+                            return_stdout=True)
+    self.assertEqual(''.join('%d\n' % i for i in range(10)), stdout)
+    stderr = self.RunGsUtil(['-m', 'cat', '-h', suri(bucket_uri, 'obj*')],
+                            return_stderr=True)
+    self.assertEqual(['==> %s <==' % suri(bucket_uri, 'obj%d' % i)
+                      for i in range(10)],
+                     [line for line in stderr.splitlines()
+                      if line.startswith('==>')])
+
+  def test_cat_gzip_encoded(self):
+    bucket_uri = self.CreateBucket()
+    contents = ''.join('line %d\n' % i for i in range(10000))
+    fpath = self.CreateTempFile(file_name='data.txt', contents=contents)
+    self.RunGsUtil(['cp', '-z', 'txt', fpath, suri(bucket_uri)])
+    # The service decompresses the object, so all of the uncompressed data is
+    # output, even though it's longer than the object.
+    stdout = self.RunGsUtil(['cat', suri(bucket_uri, 'data.txt')],
+                            return_stdout=True)
+    self.assertEqual(contents, stdout)
+    stdout = self.RunGsUtil(['-m', 'cat', suri(bucket_uri, 'data.*')],
+                            return_stdout=True)
+    self.assertEqual(contents, stdout)
@@ -14,6 +14,7 @@
 
 import gslib.tests.testcase as testcase
 
+from gslib.commands.compose import MAX_COMPONENT_COUNT
 from gslib.commands.compose import MAX_COMPOSE_ARITY
 from gslib.tests.util import HAS_S3_CREDS
 from gslib.tests.util import ObjectToURI as suri
@@ -37,7 +38,7 @@ class TestCompose(testcase.GsUtilIntegrationTestCase):
     self.assertEqual(composite.get_contents_as_string(), ''.join(data_list))
 
   def test_compose_too_many_fails(self):
-    components = ['gs://b/component-obj'] * (MAX_COMPOSE_ARITY + 1)
+    components = ['gs://b/component-obj'] * (MAX_COMPONENT_COUNT + 1)
     stderr = self.RunGsUtil(['compose'] + components + ['gs://b/composite-obj'],
                             expected_status=1, return_stderr=True)
     self.assertIn('command accepts at most', stderr)
@@ -93,6 +94,37 @@ class TestCompose(testcase.GsUtilIntegrationTestCase):
   def test_maximal_compose(self):
     self.check_n_ary_compose(MAX_COMPOSE_ARITY)
 
+  def test_hierarchical_compose(self):
+    bucket_uri = self.CreateBucket()
+
+    data_list = ['data-%d,' % i for i in xrange(MAX_COMPOSE_ARITY + 2)]
+    components = [self.CreateObject(bucket_uri=bucket_uri, contents=data).uri
+                  for data in data_list]
+
+    composite = bucket_uri.clone_replace_name(self.MakeTempName('obj'))
+
+    self.RunGsUtil(['-m', 'compose'] + components + [composite.uri])
+    self.assertEqual(composite.get_contents_as_string(), ''.join(data_list))
+    # The intermediate objects should have been deleted.
+    stdout = self.RunGsUtil(['ls', suri(bucket_uri)], return_stdout=True)
+    self.assertEqual(len(components) + 1, len(stdout.splitlines()))
+
+  def test_hierarchical_compose_with_precondition(self):
+    bucket_uri = self.CreateBucket()
+
+    data_list = ['data-%d,' % i for i in xrange(MAX_COMPOSE_ARITY + 2)]
+    components = [self.CreateObject(bucket_uri=bucket_uri, contents=data).uri
+                  for data in data_list]
+
+    composite = self.CreateObject(bucket_uri=bucket_uri, contents='old')
+    generation = composite.get_key().generation
+
+    # The precondition applies to the final object only, not to the
+    # intermediate objects.
+    self.RunGsUtil(['-h', 'x-goog-if-generation-match:%s' % generation,
+                    'compose'] + components + [suri(composite)])
+    self.assertEqual(composite.get_contents_as_string(), ''.join(data_list))
+
   def test_compose_with_wildcard(self):
     bucket_uri = self.CreateBucket()
 
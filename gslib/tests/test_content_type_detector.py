@@ -0,0 +1,55 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gslib.tests.testcase as testcase
+import unittest
+
+from gslib.content_type_detector import ContentTypeDetector
+from gslib.util import IS_WINDOWS
+
+class TestContentTypeDetector(testcase.GsUtilUnitTestCase):
+  """Unit tests for content_type_detector.py"""
+
+  def test_guess_from_extension(self):
+    detector = ContentTypeDetector(False)
+    self.assertEqual('text/html', detector.Detect('foo.html'))
+    self.assertEqual(None, detector.Detect('foo'))
+
+  @unittest.skipIf(IS_WINDOWS, 'The file command is not available on Windows.')
+  def test_magicfile(self):
+    detector = ContentTypeDetector(True)
+    try:
+      text_path = self.CreateTempFile(file_name='foo.dat', contents='hello\n')
+      gzip_path = self.CreateTempFile(
+          file_name='bar.dat', contents='\x1f\x8b\x08\x00' + '\x00' * 100)
+      content_types = detector.DetectMany([text_path, gzip_path])
+      self.assertEqual('text/plain', content_types[text_path])
+      self.assertIn('gzip', content_types[gzip_path])
+      # A file with the same extension and contents is classified by the cache.
+      other_text_path = self.CreateTempFile(file_name='baz.dat',
+                                            contents='hello\n')
+      detector.Close()
+      self.assertEqual('text/plain', detector.Detect(other_text_path))
+      self.assertEqual(None, detector._proc)
+    finally:
+      detector.Close()
+
+  @unittest.skipIf(IS_WINDOWS, 'The file command is not available on Windows.')
+  def test_magicfile_newline_in_name(self):
+    detector = ContentTypeDetector(True)
+    try:
+      path = self.CreateTempFile(file_name='foo\nbar', contents='hello\n')
+      self.assertEqual('text/plain', detector.Detect(path))
+    finally:
+      detector.Close()
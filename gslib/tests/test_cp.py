@@ -28,6 +28,7 @@ from boto.storage_uri import BucketStorageUri
 from gslib.commands.config import DEFAULT_PARALLEL_COMPOSITE_UPLOAD_THRESHOLD
 from gslib.commands.cp import FilterExistingComponents
 from gslib.commands.cp import MakeGsUri
+from gslib.commands.cp import MIN_SLICED_DOWNLOAD_OBJECT_SIZE
 from gslib.commands.cp import ObjectFromTracker
 from gslib.commands.cp import PerformResumableUploadIfAppliesArgs
 from gslib.storage_uri_builder import StorageUriBuilder
@@ -414,6 +415,52 @@ class TestCp(testcase.GsUtilIntegrationTestCase):
     stdout = self.RunGsUtil(['cp', suri(key_uri), '-'], return_stdout=True)
     self.assertIn(contents, stdout)
 
+  def _CreateBotoConfigWithOption(self, name, value):
+    """
+    Returns the path of a copy of the boto config file in which the named
+    option in the [GSUtil] section is set to value.
+    """
+    tmp_filename = self.CreateTempFile()
+    old_value = boto.config.get('GSUtil', name, None)
+    boto.config.set('GSUtil', name, value)
+    try:
+      with open(tmp_filename, 'w') as tmp_file:
+        boto.config.write(tmp_file)
+    finally:
+      if old_value is None:
+        boto.config.remove_option('GSUtil', name)
+      else:
+        boto.config.set('GSUtil', name, old_value)
+    return tmp_filename
+
+  def _CreateSlicedDownloadBotoConfig(self):
+    """
+    Returns the path of a copy of the boto config file that makes cp download
+    every object large enough to be sliced in slices.
+    """
+    return self._CreateBotoConfigWithOption(
+        'sliced_object_download_threshold', '1')
+
+  def test_cp_key_to_local_stream_sliced(self):
+    bucket_uri = self.CreateBucket()
+    contents = os.urandom(1024) * (MIN_SLICED_DOWNLOAD_OBJECT_SIZE / 1024 + 1)
+    key_uri = self.CreateObject(bucket_uri=bucket_uri, contents=contents)
+    with SetBotoConfigForTest(self._CreateSlicedDownloadBotoConfig()):
+      stdout = self.RunGsUtil(['cp', suri(key_uri), '-'], return_stdout=True)
+    self.assertEqual(contents, stdout)
+
+  def test_cp_key_to_local_file_sliced(self):
+    bucket_uri = self.CreateBucket()
+    contents = os.urandom(1024) * (MIN_SLICED_DOWNLOAD_OBJECT_SIZE / 1024 + 1)
+    key_uri = self.CreateObject(bucket_uri=bucket_uri, contents=contents)
+    fpath = os.path.join(self.CreateTempDir(), 'obj')
+    with SetBotoConfigForTest(self._CreateSlicedDownloadBotoConfig()):
+      for cp_args in (['cp'], ['-m', 'cp']):
+        self.RunGsUtil(cp_args + [suri(key_uri), fpath])
+        with open(fpath, 'rb') as f:
+          self.assertEqual(contents, f.read())
+        os.unlink(fpath)
+
   def test_cp_local_file_to_local_stream(self):
     contents = 'content'
     fpath = self.CreateTempFile(contents=contents)
@@ -567,6 +614,27 @@ class TestCp(testcase.GsUtilIntegrationTestCase):
     with open(fpath2, 'r') as f:
       self.assertEqual(f.read(), contents)
 
+  def test_gzip_resumable_upload(self):
+    # Files at least as large as the resumable threshold are compressed to a
+    # temporary file and uploaded resumably, so the manifest records the
+    # upload ID.
+    key_uri = self.CreateObject()
+    contents = os.urandom(1024) * 100
+    fpath1 = self.CreateTempFile(file_name='test.html', contents=contents)
+    logpath = self.CreateTempFile(contents='')
+    with SetBotoConfigForTest(
+        self._CreateBotoConfigWithOption('resumable_threshold', '1024')):
+      self.RunGsUtil(['cp', '-z', 'html', '-L', logpath, suri(fpath1),
+                      suri(key_uri)])
+    with open(logpath, 'r') as f:
+      results = f.readlines()[1].strip().split(',')
+    self.assertNotEqual('', results[5])  # UploadId
+    self.assertEqual('OK', results[8])  # Result
+    fpath2 = self.CreateTempFile()
+    self.RunGsUtil(['cp', suri(key_uri), suri(fpath2)])
+    with open(fpath2, 'rb') as f:
+      self.assertEqual(contents, f.read())
+
   def test_upload_with_subdir_and_unexpanded_wildcard(self):
     fpath1 = self.CreateTempFile(file_name=('tmp', 'x', 'y', 'z'))
     bucket_uri = self.CreateBucket()
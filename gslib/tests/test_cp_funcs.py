@@ -12,19 +12,60 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import random
+
 from gslib.commands.cp import _AppendComponentTrackerToParallelUploadTrackerFile
 from gslib.commands.cp import _GetPartitionInfo
 from gslib.commands.cp import _HashFilename
+from gslib.commands.cp import _ListComponentEtags
 from gslib.commands.cp import _ParseParallelUploadTrackerFile
 from gslib.commands.cp import _CreateParallelUploadTrackerFile
+from gslib.commands.cp import _Manifest
+from gslib.commands.cp import _ReadSlicedDownloadTrackerFile
+from gslib.commands.cp import _WriteSlicedDownloadTrackerFile
+from gslib.commands.cp import FilterExistingComponents
+from gslib.commands.cp import MakeGsUri
 from gslib.commands.cp import ObjectFromTracker
+from gslib.commands.cp import PerformResumableUploadIfAppliesArgs
+from gslib.storage_uri_builder import StorageUriBuilder
+from gslib.tests.testcase.unit_testcase import GSMockBucketStorageUri
 from gslib.tests.testcase.unit_testcase import GsUtilUnitTestCase
+from gslib.tests.util import ObjectToURI as suri
+from gslib.tracker_store import GetTrackerStore
 from gslib.util import CreateLock
 
 
+class _ListingGSMockBucketStorageUri(GSMockBucketStorageUri):
+  """
+  Mock bucket URI whose listings include the objects' ETags (quoted, as in the
+  service's listings), and which records the prefixes it lists.
+  """
+
+  listed_prefixes = []
+
+  def list_bucket(self, prefix='', delimiter='', headers=None,
+                  all_versions=False):
+    self.listed_prefixes.append(prefix)
+    bucket = self.get_bucket()
+    keys = super(_ListingGSMockBucketStorageUri, self).list_bucket(
+        prefix=prefix, delimiter=delimiter)
+    for key in keys:
+      key.etag = '"%s"' % bucket.get_key(key.name).etag
+    return keys
+
+
 class TestCpFuncs(GsUtilUnitTestCase):
   """Unit tests for functions in cp command."""
 
+  def _MakeTrackerName(self, contents=None):
+    """Returns the name of a new tracker in the tracker store."""
+    name = 'test_tracker_%d' % random.randint(0, 10 ** 10)
+    if contents is not None:
+      GetTrackerStore().Put(name, contents)
+    self.addCleanup(GetTrackerStore().Delete, [name])
+    return name
+
   def test_HashFilename(self):
     # Tests that _HashFilename function works for both string and unicode
     # filenames (without raising any Unicode encode/decode errors).
@@ -76,17 +117,16 @@ class TestCpFuncs(GsUtilUnitTestCase):
     random_prefix = '123'
     objects = ['obj1', '42', 'obj2', '314159']
     contents = '\n'.join([random_prefix] + objects)
-    fpath = self.CreateTempFile(file_name='foo',
-                                contents=contents)
+    tracker_file = self._MakeTrackerName(contents)
     expected_objects = [ObjectFromTracker(objects[2 * i], objects[2 * i + 1])
                        for i in range(0, len(objects) / 2)]
     (actual_prefix, actual_objects) = _ParseParallelUploadTrackerFile(
-        fpath, tracker_file_lock)
+        tracker_file, tracker_file_lock)
     self.assertEqual(random_prefix, actual_prefix)
     self.assertEqual(expected_objects, actual_objects)
 
   def test_CreateParallelUploadTrackerFile(self):
-    tracker_file = self.CreateTempFile(file_name='foo', contents='asdf')
+    tracker_file = self._MakeTrackerName('asdf')
     tracker_file_lock = CreateLock()
     random_prefix = '123'
     objects = ['obj1', '42', 'obj2', '314159']
@@ -95,12 +135,11 @@ class TestCpFuncs(GsUtilUnitTestCase):
                        for i in range(0, len(objects) / 2)]
     _CreateParallelUploadTrackerFile(tracker_file, random_prefix, objects,
                                      tracker_file_lock)
-    with open(tracker_file, 'rb') as f:
-      lines = f.read().splitlines()
+    lines = GetTrackerStore().Get(tracker_file).splitlines()
     self.assertEqual(expected_contents, lines)
 
   def test_AppendComponentTrackerToParallelUploadTrackerFile(self):
-    tracker_file = self.CreateTempFile(file_name='foo', contents='asdf')
+    tracker_file = self._MakeTrackerName('asdf')
     tracker_file_lock = CreateLock()
     random_prefix = '123'
     objects = ['obj1', '42', 'obj2', '314159']
@@ -115,6 +154,121 @@ class TestCpFuncs(GsUtilUnitTestCase):
     new_object = ObjectFromTracker(new_object[0], new_object[1])
     _AppendComponentTrackerToParallelUploadTrackerFile(tracker_file, new_object,
                                                        tracker_file_lock)
-    with open(tracker_file, 'rb') as f:
-      lines = f.read().splitlines()
+    lines = GetTrackerStore().Get(tracker_file).splitlines()
     self.assertEqual(expected_contents, lines)
+
+  def test_SlicedDownloadTrackerFile(self):
+    tracker_file = self._MakeTrackerName('asdf')
+    etag = '"0123456789abcdef"'
+
+    # Unparseable trackers are ignored.
+    self.assertEqual(0, _ReadSlicedDownloadTrackerFile(tracker_file, etag))
+
+    _WriteSlicedDownloadTrackerFile(tracker_file, etag, 4096)
+    self.assertEqual(4096, _ReadSlicedDownloadTrackerFile(tracker_file, etag))
+
+    # Trackers written for another version of the object are ignored.
+    self.assertEqual(0, _ReadSlicedDownloadTrackerFile(tracker_file, '"1"'))
+
+    # So are trackers that don't exist.
+    GetTrackerStore().Delete([tracker_file])
+    self.assertEqual(0, _ReadSlicedDownloadTrackerFile(tracker_file, etag))
+
+  def test_Manifest(self):
+    manifest_dir = self.CreateTempDir()
+    manifest_path = os.path.join(manifest_dir, 'manifest.csv')
+
+    manifest = _Manifest(manifest_path)
+    for (name, result) in (('a', 'OK'), ('b', 'error'), ('c', 'skip')):
+      manifest.Initialize('file://' + name, 'gs://bucket/' + name)
+      manifest.SetResult('file://' + name, 1, result)
+    # Rows are written to a part file until the manifest is closed.
+    self.assertEqual(2, len(os.listdir(manifest_dir)))
+    manifest.Close()
+    self.assertEqual(['manifest.csv'], os.listdir(manifest_dir))
+    with open(manifest_path, 'rb') as f:
+      self.assertEqual(4, len(f.read().splitlines()))
+
+    # A new run skips the items that succeeded, and only indexes the rows
+    # written since the previous run.
+    manifest = _Manifest(manifest_path)
+    self.assertTrue(manifest.WasSuccessful('file://a'))
+    self.assertFalse(manifest.WasSuccessful('file://b'))
+    self.assertTrue(manifest.WasSuccessful('file://c'))
+    manifest.Initialize('file://b', 'gs://bucket/b')
+    manifest.SetResult('file://b', 1, 'OK')
+    manifest.Close()
+    manifest = _Manifest(manifest_path)
+    self.assertTrue(manifest.WasSuccessful('file://b'))
+    manifest.Close()
+
+  def test_GetKeyFromListedMetadata(self):
+    bucket_uri = self.CreateBucket()
+    src_uri = self._test_storage_uri(suri(bucket_uri, 'obj#1234'))
+    self.assertTrue(src_uri.is_version_specific)
+    metadata = {'size': 3, 'etag': '"900150983cd24fb0d6963f7d28e17f72"'}
+    cp_command = self.command_runner.command_map['cp'](
+        self.command_runner, [src_uri.uri, 'gs://b'], {}, 0, False,
+        self.command_runner.config_file_list, self.mock_bucket_storage_uri)
+    cp_command._SetDefaultCopyOptions()
+    for dst_uri_str in (suri(bucket_uri, 'copy'),
+                        'file://' + self.CreateTempFile()):
+      src_key = cp_command._GetKeyFromListedMetadata(
+          src_uri, self._test_storage_uri(dst_uri_str), metadata, True, {})
+      self.assertEqual(3, src_key.size)
+      # The Key keeps the version named by the listed URI.
+      self.assertEqual(1234, int(src_key.generation))
+
+  def test_FilterExistingComponents(self):
+    suri_builder = StorageUriBuilder(0, _ListingGSMockBucketStorageUri)
+    bucket_uri = self.CreateBucket()
+    bucket_name = 'gs://' + bucket_uri.bucket_name
+    fpath = self.CreateTempFile(contents='abcd')
+    tracker_file = self._MakeTrackerName()
+    tracker_file_lock = CreateLock()
+    dst_args = {}
+    for (i, name) in enumerate(('comp_0', 'comp_1', 'comp_2', 'comp_3')):
+      dst_args[name] = PerformResumableUploadIfAppliesArgs(
+          fpath, i, 1, fpath, MakeGsUri(bucket_name, name, suri_builder),
+          None, {}, tracker_file, tracker_file_lock)
+    # comp_0 matches its part of the file, comp_1 doesn't, comp_2 no longer
+    # exists, and comp_3 was never uploaded. The other objects share the
+    # components' prefix, but aren't components (comp_10 even has the
+    # contents of one of the file's parts).
+    self.CreateObject(bucket_uri=bucket_uri, object_name='comp_0',
+                      contents='a')
+    self.CreateObject(bucket_uri=bucket_uri, object_name='comp_1',
+                      contents='x')
+    self.CreateObject(bucket_uri=bucket_uri, object_name='comp_10',
+                      contents='b')
+    self.CreateObject(bucket_uri=bucket_uri, object_name='comp_unrelated',
+                      contents='c')
+    existing_components = [ObjectFromTracker('comp_0', '1'),
+                           ObjectFromTracker('comp_1', '2'),
+                           ObjectFromTracker('comp_2', '3')]
+
+    _ListingGSMockBucketStorageUri.listed_prefixes = []
+    etags = _ListComponentEtags(
+        [dst_args[component.object_name] for component in existing_components],
+        bucket_name, suri_builder)
+    self.assertEqual(['comp_'], _ListingGSMockBucketStorageUri.listed_prefixes)
+    self.assertEqual(
+        {'comp_0': '"0cc175b9c0f1b6a831c399e269772661"',
+         'comp_1': '"9dd4e461268c8034f5c8564e155c67a6"'},
+        etags)
+
+    (components_to_upload, uploaded_components, existing_objects_to_delete) = (
+        FilterExistingComponents(dst_args, existing_components, bucket_name,
+                                 suri_builder))
+    self.assertEqual(
+        ['comp_1', 'comp_2', 'comp_3'],
+        sorted(arg.dst_uri.object_name for arg in components_to_upload))
+    self.assertEqual(
+        [('comp_0', '1')],
+        [(uri.object_name, uri.generation) for uri in uploaded_components])
+    # The components that didn't match are deleted (as they have
+    # generations), but none of the unrelated objects are.
+    self.assertEqual(
+        [('comp_1', '2'), ('comp_2', '3')],
+        sorted((uri.object_name, uri.generation)
+               for uri in existing_objects_to_delete))
@@ -0,0 +1,202 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gslib.tests.testcase as testcase
+import os
+import random
+import threading
+import time
+
+from gslib.daisy_chain_wrapper import DAISY_CHAIN_CHUNK_SIZE
+from gslib.daisy_chain_wrapper import DaisyChainWrapper
+from gslib.daisy_chain_wrapper import ReadAheadStream
+
+
+class _FakeKey(object):
+  """
+  Stands in for a boto Key, serving downloads (ranged, or else of all of the
+  contents) from a string.
+  """
+
+  def __init__(self, contents, fail_after=None):
+    self.name = 'obj'
+    self.size = len(contents)
+    self.resp = None
+    self.contents = contents
+    self.fail_after = fail_after
+    self.ranges = []
+    self.lock = threading.Lock()
+
+  def get_file(self, fp, headers=None, cb=None, num_cb=10, hash_algs=None):
+    if 'Range' in headers:
+      (start, end) = [int(pos) for pos in
+                      headers['Range'][len('bytes='):].split('-')]
+    else:
+      (start, end) = (0, len(self.contents) - 1)
+    with self.lock:
+      self.ranges.append((start, end))
+    for pos in range(start, end + 1, 1000):
+      if self.fail_after is not None and pos >= self.fail_after:
+        raise IOError('Connection reset')
+      fp.write(self.contents[pos:min(pos + 1000, end + 1)])
+
+
+class TestDaisyChainWrapper(testcase.GsUtilUnitTestCase):
+  """Unit tests for daisy_chain_wrapper.py"""
+
+  def _MakeContents(self):
+    rand = random.Random(0)
+    return ''.join(rand.choice('abcdefgh')
+                   for _ in range(3 * DAISY_CHAIN_CHUNK_SIZE + 17))
+
+  def _ReadAll(self, fp, chunk_size):
+    data = []
+    while True:
+      chunk = fp.read(chunk_size)
+      if not chunk:
+        return ''.join(data)
+      data.append(chunk)
+
+  def test_read(self):
+    contents = self._MakeContents()
+    for chunk_size in (1000, DAISY_CHAIN_CHUNK_SIZE, -1):
+      key = _FakeKey(contents)
+      fp = DaisyChainWrapper(key)
+      try:
+        self.assertEqual(contents, self._ReadAll(fp, chunk_size))
+        self.assertEqual(len(contents), fp.tell())
+      finally:
+        fp.close()
+      self.assertEqual([(0, len(contents) - 1)], key.ranges)
+
+  def test_read_range(self):
+    contents = self._MakeContents()
+    key = _FakeKey(contents)
+    fp = DaisyChainWrapper(key, {}, 100, 2 * DAISY_CHAIN_CHUNK_SIZE)
+    try:
+      self.assertEqual(2 * DAISY_CHAIN_CHUNK_SIZE - 99, fp.size)
+      self.assertEqual(contents[100:2 * DAISY_CHAIN_CHUNK_SIZE + 1],
+                       self._ReadAll(fp, 12345))
+    finally:
+      fp.close()
+
+  def test_seek(self):
+    contents = self._MakeContents()
+    key = _FakeKey(contents)
+    fp = DaisyChainWrapper(key)
+    try:
+      # Determining the size doesn't start a download.
+      fp.seek(0, os.SEEK_END)
+      self.assertEqual(len(contents), fp.tell())
+      fp.seek(0)
+      self.assertEqual([], key.ranges)
+      self.assertEqual(contents[:5000], fp.read(5000))
+      # Short forward seeks skip over downloaded data.
+      fp.seek(10000)
+      self.assertEqual(contents[10000:11000], fp.read(1000))
+      self.assertEqual(1, len(key.ranges))
+      # Seeking backwards restarts the download.
+      fp.seek(100)
+      self.assertEqual(contents[100:], self._ReadAll(fp, 54321))
+      self.assertEqual([(0, len(contents) - 1), (100, len(contents) - 1)],
+                       key.ranges)
+      self.assertEqual('', fp.read(1))
+    finally:
+      fp.close()
+
+  def test_start_download(self):
+    contents = self._MakeContents()
+    key = _FakeKey(contents)
+    fp = DaisyChainWrapper(key, max_buffered_chunks=1)
+    try:
+      fp.StartDownload()
+      # The download proceeds until the buffer is full, before any reads.
+      while fp._thread.queue.qsize() < 1:
+        time.sleep(0.01)
+      self.assertEqual([(0, len(contents) - 1)], key.ranges)
+      self.assertEqual(contents, self._ReadAll(fp, 54321))
+      self.assertEqual(1, len(key.ranges))
+    finally:
+      fp.close()
+
+  def test_download_error(self):
+    contents = self._MakeContents()
+    key = _FakeKey(contents, fail_after=DAISY_CHAIN_CHUNK_SIZE + 5000)
+    fp = DaisyChainWrapper(key)
+    try:
+      self.assertEqual(contents[:DAISY_CHAIN_CHUNK_SIZE],
+                       fp.read(DAISY_CHAIN_CHUNK_SIZE))
+      self.assertRaises(IOError, self._ReadAll, fp, 1000)
+      # A retry (which seeks back) downloads the data again.
+      key.fail_after = None
+      fp.seek(0)
+      self.assertEqual(contents, self._ReadAll(fp, 1000))
+    finally:
+      fp.close()
+
+  def test_close_before_end(self):
+    key = _FakeKey(self._MakeContents())
+    thread_count = threading.active_count()
+    fp = DaisyChainWrapper(key)
+    fp.read(1000)
+    self.assertEqual(thread_count + 1, threading.active_count())
+    # Closing stops the download thread, which is blocked on the full buffer.
+    fp.close()
+    self.assertEqual(thread_count, threading.active_count())
+
+
+class TestReadAheadStream(testcase.GsUtilUnitTestCase):
+  """Unit tests for ReadAheadStream."""
+
+  def test_read_whole_response(self):
+    contents = 3 * DAISY_CHAIN_CHUNK_SIZE * 'a' + 'b'
+    for chunk_size in (1000, DAISY_CHAIN_CHUNK_SIZE, -1):
+      key = _FakeKey(contents)
+      # The response is read to its end, even if it's longer than the
+      # object's size (as it is when the service decompresses the object).
+      key.size = 100
+      fp = ReadAheadStream(key, {}, max_buffered_chunks=1)
+      try:
+        fp.StartDownload()
+        data = []
+        while True:
+          chunk = fp.read(chunk_size)
+          if not chunk:
+            break
+          data.append(chunk)
+        self.assertEqual(contents, ''.join(data))
+        self.assertEqual('', fp.read())
+      finally:
+        fp.close()
+      self.assertEqual([(0, len(contents) - 1)], key.ranges)
+
+  def test_download_error(self):
+    key = _FakeKey(3 * DAISY_CHAIN_CHUNK_SIZE * 'a',
+                   fail_after=DAISY_CHAIN_CHUNK_SIZE + 5000)
+    fp = ReadAheadStream(key)
+    try:
+      self.assertEqual(DAISY_CHAIN_CHUNK_SIZE * 'a',
+                       fp.read(DAISY_CHAIN_CHUNK_SIZE))
+      self.assertRaises(IOError, fp.read)
+    finally:
+      fp.close()
+
+  def test_close_before_end(self):
+    key = _FakeKey(3 * DAISY_CHAIN_CHUNK_SIZE * 'a')
+    thread_count = threading.active_count()
+    fp = ReadAheadStream(key, max_buffered_chunks=1)
+    fp.read(1000)
+    self.assertEqual(thread_count + 1, threading.active_count())
+    fp.close()
+    self.assertEqual(thread_count, threading.active_count())
@@ -15,7 +15,9 @@
 import gslib.tests.testcase as testcase
 import os
 
+from gslib.file_part import _mappings
 from gslib.file_part import FilePart
+from gslib.file_part import MappedFilePart
 
 class TestFilePart(testcase.GsUtilUnitTestCase):
   """Unit tests for file_part.py"""
@@ -96,3 +98,62 @@ class TestFilePart(testcase.GsUtilUnitTestCase):
 
     empty_file = fp.read()
     self.assertEqual('', empty_file)
+
+  def test_readinto(self):
+    contents = ''.join(str(i) for i in range(1, 256))
+    part_length = 23
+    start_pos = 50
+    fpath = self.CreateTempFile(file_name='test_readinto', contents=contents)
+    fp = FilePart(fpath, start_pos, part_length)
+    buf = bytearray(10)
+    self.assertEqual(10, fp.readinto(buf))
+    self.assertEqual(contents[start_pos:(start_pos + 10)], str(buf))
+
+    # Reads stop at the end of the part.
+    buf = bytearray(100)
+    self.assertEqual(part_length - 10, fp.readinto(buf))
+    self.assertEqual(
+        contents[(start_pos + 10):(start_pos + part_length)],
+        str(buf[:part_length - 10]))
+    self.assertEqual(0, fp.readinto(buf))
+
+
+class TestMappedFilePart(testcase.GsUtilUnitTestCase):
+  """Unit tests for MappedFilePart in file_part.py"""
+
+  def _MakeFile(self):
+    contents = ''.join(str(i) for i in range(1, 256))
+    return (self.CreateTempFile(file_name='test_mapped', contents=contents),
+            contents)
+
+  def test_read_and_seek(self):
+    (fpath, contents) = self._MakeFile()
+    fp = MappedFilePart(fpath, 50, 23)
+    with fp:
+      self.assertEqual(contents[50:60], fp.read(10))
+      self.assertEqual(10, fp.tell())
+      self.assertEqual(contents[60:73], fp.read())
+      self.assertEqual('', fp.read(100))
+      fp.seek(-3, os.SEEK_END)
+      self.assertEqual(contents[70:73], fp.read(100))
+      fp.seek(5)
+      fp.seek(2, os.SEEK_CUR)
+      self.assertEqual(7, fp.tell())
+      buf = bytearray(100)
+      self.assertEqual(16, fp.readinto(buf))
+      self.assertEqual(contents[57:73], str(buf[:16]))
+      self.assertEqual(contents[55:65], str(fp.GetView(5, 10)))
+      self.assertEqual(contents[50:73], str(fp.GetView()))
+
+  def test_shared_mapping(self):
+    (fpath, contents) = self._MakeFile()
+    fp1 = MappedFilePart(fpath, 0, 100)
+    fp2 = MappedFilePart(fpath, 100, 100)
+    self.assertEqual(1, len(_mappings))
+    self.assertEqual(contents[100:200], fp2.read())
+    fp1.close()
+    self.assertEqual(1, len(_mappings))
+    self.assertEqual(contents[100:110], str(fp2.GetView(0, 10)))
+    fp2.close()
+    fp2.close()
+    self.assertEqual(0, len(_mappings))
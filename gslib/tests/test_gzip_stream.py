@@ -0,0 +1,128 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gslib.tests.testcase as testcase
+import gzip
+import os
+import random
+import StringIO
+
+from hashlib import md5
+from gslib.gzip_stream import GzipCompressingReader
+from gslib.gzip_stream import GzipDecompressingWriter
+from gslib.gzip_stream import READ_SIZE
+
+class TestGzipStream(testcase.GsUtilUnitTestCase):
+  """Unit tests for gzip_stream.py"""
+
+  def _Decompress(self, data):
+    return gzip.GzipFile(fileobj=StringIO.StringIO(data), mode='rb').read()
+
+  def _Compress(self, data):
+    buf = StringIO.StringIO()
+    gzip_file = gzip.GzipFile(fileobj=buf, mode='wb')
+    gzip_file.write(data)
+    gzip_file.close()
+    return buf.getvalue()
+
+  def _ReadAll(self, fp, chunk_size):
+    chunks = []
+    data = fp.read(chunk_size)
+    while data:
+      chunks.append(data)
+      data = fp.read(chunk_size)
+    return ''.join(chunks)
+
+  def _MakeContents(self):
+    # Random enough that the compressed data spans several reads.
+    rand = random.Random(0)
+    return ''.join(rand.choice('abcdefgh') for _ in range(3 * READ_SIZE))
+
+  def test_read(self):
+    contents = self._MakeContents()
+    fp = GzipCompressingReader(StringIO.StringIO(contents))
+    compressed = self._ReadAll(fp, 8192)
+    self.assertEqual(len(compressed), fp.tell())
+    self.assertLess(len(compressed), len(contents))
+    self.assertEqual(contents, self._Decompress(compressed))
+
+  def test_read_all_at_once(self):
+    fp = GzipCompressingReader(StringIO.StringIO('plaintext'))
+    self.assertEqual('plaintext', self._Decompress(fp.read()))
+    self.assertEqual('', fp.read())
+
+  def test_empty_file(self):
+    fp = GzipCompressingReader(StringIO.StringIO(''))
+    self.assertEqual('', self._Decompress(self._ReadAll(fp, 100)))
+
+  def test_seek(self):
+    contents = self._MakeContents()
+    fp = GzipCompressingReader(StringIO.StringIO(contents))
+    compressed = self._ReadAll(fp, 1000)
+
+    # Seeking back compresses the file again, producing the same data.
+    fp.seek(0)
+    self.assertEqual(0, fp.tell())
+    self.assertEqual(compressed, self._ReadAll(fp, 777))
+
+    offset = len(compressed) / 2
+    fp.seek(offset)
+    self.assertEqual(offset, fp.tell())
+    self.assertEqual(compressed[offset:], self._ReadAll(fp, 4096))
+
+  def _WriteInChunks(self, fp, data, chunk_size):
+    for i in range(0, len(data), chunk_size):
+      fp.write(data[i:i + chunk_size])
+
+  def test_write(self):
+    contents = self._MakeContents()
+    compressed = self._Compress(contents)
+    out = StringIO.StringIO()
+    fp = GzipDecompressingWriter(out, {'md5': md5})
+    self._WriteInChunks(fp, compressed, 1000)
+    fp.flush()
+    self.assertEqual(contents, out.getvalue())
+    self.assertEqual(len(compressed), fp.tell())
+    self.assertEqual({'md5': md5(compressed).digest()}, fp.GetHashes())
+
+  def test_write_concatenated_members(self):
+    compressed = self._Compress('abc') + self._Compress('def') + '\0' * 10
+    out = StringIO.StringIO()
+    fp = GzipDecompressingWriter(out)
+    # Write a byte at a time so members and padding span several writes.
+    self._WriteInChunks(fp, compressed, 1)
+    self.assertEqual('abcdef', out.getvalue())
+
+  def test_resume(self):
+    """Tests the calls boto's ResumableDownloadHandler makes to resume."""
+    contents = self._MakeContents()
+    compressed = self._Compress(contents)
+    out = StringIO.StringIO()
+    fp = GzipDecompressingWriter(out, {'md5': md5})
+    offset = len(compressed) / 3
+    fp.write(compressed[:offset])
+    fp.seek(0, os.SEEK_END)
+    self.assertEqual(offset, fp.tell())
+    fp.write(compressed[offset:])
+    self.assertEqual(contents, out.getvalue())
+    self.assertEqual({'md5': md5(compressed).digest()}, fp.GetHashes())
+    self.assertRaises(IOError, fp.seek, 0)
+
+    # Truncating starts the decompression and hashing over.
+    fp.truncate(0)
+    self.assertEqual(0, fp.tell())
+    self.assertEqual('', out.getvalue())
+    fp.write(compressed)
+    self.assertEqual(contents, out.getvalue())
+    self.assertEqual({'md5': md5(compressed).digest()}, fp.GetHashes())
@@ -0,0 +1,74 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gslib.tests.testcase as testcase
+import os
+import random
+import StringIO
+
+from hashlib import md5
+from gslib.hashing_helper import HASHING_THREAD_BATCH_SIZE
+from gslib.hashing_helper import HashingFileUploadWrapper
+
+class TestHashingHelper(testcase.GsUtilUnitTestCase):
+  """Unit tests for hashing_helper.py"""
+
+  def _MakeContents(self):
+    rand = random.Random(0)
+    return ''.join(rand.choice('abcdefgh')
+                   for _ in range(3 * HASHING_THREAD_BATCH_SIZE + 17))
+
+  def _ReadAll(self, fp, chunk_size):
+    data = fp.read(chunk_size)
+    while data:
+      data = fp.read(chunk_size)
+
+  def _CheckDigest(self, contents, use_hashing_thread, move_around):
+    with HashingFileUploadWrapper(StringIO.StringIO(contents), {'md5': md5},
+                                  use_hashing_thread) as fp:
+      move_around(fp)
+      self._ReadAll(fp, 65536)
+      self.assertEqual(md5(contents).digest(), fp.GetDigest('md5'))
+      self.assertEqual(md5(contents).hexdigest(),
+                       fp.GetHashAlgs()['md5']().hexdigest())
+
+  def test_read(self):
+    contents = self._MakeContents()
+    for use_hashing_thread in (False, True):
+      self._CheckDigest(contents, use_hashing_thread, lambda fp: None)
+
+  def test_seek_back_and_reread(self):
+    contents = self._MakeContents()
+    def MoveAround(fp):
+      fp.read(HASHING_THREAD_BATCH_SIZE + 5)
+      fp.seek(0)
+    for use_hashing_thread in (False, True):
+      self._CheckDigest(contents, use_hashing_thread, MoveAround)
+
+  def test_seek_forward(self):
+    contents = self._MakeContents()
+    def MoveAround(fp):
+      fp.seek(0, os.SEEK_END)
+      fp.seek(len(contents) / 2)
+    for use_hashing_thread in (False, True):
+      self._CheckDigest(contents, use_hashing_thread, MoveAround)
+
+  def test_starts_at_current_position(self):
+    contents = self._MakeContents()
+    src_fp = StringIO.StringIO(contents)
+    src_fp.seek(100)
+    with HashingFileUploadWrapper(src_fp, {'md5': md5}) as fp:
+      self.assertEqual(100, fp.tell())
+      self._ReadAll(fp, 8192)
+      self.assertEqual(md5(contents[100:]).digest(), fp.GetDigest('md5'))
@@ -0,0 +1,122 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+import boto
+import gslib.local_hash_cache as local_hash_cache
+import gslib.tests.testcase as testcase
+import unittest
+
+from gslib.local_hash_cache import GetLocalHashCache
+from gslib.local_hash_cache import GetStatKey
+from gslib.local_hash_cache import LocalHashCache
+from gslib.local_hash_cache import sqlite3
+from gslib.util import IS_WINDOWS
+
+
+@unittest.skipIf(IS_WINDOWS or not sqlite3,
+                 'The cache requires inode numbers and sqlite3.')
+class TestLocalHashCache(testcase.GsUtilUnitTestCase):
+  """Unit tests for local_hash_cache.py"""
+
+  def _MakeCache(self, tmpdir, max_entries=100):
+    return LocalHashCache(os.path.join(tmpdir, 'cache.sqlite'), max_entries)
+
+  def _MakeFile(self, tmpdir, file_name, contents, mtime=1000.5):
+    path = self.CreateTempFile(tmpdir=tmpdir, file_name=file_name,
+                               contents=contents)
+    os.utime(path, (mtime, mtime))
+    return path
+
+  def test_get_and_put(self):
+    tmpdir = self.CreateTempDir()
+    cache = self._MakeCache(tmpdir)
+    stat_key = GetStatKey(self._MakeFile(tmpdir, 'f', 'abc'))
+    self.assertEqual({}, cache.Get(stat_key))
+    cache.Put(stat_key, {'md5': 'x'})
+    self.assertEqual({'md5': 'x'}, cache.Get(stat_key))
+    # Digests of other algorithms for the same contents are merged, and
+    # digests of algorithms that aren't cached are ignored.
+    cache.Put(stat_key, {'crc32c': 'y', 'sha1': 'z'})
+    self.assertEqual({'md5': 'x', 'crc32c': 'y'}, cache.Get(stat_key))
+    # Ranges of the file are cached separately.
+    self.assertEqual({}, cache.Get(stat_key, 1, 1))
+    cache.Put(stat_key, {'md5': 'w'}, 1, 1)
+    self.assertEqual({'md5': 'w'}, cache.Get(stat_key, 1, 1))
+    self.assertEqual({'md5': 'x', 'crc32c': 'y'}, cache.Get(stat_key, 0, 3))
+    # The cache persists across instances (and so across processes).
+    self.assertEqual({'md5': 'x', 'crc32c': 'y'},
+                     self._MakeCache(tmpdir).Get(stat_key))
+
+  def test_invalidated_when_file_changes(self):
+    tmpdir = self.CreateTempDir()
+    cache = self._MakeCache(tmpdir)
+    path = self._MakeFile(tmpdir, 'f', 'abc')
+    cache.Put(GetStatKey(path), {'md5': 'x', 'crc32c': 'y'})
+    os.utime(path, (2000.5, 2000.5))
+    self.assertEqual({}, cache.Get(GetStatKey(path)))
+    # Stale digests aren't merged with new ones.
+    cache.Put(GetStatKey(path), {'md5': 'z'})
+    self.assertEqual({'md5': 'z'}, cache.Get(GetStatKey(path)))
+    self._MakeFile(tmpdir, 'f', 'abcd', mtime=2000.5)
+    self.assertEqual({}, cache.Get(GetStatKey(path)))
+
+  def test_eviction(self):
+    tmpdir = self.CreateTempDir()
+    cache = self._MakeCache(tmpdir, max_entries=10)
+    paths = [self._MakeFile(tmpdir, 'f%d' % i, str(i)) for i in range(20)]
+    for path in paths:
+      cache.Put(GetStatKey(path), {'md5': 'x'})
+    cache._EvictIfNeeded(cache._Connect())
+    # The least recently used entries were evicted, leaving room to grow.
+    self.assertEqual(paths[11:], [path for path in paths
+                                  if cache.Get(GetStatKey(path))])
+
+  def test_recently_modified_file_with_coarse_mtime(self):
+    tmpdir = self.CreateTempDir()
+    path = self._MakeFile(tmpdir, 'f', 'abc', mtime=int(time.time()))
+    # Modifying the file again within the same second might not change its
+    # stat key, so it can't be cached yet.
+    self.assertEqual(None, GetStatKey(path))
+    os.utime(path, (1000, 1000))
+    self.assertNotEqual(None, GetStatKey(path))
+
+  def test_no_database_dir_is_remembered(self):
+    lookups = []
+    def _GetNoSqliteDatabaseDir():
+      lookups.append(None)
+      return None
+    old_use_local_hash_cache = boto.config.get('GSUtil',
+                                               'use_local_hash_cache', None)
+    old_get_sqlite_database_dir = local_hash_cache.GetSqliteDatabaseDir
+    old_cache = local_hash_cache._cache
+    boto.config.set('GSUtil', 'use_local_hash_cache', 'True')
+    local_hash_cache.GetSqliteDatabaseDir = _GetNoSqliteDatabaseDir
+    local_hash_cache._cache = None
+    try:
+      for _ in range(3):
+        self.assertIsNone(GetLocalHashCache())
+      # The process only looked for a directory once.
+      self.assertEqual(1, len(lookups))
+    finally:
+      local_hash_cache.GetSqliteDatabaseDir = old_get_sqlite_database_dir
+      local_hash_cache._cache = old_cache
+      local_hash_cache._cache_disabled_pid = None
+      if old_use_local_hash_cache is None:
+        boto.config.remove_option('GSUtil', 'use_local_hash_cache')
+      else:
+        boto.config.set('GSUtil', 'use_local_hash_cache',
+                        old_use_local_hash_cache)
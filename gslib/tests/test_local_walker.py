@@ -0,0 +1,87 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+
+import gslib.tests.testcase as testcase
+import unittest
+
+import gslib.local_walker
+from gslib.local_walker import WalkFiles
+from gslib.util import IS_WINDOWS
+
+
+class TestLocalWalker(testcase.GsUtilUnitTestCase):
+  """Unit tests for local_walker.py"""
+
+  def _MakeTree(self):
+    return self.CreateTempDir(test_files=[
+        'f1', 'f2', ('d1', 'f3'), ('d1', 'd2', 'f4'), ('d1', 'd2', 'f5'),
+        ('d3', 'f6'), ('d3', 'd4', 'd5', 'f7')])
+
+  def _OsWalkFiles(self, base_dir):
+    return [os.path.join(dirpath, name)
+            for (dirpath, unused_dirnames, filenames) in os.walk(base_dir)
+            for name in filenames]
+
+  def test_walk_order_and_stat(self):
+    tmpdir = self._MakeTree()
+    expected = self._OsWalkFiles(tmpdir)
+    for thread_count in (0, 1, 4):
+      results = list(WalkFiles(tmpdir, thread_count))
+      self.assertEqual(expected, [path for (path, _, _) in results])
+      for (path, rel_path, file_stat) in results:
+        self.assertEqual(os.path.join(tmpdir, rel_path), path)
+        self.assertEqual(os.path.getsize(path), file_stat.size)
+        self.assertEqual(os.path.getmtime(path), file_stat.mtime)
+
+  def test_buffered_dirs_limit(self):
+    tmpdir = self._MakeTree()
+    old_limit = gslib.local_walker.MAX_BUFFERED_DIRS
+    gslib.local_walker.MAX_BUFFERED_DIRS = 1
+    try:
+      self.assertEqual(self._OsWalkFiles(tmpdir),
+                       [path for (path, _, _) in WalkFiles(tmpdir, 4)])
+    finally:
+      gslib.local_walker.MAX_BUFFERED_DIRS = old_limit
+
+  def test_stop_early(self):
+    tmpdir = self._MakeTree()
+    thread_count = threading.active_count()
+    walk = WalkFiles(tmpdir, 4)
+    walk.next()
+    self.assertEqual(thread_count + 4, threading.active_count())
+    walk.close()
+    self.assertEqual(thread_count, threading.active_count())
+
+  def test_missing_dir(self):
+    self.assertEqual([], list(WalkFiles('no_such_dir', 2)))
+
+  @unittest.skipIf(IS_WINDOWS, 'os.symlink is not available on Windows.')
+  def test_symlinks(self):
+    tmpdir = self._MakeTree()
+    os.symlink(os.path.join(tmpdir, 'd1'), os.path.join(tmpdir, 'link_dir'))
+    os.symlink(os.path.join(tmpdir, 'f1'), os.path.join(tmpdir, 'link_file'))
+    os.symlink(os.path.join(tmpdir, 'none'), os.path.join(tmpdir, 'broken'))
+    results = dict((rel_path, file_stat) for (_, rel_path, file_stat)
+                   in WalkFiles(tmpdir, 2))
+    # Like os.walk, links to files are followed, but links to directories
+    # aren't.
+    self.assertEqual(sorted(
+        os.path.relpath(path, tmpdir) for path in self._OsWalkFiles(tmpdir)),
+                     sorted(results))
+    self.assertEqual(os.path.getsize(os.path.join(tmpdir, 'f1')),
+                     results['link_file'].size)
+    self.assertEqual(None, results['broken'])
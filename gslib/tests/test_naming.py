@@ -31,14 +31,18 @@ service) are available via the gsutil test command.
 
 import gzip
 import os
+import pickle
 import StringIO
 
 import boto
 from boto.exception import StorageResponseError
 from boto import storage_uri
+from boto.gs.key import Key
 
+from gslib.bucket_listing_ref import BucketListingRef
 from gslib.commands import cp
 from gslib.exception import CommandException
+from gslib.name_expansion import NameExpansionResult
 import gslib.tests.testcase as testcase
 from gslib.tests.util import ObjectToURI as suri
 from gslib.tests.util import PerformsFileToObjectUpload
@@ -75,6 +79,22 @@ class GsutilNamingTests(testcase.GsUtilUnitTestCase):
     self.assertEqual(suri(src_dir),
                      cp._GetPathBeforeFinalDir(storage_uri(suri(subdir))))
 
+  def testListedKeyMetadataSurvivesPickling(self):
+    """Tests that listed object metadata can be passed between processes"""
+    uri = storage_uri('gs://bucket/obj')
+    key = Key(name='obj')
+    key.size = 42
+    key.etag = '"d41d8cd98f00b204e9800998ecf8427e"'
+    blr = BucketListingRef(uri, key=key)
+    result = pickle.loads(pickle.dumps(NameExpansionResult(
+        'gs://bucket/*', False, False, False, blr.GetUriString(),
+        expanded_key_metadata=blr.GetListedKeyMetadata())))
+    metadata = result.GetExpandedKeyMetadata()
+    self.assertEqual(42, metadata['size'])
+    self.assertEqual(key.etag, metadata['etag'])
+    # Refs that didn't come from a bucket listing have no metadata to carry.
+    self.assertIsNone(BucketListingRef(uri).GetListedKeyMetadata())
+
   @PerformsFileToObjectUpload
   def testCopyingTopLevelFileToBucket(self):
     """Tests copying one top-level file to a bucket"""
@@ -288,6 +308,17 @@ class GsutilNamingTests(testcase.GsUtilUnitTestCase):
     finally:
       f.close()
 
+  def testCopyingCompressedObjectToDir(self):
+    """Tests that copying a gzip-encoded object to a dir decompresses it"""
+    src_file = self.CreateTempFile(contents='plaintext', file_name='f2.txt')
+    dst_bucket_uri = self.CreateBucket()
+    self.RunCommand('cp', ['-z', 'txt', src_file, suri(dst_bucket_uri)])
+    dst_dir = self.CreateTempDir()
+    self.RunCommand('cp', [suri(dst_bucket_uri, 'f2.txt'), dst_dir])
+    self.assertEqual(['f2.txt'], os.listdir(dst_dir))
+    with open(os.path.join(dst_dir, 'f2.txt'), 'rb') as f:
+      self.assertEqual('plaintext', f.read())
+
   def testCopyingObjectToObject(self):
     """Tests copying an object to an object"""
     src_bucket_uri = self.CreateBucket(test_objects=['obj'])
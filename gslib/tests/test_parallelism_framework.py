@@ -22,22 +22,37 @@
 """Unit tests for gsutil parallelism framework."""
 
 import functools
+import gslib.command
 import gslib.help_provider as help_provider
 import gslib.tests.testcase as testcase
+import os
 import signal
+import threading
+import time
 
+from boto.exception import GSResponseError
+from gslib.command import _AdaptiveConcurrencyController
 from gslib.command import Command
 from gslib.command import COMMAND_NAME
 from gslib.command import COMMAND_NAME_ALIASES
 from gslib.command import DummyArgChecker
 from gslib.command import CreateGsutilLogger
+from gslib.command import MAX_TASK_BATCH_SIZE
+from gslib.command import TASK_STATUS_BATCH_SIZE
 from gslib.commands.lifecycle import LifecycleCommand
 from gslib.help_provider import HELP_NAME
 from gslib.help_provider import HELP_NAME_ALIASES
 from gslib.help_provider import HELP_ONE_LINE_SUMMARY
 from gslib.help_provider import HELP_TEXT
 from gslib.help_provider import HelpType
+from gslib.local_walker import FileStat
+from gslib.name_expansion import NameExpansionResult
+from gslib.parallelism_framework_util import ReorderingIterator
+from gslib.parallelism_framework_util import TASK_ORDER_FIFO
+from gslib.parallelism_framework_util import TASK_ORDER_LARGEST_FIRST
+from gslib.parallelism_framework_util import TASK_ORDER_SHUFFLE
 from gslib.help_provider import HELP_TYPE
+from gslib import util
 from gslib.tests.util import unittest
 from gslib.util import IS_WINDOWS
 from gslib.util import MultiprocessingIsAvailable
@@ -68,6 +83,14 @@ class CustomException(Exception):
 def _ReturnOneValue(cls, args):
   return 1
 
+def _ReturnArgs(cls, args):
+  return args
+
+def _FailOnOddNumbers(cls, args):
+  if args % 2:
+    raise CustomException('Failing on %d on purpose.' % args)
+  return args
+
 def _FailureFunc(cls, args):
   raise CustomException("Failing on purpose.")
 
@@ -115,6 +138,32 @@ def _PerformNRecursiveCalls(cls, args):
   return len(return_values)
 
 
+def _ReturnThreadName(cls, args):
+  return threading.current_thread().name
+
+
+def _ReturnThreadNamesOfNestedApply(cls, args):
+  return cls.Apply(_ReturnThreadName, [()] * args, _ExceptionHandler,
+                   arg_checker=DummyArgChecker, process_count=1,
+                   thread_count=5, should_return_results=True)
+
+
+def _ReturnPidAfterDelay(cls, args):
+  time.sleep(0.05)
+  return os.getpid()
+
+
+def _ReturnPidsOfNestedApplyWhenOthersWait(cls, args):
+  # Give the other consumer processes a chance to start waiting for tasks.
+  deadline = time.time() + 2
+  while (gslib.command.waiting_consumer_count.value < 2 and
+         time.time() < deadline):
+    time.sleep(0.01)
+  return cls.Apply(_ReturnPidAfterDelay, [()] * args, _ExceptionHandler,
+                   arg_checker=DummyArgChecker, process_count=3,
+                   thread_count=1, should_return_results=True)
+
+
 def _SkipEvenNumbersArgChecker(cls, arg):
   return arg % 2 != 0
 
@@ -200,6 +249,14 @@ class TestParallelismFramework(testcase.GsUtilUnitTestCase):
   def testBasicApplyMultiProcessMultiThread(self):
     self._TestBasicApply(10, 10)
 
+  def testShuffledApplyReturnsAllResults(self):
+    args = range(100)
+    results = self.command_class(True).Apply(
+        _ReturnOneValue, args, _ExceptionHandler, arg_checker=DummyArgChecker,
+        process_count=1, thread_count=3, should_return_results=True,
+        task_order=TASK_ORDER_SHUFFLE)
+    self.assertEqual(len(args), len(results))
+
   @Timeout
   def _TestBasicApply(self, process_count, thread_count):
     args = [()] * (17 * process_count * thread_count + 1)
@@ -402,6 +459,73 @@ class TestParallelismFramework(testcase.GsUtilUnitTestCase):
                              process_count, thread_count)
     self.assertEqual(7 * (sum(args) + len(args)), sum(results))
 
+  @Timeout
+  def testNestedApplyUsesEnclosingWorkerPool(self):
+    args = [3, 1, 4, 1, 5, 9, 2, 6]
+    results = self._RunApply(_ReturnThreadNamesOfNestedApply, args, 1, 2)
+    self.assertEqual(sum(args), sum(len(names) for names in results))
+    # The nested calls ask for 5 threads each, but they're performed by the 2
+    # threads of the outer call's pool.
+    if self.command_class(True).multiprocessing_is_available:
+      self.assertLessEqual(len(set(sum(results, []))), 2)
+
+  def _UseNewMultiprocessingState(self):
+    """
+    Reinitializes the module-level state of the parallelism framework, as in
+    a new run of gsutil, and restores the current state when the test ends.
+    """
+    for module in (util, gslib.command):
+      self.addCleanup(vars(module).update, dict(vars(module)))
+    util.InitializeMultiprocessingVariables()
+    gslib.command.InitializeMultiprocessingVariables()
+
+  @Timeout
+  def testSequentialAndThreadedApplyDontStartManager(self):
+    self._UseNewMultiprocessingState()
+    for thread_count in (1, 5):
+      results = self._RunApply(_ReturnOneValue, [()] * 20, 1, thread_count)
+      self.assertEqual(20, len(results))
+      args = [3, 1, 4]
+      results = self._RunApply(_ReturnThreadNamesOfNestedApply, args, 1,
+                               thread_count)
+      self.assertEqual(sum(args), sum(len(names) for names in results))
+    self.assertIsNone(util.manager)
+    self.assertIsNone(gslib.command.manager)
+
+  @unittest.skipIf(IS_WINDOWS, 'Multiprocessing is not supported on Windows')
+  @Timeout
+  def testBatchedStatusCountsEveryTaskAcrossProcesses(self):
+    # Several batches' worth of tasks per process, half of which fail.
+    args = range(3 * 2 * TASK_STATUS_BATCH_SIZE + 7)
+    command_inst = self.command_class(True)
+    results = self._RunApply(_FailOnOddNumbers, args, 3, 2,
+                             command_inst=command_inst,
+                             shared_attrs=['failure_count'])
+    self.assertEqual([arg for arg in args if not arg % 2], sorted(results))
+    self.assertEqual(len(args) / 2, command_inst.failure_count)
+
+  @unittest.skipIf(IS_WINDOWS, 'Multiprocessing is not supported on Windows')
+  @Timeout
+  def testTaskBatchingDeliversEveryArgument(self):
+    # There are fewer tasks than fit in a batch, and some of the arguments
+    # are falsy, like the marker for the end of the tasks.
+    for args in ([None], [0, None, '', [], ()],
+                 range(MAX_TASK_BATCH_SIZE - 1)):
+      results = self._RunApply(_ReturnArgs, args, 2, 2)
+      self.assertEqual(sorted(args), sorted(results))
+
+  @unittest.skipIf(IS_WINDOWS, 'Multiprocessing is not supported on Windows')
+  @Timeout
+  def testNestedApplyUsesIdleProcesses(self):
+    # Like "cp -m" of a single large file: the top-level call has only one
+    # task, so the nested call's tasks are spread across processes rather than
+    # being performed by the threads of the one busy process.
+    results = self._RunApply(_ReturnPidsOfNestedApplyWhenOthersWait, [12],
+                             3, 2)
+    self.assertEqual(12, len(results[0]))
+    if self.command_class(True).multiprocessing_is_available:
+      self.assertGreater(len(set(results[0])), 1)
+
   def testExceptionInProducerRaisesAndTerminatesSingleProcessSingleThread(self):
     self._TestExceptionInProducerRaisesAndTerminates(1, 1)
 
@@ -467,3 +591,123 @@ class TestParallelismFrameworkWithoutMultiprocessing(TestParallelismFramework):
      the sequential path is referenced before initialization).
   """
   command_class = FakeCommandWithoutMultiprocessingModule
+
+
+class TestAdaptiveConcurrencyController(testcase.GsUtilUnitTestCase):
+  """Unit tests for the AIMD adjustment of the number of worker threads."""
+
+  def _RunInterval(self, controller, throughput, num_done=100,
+                   num_overload_errors=0):
+    with controller.cond:
+      controller.num_done = num_done
+      controller.num_overload_errors = num_overload_errors
+      controller._AdjustLimit(throughput)
+
+  def testAdditiveIncreaseUpToMax(self):
+    started = []
+    controller = _AdaptiveConcurrencyController(2, 1, 4, started.append, None)
+    for throughput in (10, 20, 30, 40):
+      self._RunInterval(controller, throughput)
+    self.assertEqual(4, controller.limit)
+    self.assertEqual([3, 4], started)
+
+  def testMultiplicativeDecreaseOnOverloadErrors(self):
+    controller = _AdaptiveConcurrencyController(8, 3, 16, lambda n: None, None)
+    self._RunInterval(controller, 10, num_overload_errors=10)
+    self.assertEqual(4, controller.limit)
+    self._RunInterval(controller, 10, num_overload_errors=10)
+    self.assertEqual(3, controller.limit)
+
+  def testDecreaseWhenThroughputDropsAfterIncrease(self):
+    controller = _AdaptiveConcurrencyController(8, 1, 16, lambda n: None, None)
+    self._RunInterval(controller, 100)
+    self.assertEqual(9, controller.limit)
+    self._RunInterval(controller, 50)
+    self.assertEqual(4, controller.limit)
+    # A lower throughput after a decrease is not a reason to decrease again.
+    self._RunInterval(controller, 40)
+    self.assertEqual(5, controller.limit)
+
+  def testOnlyOverloadErrorsCount(self):
+    controller = _AdaptiveConcurrencyController(2, 1, 4, lambda n: None, None)
+    for _ in range(10):
+      controller.RecordTask(CustomException('Not an overload.'))
+    controller.RecordTask(GSResponseError(503, 'Service Unavailable'))
+    self.assertEqual(11, controller.num_done)
+    self.assertEqual(1, controller.num_overload_errors)
+
+
+def _MakeNameExpansionResult(uri_str, size=None, file_stat=None):
+  metadata = None if size is None else {'size': size}
+  return NameExpansionResult(uri_str, True, True, False, uri_str,
+                             expanded_key_metadata=metadata,
+                             expanded_file_stat=file_stat)
+
+
+class TestReorderingIterator(testcase.GsUtilUnitTestCase):
+  """Unit tests for the task order policies used by Apply."""
+
+  def _Names(self, args_iterator):
+    return [result.expanded_uri_str for result in args_iterator]
+
+  def testFifoKeepsOrder(self):
+    args = [_MakeNameExpansionResult('gs://b/%d' % i, size=i)
+            for i in range(10)]
+    self.assertEqual(
+        self._Names(args),
+        self._Names(ReorderingIterator(args, TASK_ORDER_FIFO, 3)))
+
+  def testLargestFirstWithinWindow(self):
+    sizes = [1, 5, 2, 9, 3, 0, 7]
+    args = [_MakeNameExpansionResult('gs://b/%d' % size, size=size)
+            for size in sizes]
+    self.assertEqual(
+        ['gs://b/%d' % size for size in (5, 9, 3, 2, 7, 1, 0)],
+        self._Names(ReorderingIterator(args, TASK_ORDER_LARGEST_FIRST, 3)))
+    self.assertEqual(
+        ['gs://b/%d' % size for size in sorted(sizes, reverse=True)],
+        self._Names(ReorderingIterator(args, TASK_ORDER_LARGEST_FIRST, 100)))
+
+  def testLargestFirstUsesFileSizes(self):
+    small = self.CreateTempFile(contents='a')
+    large = self.CreateTempFile(contents='a' * 100)
+    args = [_MakeNameExpansionResult('file://' + small),
+            _MakeNameExpansionResult('file://' + large)]
+    self.assertEqual(
+        ['file://' + large, 'file://' + small],
+        self._Names(ReorderingIterator(args, TASK_ORDER_LARGEST_FIRST, 2)))
+
+  def testLargestFirstUsesWalkedFileStats(self):
+    # Sizes recorded by the directory walk are used without another stat (the
+    # files needn't even exist any more).
+    args = [_MakeNameExpansionResult('file:///nonexistent/small',
+                                     file_stat=FileStat(1, 0, 0)),
+            _MakeNameExpansionResult('file:///nonexistent/large',
+                                     file_stat=FileStat(100, 0, 0))]
+    self.assertEqual(
+        ['file:///nonexistent/large', 'file:///nonexistent/small'],
+        self._Names(ReorderingIterator(args, TASK_ORDER_LARGEST_FIRST, 2)))
+
+  def testShuffleIsADeterministicPermutation(self):
+    args = [_MakeNameExpansionResult('gs://b/%03d' % i) for i in range(50)]
+    shuffled = self._Names(ReorderingIterator(args, TASK_ORDER_SHUFFLE, 50))
+    self.assertNotEqual(self._Names(args), shuffled)
+    self.assertEqual(sorted(self._Names(args)), sorted(shuffled))
+    self.assertEqual(
+        shuffled,
+        self._Names(ReorderingIterator(args, TASK_ORDER_SHUFFLE, 50)))
+
+  def testIteratorExceptionsPassThrough(self):
+    iterator = ReorderingIterator(FailingIterator(6, [2, 4]),
+                                  TASK_ORDER_SHUFFLE, 10)
+    values = []
+    failures = 0
+    while True:
+      try:
+        values.append(iterator.next())
+      except StopIteration:
+        break
+      except CustomException:
+        failures += 1
+    self.assertEqual(2, failures)
+    self.assertEqual([0, 1, 3, 5], sorted(values))
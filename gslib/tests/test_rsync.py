@@ -0,0 +1,136 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from gslib.commands.rsync import _ComputeRsyncOp
+from gslib.commands.rsync import _GetListedMd5
+from gslib.commands.rsync import _IterSortedLocalFiles
+from gslib.commands.rsync import _MergeSortedListings
+from gslib.commands.rsync import _ParseLastModified
+from gslib.commands.rsync import ListingEntry
+from gslib.commands.rsync import RsyncOp
+from gslib.tests.testcase.unit_testcase import GsUtilUnitTestCase
+
+
+def _Entry(name, size=1, mtime=100, md5=None):
+  return ListingEntry(name, size, mtime, md5, None)
+
+
+class TestRsyncFuncs(GsUtilUnitTestCase):
+  """Unit tests for functions in rsync command."""
+
+  def test_IterSortedLocalFiles(self):
+    tmpdir = self.CreateTempDir(test_files=[
+        'a0', 'a-b', 'a.txt', ('a', 'b'), ('a', 'c', 'd'), 'B'])
+    names = [entry.name for entry in _IterSortedLocalFiles(tmpdir, True)]
+    # Directory contents sort as if the directory name ended with '/'.
+    self.assertEqual(['B', 'a-b', 'a.txt', 'a/b', 'a/c/d', 'a0'], names)
+    self.assertEqual(sorted(names), names)
+    names = [entry.name for entry in _IterSortedLocalFiles(tmpdir, False)]
+    self.assertEqual(['B', 'a-b', 'a.txt', 'a0'], names)
+
+  def test_IterSortedLocalFilesSizeAndMtime(self):
+    tmpdir = self.CreateTempDir()
+    fpath = self.CreateTempFile(tmpdir=tmpdir, contents='12345',
+                                file_name='f')
+    os.utime(fpath, (1000, 2000))
+    entries = list(_IterSortedLocalFiles(tmpdir, True))
+    self.assertEqual(1, len(entries))
+    self.assertEqual(5, entries[0].size)
+    self.assertEqual(2000, entries[0].mtime)
+    self.assertEqual(None, entries[0].md5)
+
+  def test_MergeSortedListings(self):
+    src = [_Entry('a'), _Entry('b'), _Entry('d')]
+    dst = [_Entry('b'), _Entry('c'), _Entry('e')]
+    merged = [(name, bool(src_entry), bool(dst_entry))
+              for (name, src_entry, dst_entry)
+              in _MergeSortedListings(src, dst)]
+    self.assertEqual([('a', True, False), ('b', True, True),
+                      ('c', False, True), ('d', True, False),
+                      ('e', False, True)], merged)
+    self.assertEqual([], list(_MergeSortedListings([], [])))
+
+  def test_ComputeRsyncOp(self):
+    # Sizes differ.
+    self.assertEqual(RsyncOp.COPY,
+                     _ComputeRsyncOp(_Entry('a', size=1), _Entry('a', size=2),
+                                     False))
+    # Listed hashes decide, regardless of modification times.
+    self.assertEqual(None, _ComputeRsyncOp(_Entry('a', mtime=200, md5='x'),
+                                           _Entry('a', mtime=100, md5='x'),
+                                           False))
+    self.assertEqual(RsyncOp.COPY,
+                     _ComputeRsyncOp(_Entry('a', mtime=100, md5='x'),
+                                     _Entry('a', mtime=200, md5='y'), False))
+    # Otherwise modification times decide, to the second.
+    self.assertEqual(RsyncOp.COPY,
+                     _ComputeRsyncOp(_Entry('a', mtime=201),
+                                     _Entry('a', mtime=200), False))
+    self.assertEqual(None, _ComputeRsyncOp(_Entry('a', mtime=200.5),
+                                           _Entry('a', mtime=200), False))
+    # Unless checksums were requested.
+    self.assertEqual(RsyncOp.CHECKSUM,
+                     _ComputeRsyncOp(_Entry('a', mtime=100),
+                                     _Entry('a', mtime=200), True))
+
+  def test_GetListedMd5(self):
+    self.assertEqual('d41d8cd98f00b204e9800998ecf8427e', _GetListedMd5(
+        {'etag': '"d41d8cd98f00b204e9800998ecf8427e"'}))
+    # Composite objects have no MD5 etag.
+    self.assertEqual(None, _GetListedMd5({'etag': '"CJiX9Pnvr7oCEAE="'}))
+    self.assertEqual('00ff', _GetListedMd5(
+        {'etag': '"CJiX9Pnvr7oCEAE="', 'cloud_hashes': {'md5': '\x00\xff'}}))
+
+  def test_ParseLastModified(self):
+    self.assertEqual(86400, _ParseLastModified('1970-01-02T00:00:00.000Z'))
+    self.assertEqual(None, _ParseLastModified(None))
+
+
+class TestRsync(GsUtilUnitTestCase):
+  """Unit tests for gsutil rsync."""
+
+  def test_rsync_local_dirs(self):
+    src_dir = self.CreateTempDir(test_files=['f1', ('sub', 'f2')])
+    dst_dir = self.CreateTempDir(test_files=['extra'])
+    self.RunCommand('rsync', ['-R', '-d', src_dir, dst_dir])
+    self.assertEqual(['f1', 'sub/f2'],
+                     [e.name for e in _IterSortedLocalFiles(dst_dir, True)])
+    with open(os.path.join(dst_dir, 'sub', 'f2')) as fp:
+      self.assertEqual('test 1', fp.read())
+
+  def test_rsync_dry_run(self):
+    src_dir = self.CreateTempDir(test_files=['f1'])
+    dst_dir = self.CreateTempDir(test_files=['extra'])
+    self.RunCommand('rsync', ['-n', '-d', src_dir, dst_dir])
+    self.assertEqual(['extra'],
+                     [e.name for e in _IterSortedLocalFiles(dst_dir, True)])
+
+  def test_rsync_checksum(self):
+    src_dir = self.CreateTempDir()
+    dst_dir = self.CreateTempDir()
+    src_file = self.CreateTempFile(tmpdir=src_dir, file_name='f',
+                                   contents='aaaa')
+    dst_file = self.CreateTempFile(tmpdir=dst_dir, file_name='f',
+                                   contents='bbbb')
+    # Same size and an older source: only -c detects the difference.
+    os.utime(src_file, (1000, 1000))
+    os.utime(dst_file, (2000, 2000))
+    self.RunCommand('rsync', [src_dir, dst_dir])
+    with open(dst_file) as fp:
+      self.assertEqual('bbbb', fp.read())
+    self.RunCommand('rsync', ['-c', src_dir, dst_dir])
+    with open(dst_file) as fp:
+      self.assertEqual('aaaa', fp.read())
@@ -0,0 +1,107 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+import gslib.tests.testcase as testcase
+import unittest
+
+from gslib.tracker_store import FileTrackerStore
+from gslib.tracker_store import SqliteTrackerStore
+from gslib.tracker_store import STALE_TRACKER_AGE
+from gslib.tracker_store import sqlite3
+
+
+class TestFileTrackerStore(testcase.GsUtilUnitTestCase):
+  """Unit tests for FileTrackerStore."""
+
+  def test_get_put_append_delete(self):
+    tmpdir = self.CreateTempDir()
+    store = FileTrackerStore(tmpdir)
+    self.assertEqual(None, store.Get('upload_x'))
+    store.Put('upload_x', 'abc\n')
+    self.assertEqual('abc\n', store.Get('upload_x'))
+    self.assertEqual(['upload_x'], os.listdir(tmpdir))
+    store.Append('upload_x', 'def\n')
+    store.Append('upload_y', 'ghi\n')
+    self.assertEqual('abc\ndef\n', store.Get('upload_x'))
+    self.assertEqual('ghi\n', store.Get('upload_y'))
+    store.Delete(['upload_x', 'upload_y', 'upload_z'])
+    self.assertEqual([], os.listdir(tmpdir))
+
+
+@unittest.skipIf(not sqlite3, 'The store requires sqlite3.')
+class TestSqliteTrackerStore(testcase.GsUtilUnitTestCase):
+  """Unit tests for SqliteTrackerStore."""
+
+  def _MakeStore(self, tmpdir, legacy_tracker_dir=None):
+    return SqliteTrackerStore(os.path.join(tmpdir, 'trackers.sqlite'),
+                              legacy_tracker_dir)
+
+  def test_get_put_append_delete(self):
+    tmpdir = self.CreateTempDir()
+    store = self._MakeStore(tmpdir)
+    self.assertEqual(None, store.Get('upload_x'))
+    store.Put('upload_x', 'abc\n')
+    self.assertEqual('abc\n', store.Get('upload_x'))
+    store.Append('upload_x', 'def\n')
+    store.Append('upload_y', 'ghi\n')
+    self.assertEqual('abc\ndef\n', store.Get('upload_x'))
+    self.assertEqual('ghi\n', store.Get('upload_y'))
+    # Trackers persist across instances (and so across processes).
+    self.assertEqual('abc\ndef\n', self._MakeStore(tmpdir).Get('upload_x'))
+    store.Delete(['upload_x', 'upload_z'])
+    self.assertEqual(None, store.Get('upload_x'))
+    self.assertEqual('ghi\n', self._MakeStore(tmpdir).Get('upload_y'))
+    # Object names are stored as UTF-8 byte strings.
+    store.Put('upload_x', 'gs://b/\xe2\x82\xac\n')
+    self.assertEqual('gs://b/\xe2\x82\xac\n',
+                     self._MakeStore(tmpdir).Get('upload_x'))
+
+  def test_put_deferred(self):
+    tmpdir = self.CreateTempDir()
+    store = self._MakeStore(tmpdir)
+    other_store = self._MakeStore(tmpdir)
+    store.PutDeferred('sliced_download_x', '1')
+    # Deferred writes are visible to the writer, but only written later.
+    self.assertEqual('1', store.Get('sliced_download_x'))
+    self.assertEqual(None, other_store.Get('sliced_download_x'))
+    store.Flush()
+    self.assertEqual('1', other_store.Get('sliced_download_x'))
+    store.PutDeferred('sliced_download_x', '2')
+    store.Delete(['sliced_download_x'])
+    store.Flush()
+    self.assertEqual(None, other_store.Get('sliced_download_x'))
+
+  def test_stale_trackers_deleted(self):
+    tmpdir = self.CreateTempDir()
+    store = self._MakeStore(tmpdir)
+    store.Put('upload_old', 'abc')
+    store.Put('upload_new', 'def')
+    with store.conn:
+      store.conn.execute('UPDATE trackers SET updated = ? WHERE name = ?',
+                         (time.time() - STALE_TRACKER_AGE - 1, 'upload_old'))
+    store = self._MakeStore(tmpdir)
+    self.assertEqual(None, store.Get('upload_old'))
+    self.assertEqual('def', store.Get('upload_new'))
+
+  def test_legacy_tracker_files_migrated(self):
+    tmpdir = self.CreateTempDir()
+    legacy_dir = self.CreateTempDir()
+    FileTrackerStore(legacy_dir).Put('download_x', 'etag\n')
+    store = self._MakeStore(tmpdir, legacy_dir)
+    self.assertEqual('etag\n', store.Get('download_x'))
+    self.assertEqual([], os.listdir(legacy_dir))
+    self.assertEqual('etag\n', self._MakeStore(tmpdir).Get('download_x'))
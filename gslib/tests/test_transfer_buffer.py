@@ -0,0 +1,68 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gslib.tests.testcase as testcase
+import StringIO
+
+from gslib.file_part import FilePart
+from gslib.file_part import MappedFilePart
+from gslib.transfer_buffer import ReadChunks
+
+
+class TestTransferBuffer(testcase.GsUtilUnitTestCase):
+  """Unit tests for transfer_buffer.py"""
+
+  def test_read_chunks(self):
+    contents = ''.join(str(i) for i in range(1000))
+    fpath = self.CreateTempFile(contents=contents)
+    with open(fpath, 'rb') as fp:
+      chunks = [str(chunk) for chunk in ReadChunks(fp, buffer_size=1024)]
+    self.assertEqual(contents, ''.join(chunks))
+    self.assertEqual([1024] * (len(contents) / 1024),
+                     [len(chunk) for chunk in chunks[:-1]])
+
+    with open(fpath, 'rb') as fp:
+      fp.seek(100)
+      self.assertEqual(contents[100:2100], ''.join(
+          str(chunk) for chunk in ReadChunks(fp, 2000, buffer_size=1024)))
+
+    fp = FilePart(fpath, 10, 1500)
+    with fp:
+      self.assertEqual(contents[10:1510], ''.join(
+          str(chunk) for chunk in ReadChunks(fp, buffer_size=1024)))
+
+    # The chunks of a MappedFilePart are views of its mapping.
+    fp = MappedFilePart(fpath, 10, 1500)
+    with fp:
+      chunks = list(ReadChunks(fp, 1400, buffer_size=1024))
+      self.assertEqual([1024, 376], [len(chunk) for chunk in chunks])
+      self.assertEqual(contents[10:1410],
+                       ''.join(str(chunk) for chunk in chunks))
+      self.assertEqual(1400, fp.tell())
+
+    # Objects without readinto() are read with read().
+    self.assertEqual(contents[:1500], ''.join(
+        ReadChunks(StringIO.StringIO(contents), 1500, buffer_size=1024)))
+
+  def test_nested_read_chunks(self):
+    fpath1 = self.CreateTempFile(contents='a' * 2000)
+    fpath2 = self.CreateTempFile(contents='b' * 2000)
+    with open(fpath1, 'rb') as fp1:
+      with open(fpath2, 'rb') as fp2:
+        for chunk1 in ReadChunks(fp1, buffer_size=1024):
+          for chunk2 in ReadChunks(fp2, buffer_size=1024):
+            self.assertEqual('b' * len(chunk2), str(chunk2))
+          # The inner reads don't overwrite the outer chunk.
+          self.assertEqual('a' * len(chunk1), str(chunk1))
+          fp2.seek(0)
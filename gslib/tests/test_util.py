@@ -21,6 +21,12 @@
 
 """Tests for gsutil utility functions."""
 
+import boto
+import hashlib
+import os
+
+from boto.gs.key import Key as GSKey
+from boto.s3.key import Key as S3Key
 from gslib import util
 from gslib.util import CompareVersions
 import gslib.tests.testcase as testcase
@@ -121,3 +127,63 @@ class TestUtil(testcase.GsUtilUnitTestCase):
     (g, m) = CompareVersions('3.10', '3.1')
     self.assertTrue(g)
     self.assertFalse(m)
+
+  def test_KeyMethodAcceptsHashAlgs(self):
+    self.assertTrue(util.KeyMethodAcceptsHashAlgs(GSKey(), 'get_file'))
+    self.assertTrue(
+        util.KeyMethodAcceptsHashAlgs(GSKey(), 'get_contents_to_file'))
+    self.assertFalse(util.KeyMethodAcceptsHashAlgs(S3Key(), 'get_file'))
+
+  def test_IsOnNetworkFileSystem(self):
+    mounts_path = self.CreateTempFile(contents=(
+        'rootfs / rootfs rw 0 0\n'
+        'server:/home /home nfs4 rw,relatime 0 0\n'
+        '/dev/sdb1 /home/local ext4 rw 0 0\n'
+        'server:/my\\040dir /mnt/my\\040dir nfs rw 0 0\n'))
+    old_mounts_path = util.PROC_MOUNTS_PATH
+    util.PROC_MOUNTS_PATH = mounts_path
+    try:
+      self.assertFalse(util.IsOnNetworkFileSystem('/tmp'))
+      self.assertTrue(util.IsOnNetworkFileSystem('/home'))
+      self.assertTrue(util.IsOnNetworkFileSystem('/home/user/.gsutil'))
+      # The longest matching mount point decides.
+      self.assertFalse(util.IsOnNetworkFileSystem('/home/local/.gsutil'))
+      self.assertTrue(util.IsOnNetworkFileSystem('/home/localuser'))
+      self.assertTrue(util.IsOnNetworkFileSystem('/mnt/my dir/.gsutil'))
+      self.assertFalse(util.IsOnNetworkFileSystem('/mnt/my'))
+      # Without a mount table, nothing is considered to be on the network.
+      util.PROC_MOUNTS_PATH = mounts_path + '.missing'
+      self.assertFalse(util.IsOnNetworkFileSystem('/home'))
+    finally:
+      util.PROC_MOUNTS_PATH = old_mounts_path
+
+  def test_FindSqliteDatabaseDir(self):
+    remote_dir = os.path.realpath(self.CreateTempDir())
+    local_dir = self.CreateTempDir()
+    mounts_path = self.CreateTempFile(
+        contents='server:/export %s nfs rw 0 0\n' % remote_dir)
+    old_mounts_path = util.PROC_MOUNTS_PATH
+    old_local_database_dir = boto.config.get('GSUtil', 'local_database_dir',
+                                             None)
+    util.PROC_MOUNTS_PATH = mounts_path
+    boto.config.set('GSUtil', 'local_database_dir', local_dir)
+    try:
+      # A local tracker directory holds the databases itself.
+      self.assertEqual(local_dir, util._FindSqliteDatabaseDir(local_dir))
+      # A remote one gets a directory of its own on local disk.
+      database_dir = util._FindSqliteDatabaseDir(remote_dir)
+      self.assertEqual(
+          os.path.join(local_dir, hashlib.md5(remote_dir).hexdigest()),
+          database_dir)
+      self.assertTrue(os.path.isdir(database_dir))
+      # There's nowhere to put the databases if the local directory is also
+      # remote.
+      boto.config.set('GSUtil', 'local_database_dir',
+                      os.path.join(remote_dir, 'databases'))
+      self.assertIsNone(util._FindSqliteDatabaseDir(remote_dir))
+    finally:
+      util.PROC_MOUNTS_PATH = old_mounts_path
+      if old_local_database_dir is None:
+        boto.config.remove_option('GSUtil', 'local_database_dir')
+      else:
+        boto.config.set('GSUtil', 'local_database_dir', old_local_database_dir)
@@ -340,6 +340,35 @@ class FileIteratorTests(testcase.GsUtilUnitTestCase):
         str(u) for u in self._test_wildcard_iterator(uri).IterUris())
     self.assertEqual(self.all_file_uri_strs, actual_uri_strs)
 
+  def testMultipleRecursiveWildcards(self):
+    """Tests expansion of a wildcard containing more than one '**'"""
+    test_dir = self.CreateTempDir(test_files=[
+        ('a', 'x.txt'), ('a', 'b', 'x.txt'), ('a', 'b', 'c', 'y.txt'),
+        ('a', 'b', 'c', 'y.dat'), ('b', 'y.txt'), ('d', 'b', 'e', 'z.txt')])
+    uri = self._test_storage_uri(suri(test_dir, '**', 'b', '**', '*.txt'))
+    actual_uri_strs = set(
+        str(u) for u in self._test_wildcard_iterator(uri).IterUris())
+    self.assertEqual(set([suri(test_dir, 'a', 'b', 'x.txt'),
+                          suri(test_dir, 'a', 'b', 'c', 'y.txt'),
+                          suri(test_dir, 'b', 'y.txt'),
+                          suri(test_dir, 'd', 'b', 'e', 'z.txt')]),
+                     actual_uri_strs)
+
+  def testRecursiveWildcardAfterWildcard(self):
+    """Tests expansion of a '**' wildcard following a '*' wildcard"""
+    uri = self._test_storage_uri(suri(self.test_dir, 'dir*', '**'))
+    actual_uri_strs = set(
+        str(u) for u in self._test_wildcard_iterator(uri).IterUris())
+    self.assertEqual(self.nested_files_uri_strs, actual_uri_strs)
+
+  def testRecursiveWildcardFileStat(self):
+    """Tests that files found by walking directories have their stat"""
+    uri = self._test_storage_uri(suri(self.test_dir, '**'))
+    for blr in self._test_wildcard_iterator(uri):
+      path = blr.GetUri().object_name
+      self.assertEqual(os.path.getsize(path), blr.GetFileStat().size)
+      self.assertEqual(os.path.getmtime(path), blr.GetFileStat().mtime)
+
   def testInvalidRecursiveDirectoryWildcard(self):
     """Tests that wildcard containing '***' raises exception"""
     try:
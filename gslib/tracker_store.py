@@ -0,0 +1,331 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Store for the tracker data that lets interrupted transfers be resumed."""
+
+import atexit
+import errno
+import logging
+import os
+import threading
+import time
+
+from boto.exception import InvalidUriError
+from boto.gs.resumable_upload_handler import ResumableUploadHandler
+from boto.s3.resumable_download_handler import ResumableDownloadHandler
+from gslib.util import CreateTrackerDirIfNeeded
+from gslib.util import GetSqliteDatabaseDir
+from gslib.util import SECONDS_PER_DAY
+
+try:
+  import sqlite3
+except ImportError:
+  sqlite3 = None
+
+# Name of the tracker database in the resumable_tracker_dir.
+TRACKER_DB_FILE_NAME = 'trackers.sqlite'
+
+# Trackers that haven't been updated for this many seconds are deleted, since
+# the transfers they track are unlikely to be resumed (and, for uploads, the
+# service expires resumable upload sessions after a week).
+STALE_TRACKER_AGE = 30 * SECONDS_PER_DAY
+
+# Prefixes of the names of the tracker files written by earlier versions of
+# gsutil, one per tracker.
+LEGACY_TRACKER_FILE_PREFIXES = ('upload_', 'download_', 'parallel_upload_',
+                                'sliced_download_')
+
+# Deferred writes (see PutDeferred) are flushed at least this often.
+DEFERRED_WRITE_INTERVAL = 2
+
+# Seconds to wait for another process's write transaction to finish.
+SQLITE_TIMEOUT = 60
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def GetTrackerStore():
+  """
+  Returns the tracker store shared by all threads of this process: a
+  SqliteTrackerStore in the directory given by GetSqliteDatabaseDir() (the
+  resumable_tracker_dir, unless that's on a network file system), or a
+  FileTrackerStore in the resumable_tracker_dir if sqlite3 isn't available or
+  the database can't be opened.
+  """
+  global _store, _store_pid
+  with _store_lock:
+    if _store is None or _store_pid != os.getpid():
+      # sqlite connections mustn't be used by more than one process.
+      tracker_dir = CreateTrackerDirIfNeeded()
+      database_dir = GetSqliteDatabaseDir()
+      _store = None
+      if sqlite3 and database_dir:
+        try:
+          _store = SqliteTrackerStore(
+              os.path.join(database_dir, TRACKER_DB_FILE_NAME), tracker_dir)
+        except (sqlite3.Error, EnvironmentError):
+          pass
+      if _store is None:
+        _store = FileTrackerStore(tracker_dir)
+      _store_pid = os.getpid()
+      atexit.register(_store.Flush)
+    return _store
+
+
+class FileTrackerStore(object):
+  """
+  Tracker store that keeps each tracker in its own file, named after the
+  tracker, in a directory.
+  """
+
+  def __init__(self, tracker_dir):
+    self.tracker_dir = tracker_dir
+    self.lock = threading.Lock()
+
+  def _GetPath(self, name):
+    return os.path.join(self.tracker_dir, name)
+
+  def Get(self, name):
+    """Returns the contents of the named tracker, or None if there is none."""
+    try:
+      with open(self._GetPath(name), 'r') as f:
+        return f.read()
+    except IOError, e:
+      # Ignore non-existent file (happens first time a transfer is attempted),
+      # but warn user for other errors.
+      if e.errno != errno.ENOENT:
+        logging.getLogger().warning(
+            'Couldn\'t read tracker file (%s): %s. Restarting transfer from '
+            'scratch.', self._GetPath(name), e.strerror)
+      return None
+
+  def Put(self, name, value):
+    """Sets the contents of the named tracker."""
+    with os.fdopen(os.open(self._GetPath(name),
+                           os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600),
+                   'w') as f:
+      f.write(value)
+
+  def PutDeferred(self, name, value):
+    """Same as Put; only SqliteTrackerStore defers writes."""
+    self.Put(name, value)
+
+  def Append(self, name, value):
+    """Appends value to the contents of the named tracker."""
+    with self.lock:
+      with open(self._GetPath(name), 'a') as f:
+        f.write(value)
+
+  def Delete(self, names):
+    """Deletes the named trackers, if they exist."""
+    for name in names:
+      path = self._GetPath(name)
+      if os.path.exists(path):
+        os.unlink(path)
+
+  def Flush(self):
+    pass
+
+
+class SqliteTrackerStore(object):
+  """
+  Tracker store that keeps all trackers in one sqlite database, which the
+  processes and threads of many gsutil invocations can use at once.
+
+  Compared to one file per tracker, this avoids creating and deleting a file
+  (with the directory updates that implies) per transfer, which is slow on
+  network file systems when copying many files. Writes that only record
+  progress can be deferred with PutDeferred, which batches them into one
+  transaction every DEFERRED_WRITE_INTERVAL seconds. Trackers that haven't
+  been updated for STALE_TRACKER_AGE are deleted when a process first opens
+  the store.
+
+  Tracker files left in the tracker directory by earlier versions of gsutil
+  are moved into the database when they're first read, so transfers they
+  track can still be resumed.
+  """
+
+  def __init__(self, path, legacy_tracker_dir=None):
+    self.path = path
+    self.legacy_store = None
+    if legacy_tracker_dir and any(
+        name.startswith(LEGACY_TRACKER_FILE_PREFIXES)
+        for name in os.listdir(legacy_tracker_dir)):
+      self.legacy_store = FileTrackerStore(legacy_tracker_dir)
+    self.lock = threading.Lock()
+    # Deferred writes, mapping tracker names to values.
+    self.pending = {}
+    self.last_flush_time = time.time()
+    if not os.path.exists(path):
+      # Tracker data such as resumable upload URLs grant access to the
+      # transfers, so the database is only readable by the user.
+      os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0600))
+    self.conn = sqlite3.connect(path, timeout=SQLITE_TIMEOUT,
+                                check_same_thread=False)
+    # Trackers hold byte strings such as UTF-8 object names.
+    self.conn.text_factory = str
+    try:
+      # Lets processes read trackers while another one updates them.
+      self.conn.execute('PRAGMA journal_mode=WAL')
+    except sqlite3.Error:
+      pass
+    with self.conn:
+      self.conn.execute(
+          'CREATE TABLE IF NOT EXISTS trackers ('
+          'name TEXT PRIMARY KEY, value TEXT, updated REAL)')
+      self.conn.execute('CREATE INDEX IF NOT EXISTS trackers_updated '
+                        'ON trackers (updated)')
+    try:
+      with self.conn:
+        self.conn.execute('DELETE FROM trackers WHERE updated < ?',
+                          (time.time() - STALE_TRACKER_AGE,))
+    except sqlite3.Error:
+      # Another process is probably collecting them.
+      pass
+
+  def Get(self, name):
+    """Returns the contents of the named tracker, or None if there is none."""
+    with self.lock:
+      if name in self.pending:
+        return self.pending[name]
+      try:
+        row = self.conn.execute('SELECT value FROM trackers WHERE name = ?',
+                                (name,)).fetchone()
+      except sqlite3.Error, e:
+        logging.getLogger().warning(
+            'Couldn\'t read tracker %s from %s: %s. Restarting transfer from '
+            'scratch.', name, self.path, e)
+        return None
+    if row:
+      return row[0]
+    if self.legacy_store:
+      value = self.legacy_store.Get(name)
+      if value is not None:
+        self.Put(name, value)
+        self.legacy_store.Delete([name])
+        return value
+    return None
+
+  def Put(self, name, value):
+    """Sets the contents of the named tracker."""
+    with self.lock:
+      self.pending[name] = value
+      self._Flush()
+
+  def PutDeferred(self, name, value):
+    """
+    Sets the contents of the named tracker, which may only be written to the
+    database with later writes (but is visible to this process immediately).
+    Use this for updates that can be lost without harm, such as progress that
+    would then just be redone.
+    """
+    with self.lock:
+      self.pending[name] = value
+      if time.time() - self.last_flush_time >= DEFERRED_WRITE_INTERVAL:
+        self._Flush()
+
+  def Append(self, name, value):
+    """Appends value to the contents of the named tracker."""
+    with self.lock:
+      self._Flush()
+      now = time.time()
+      with self.conn:
+        if not self.conn.execute(
+            'UPDATE trackers SET value = value || ?, updated = ? '
+            'WHERE name = ?', (value, now, name)).rowcount:
+          self.conn.execute('INSERT INTO trackers VALUES (?, ?, ?)',
+                            (name, value, now))
+
+  def Delete(self, names):
+    """Deletes the named trackers, if they exist."""
+    with self.lock:
+      for name in names:
+        self.pending.pop(name, None)
+      self._Flush()
+      with self.conn:
+        self.conn.executemany('DELETE FROM trackers WHERE name = ?',
+                              [(name,) for name in names])
+
+  def Flush(self):
+    """Writes any deferred writes to the database."""
+    with self.lock:
+      try:
+        self._Flush()
+      except sqlite3.Error:
+        pass
+
+  def _Flush(self):
+    """Writes deferred writes in one transaction. Must hold self.lock."""
+    if self.pending:
+      now = time.time()
+      with self.conn:
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO trackers VALUES (?, ?, ?)',
+            [(name, value, now) for (name, value) in self.pending.iteritems()])
+      self.pending = {}
+    self.last_flush_time = time.time()
+
+
+class TrackerStoreResumableUploadHandler(ResumableUploadHandler):
+  """ResumableUploadHandler that keeps its tracker in the tracker store."""
+
+  def _load_tracker_uri_from_file(self):
+    uri = GetTrackerStore().Get(self.tracker_file_name)
+    if uri is None:
+      return
+    try:
+      self._set_tracker_uri(uri.strip())
+    except InvalidUriError:
+      # Warn user, but proceed (will restart because self.tracker_uri is None).
+      logging.getLogger().warning(
+          'Invalid tracker URI (%s) found in tracker %s. Restarting upload '
+          'from scratch.', uri.strip(), self.tracker_file_name)
+
+  def _save_tracker_uri_to_file(self):
+    if self.tracker_file_name:
+      GetTrackerStore().Put(self.tracker_file_name, self.tracker_uri)
+
+  def _remove_tracker_file(self):
+    if self.tracker_file_name:
+      GetTrackerStore().Delete([self.tracker_file_name])
+
+
+class TrackerStoreResumableDownloadHandler(ResumableDownloadHandler):
+  """ResumableDownloadHandler that keeps its tracker in the tracker store."""
+
+  def _load_tracker_file_etag(self):
+    etag = GetTrackerStore().Get(self.tracker_file_name)
+    if etag is None:
+      return
+    etag = etag.rstrip('\n')
+    if len(etag) < self.MIN_ETAG_LEN:
+      # Warn user, but proceed (will restart because
+      # self.etag_value_for_current_download is None).
+      logging.getLogger().warning(
+          'Couldn\'t read etag in tracker %s. Restarting download from '
+          'scratch.', self.tracker_file_name)
+      return
+    self.etag_value_for_current_download = etag
+
+  def _save_tracker_info(self, key):
+    self.etag_value_for_current_download = key.etag.strip('"\'')
+    if self.tracker_file_name:
+      GetTrackerStore().Put(self.tracker_file_name,
+                            '%s\n' % self.etag_value_for_current_download)
+
+  def _remove_tracker_file(self):
+    if self.tracker_file_name:
+      GetTrackerStore().Delete([self.tracker_file_name])
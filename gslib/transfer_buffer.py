@@ -0,0 +1,113 @@
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Large, reusable buffers for the data moved by transfers."""
+
+import os
+import threading
+
+from boto import config
+from boto.gs.resumable_upload_handler import ResumableUploadHandler
+from boto.s3.key import Key
+from gslib.commands.config import DEFAULT_TRANSFER_BUFFER_SIZE
+from gslib.file_part import MappedFilePart
+from gslib.util import HumanReadableToBytes
+
+_thread_local = threading.local()
+
+
+def GetTransferBufferSize():
+  """
+  Returns the size in bytes of the transfer buffers, from the
+  transfer_buffer_size option in the [GSUtil] section of the boto config.
+  """
+  return HumanReadableToBytes(config.get(
+      'GSUtil', 'transfer_buffer_size', DEFAULT_TRANSFER_BUFFER_SIZE))
+
+
+def ConfigureBotoBufferSizes():
+  """
+  Makes boto read and send data in chunks of the transfer buffer size,
+  rather than its default of 8 KB, for all Keys and resumable uploads.
+  """
+  buffer_size = GetTransferBufferSize()
+  Key.BufferSize = buffer_size
+  ResumableUploadHandler.BUFFER_SIZE = buffer_size
+
+
+def ReadChunks(fp, length=None, buffer_size=None):
+  """
+  Generator that reads a file in chunks of the transfer buffer size, without
+  allocating a new string for each chunk.
+
+  Files (and FileParts) are read with readinto() into a buffer that's reused
+  by all reads in the calling thread, and each chunk is yielded as a read-only
+  view of that buffer, which is only valid until the next chunk is read (so
+  consumers that keep the data, rather than e.g. hashing or writing it, must
+  copy it with str()). The chunks of a MappedFilePart are views of its memory
+  mapping, so they aren't copied at all. Other file-like objects are read with
+  read().
+
+  The views are Python 2 buffer objects rather than memoryviews, since only
+  the former are accepted by every consumer of the chunks (in particular
+  crcmod's C extension and zlib).
+
+  Args:
+    fp: The file to read from its current position.
+    length: Maximum number of bytes to read, or None to read to EOF.
+    buffer_size: Size of the chunks, or None for GetTransferBufferSize().
+  """
+  buffer_size = buffer_size or GetTransferBufferSize()
+  if isinstance(fp, MappedFilePart):
+    while length is None or length > 0:
+      view = fp.GetView(fp.tell(), buffer_size if length is None
+                        else min(buffer_size, length))
+      if not len(view):
+        return
+      fp.seek(len(view), os.SEEK_CUR)
+      if length is not None:
+        length -= len(view)
+      yield view
+    return
+  if not hasattr(fp, 'readinto'):
+    while length is None or length > 0:
+      data = fp.read(buffer_size if length is None
+                     else min(buffer_size, length))
+      if not data:
+        return
+      if length is not None:
+        length -= len(data)
+      yield data
+    return
+  # Nested calls (whose chunks the caller may still be using) get a buffer
+  # of their own.
+  nested = getattr(_thread_local, 'in_use', False)
+  buf = None if nested else getattr(_thread_local, 'buf', None)
+  if buf is None or len(buf) != buffer_size:
+    buf = bytearray(buffer_size)
+    if not nested:
+      _thread_local.buf = buf
+  view = memoryview(buf)
+  _thread_local.in_use = True
+  try:
+    while length is None or length > 0:
+      size = buffer_size if length is None else min(buffer_size, length)
+      bytes_read = fp.readinto(view[:size])
+      if not bytes_read:
+        return
+      if length is not None:
+        length -= bytes_read
+      yield buffer(buf, 0, bytes_read)
+  finally:
+    _thread_local.in_use = nested
@@ -19,14 +19,18 @@ import boto
 import boto.auth
 import errno
 import gslib
+import hashlib
+import inspect
 import math
 import multiprocessing
 import os
 import re
 import sys
+import tempfile
 import textwrap
 import threading
 import traceback
+import weakref
 import xml.etree.ElementTree as ElementTree
 
 from boto import config
@@ -64,16 +68,42 @@ _EXP_STRINGS = [
   (60, 'EB', 'Ebit', 'E'),
 ]
 
-global manager
+global manager, manager_lock, lazy_locks
 
 def InitializeMultiprocessingVariables():
   """
   Perform necessary initialization - see
   gslib.command.InitializeMultiprocessingVariables for an explanation of why
   this is necessary.
+
+  Starting a multiprocessing.Manager means starting a server process, so we
+  don't do it here; see GetManager.
+  """
+  global manager, manager_lock, lazy_locks
+  manager = None
+  manager_lock = threading.Lock()
+  # Weak references to each _LazyLock that must switch to a lock from the
+  # manager once it exists.
+  lazy_locks = []
+
+def GetManager():
   """
-  global manager
-  manager = multiprocessing.Manager()
+  Returns the multiprocessing.Manager shared by all of gsutil, starting it if
+  this is the first time it's needed. This must first be called by the main
+  process, before it creates any processes that need to share state with it.
+  """
+  global manager, lazy_locks
+  if manager is None:
+    with manager_lock:
+      if manager is None:
+        new_manager = multiprocessing.Manager()
+        for lock_ref in lazy_locks:
+          lock = lock_ref()
+          if lock is not None:
+            lock.UseManager(new_manager)
+        lazy_locks = []
+        manager = new_manager
+  return manager
 
 def _GenerateSuffixRegex():
   human_bytes_re = r'(?P<num>\d*\.\d+|\d+)\s*(?P<suffix>%s)?'
@@ -108,8 +138,7 @@ GSUTIL_PUB_TARBALL = 'gs://pub/gsutil.tar.gz'
 Retry = retry_decorator.retry
 
 # Cache the values from this check such that they're available to all callers
-# without needing to run all the checks again (some of these, such as calling
-# multiprocessing.Manager(), are expensive operations).
+# without needing to run all the checks again.
 cached_multiprocessing_is_available = None
 cached_multiprocessing_is_available_stack_trace = None
 cached_multiprocessing_is_available_message = None
@@ -150,6 +179,106 @@ def CreateTrackerDirIfNeeded():
   return tracker_dir
 
 
+# File system types (as listed in /proc/mounts) whose files are served over
+# the network.
+NETWORK_FILE_SYSTEM_TYPES = frozenset([
+    '9p', 'afs', 'ceph', 'cifs', 'coda', 'fuse.gcsfuse', 'fuse.glusterfs',
+    'fuse.s3fs', 'fuse.sshfs', 'gfs2', 'glusterfs', 'gpfs', 'lustre', 'ncpfs',
+    'nfs', 'nfs4', 'smb3', 'smbfs'])
+
+# File listing the mounted file systems on Linux.
+PROC_MOUNTS_PATH = '/proc/mounts'
+
+
+def IsOnNetworkFileSystem(path):
+  """
+  Returns whether path is on a network file system. sqlite databases there
+  can be corrupted when several processes use them at once, since sqlite's
+  locking relies on file locks (which many network file systems don't
+  implement reliably) and its WAL mode on shared memory.
+
+  This is only detected on Linux, from /proc/mounts. Elsewhere, False is
+  returned.
+  """
+  try:
+    with open(PROC_MOUNTS_PATH, 'r') as f:
+      mounts = f.read().splitlines()
+  except IOError:
+    return False
+  path = os.path.realpath(path)
+  (longest_match, fs_type) = (-1, None)
+  for line in mounts:
+    fields = line.split()
+    if len(fields) < 3:
+      continue
+    # Spaces etc. in mount points are escaped as octal sequences.
+    mount_point = fields[1].decode('string_escape')
+    if (path == mount_point or
+        path.startswith(mount_point.rstrip('/') + '/')):
+      if len(mount_point) > longest_match:
+        (longest_match, fs_type) = (len(mount_point), fields[2])
+  return fs_type in NETWORK_FILE_SYSTEM_TYPES
+
+
+# Directory under which gsutil keeps its sqlite databases when the
+# resumable_tracker_dir is on a network file system, unless the
+# local_database_dir option is set. Unlike the temporary directory, /var/tmp
+# is usually kept across reboots, so interrupted transfers can be resumed.
+DEFAULT_LOCAL_DATABASE_BASE_DIR = (
+    '/var/tmp' if os.path.isdir('/var/tmp') else tempfile.gettempdir())
+
+# Map from tracker directory to the result of _FindSqliteDatabaseDir for it.
+_sqlite_database_dirs = {}
+_sqlite_database_dirs_lock = threading.Lock()
+
+
+def GetSqliteDatabaseDir():
+  """
+  Returns the directory in which gsutil keeps its sqlite databases (the
+  tracker store, the local hash cache and cp manifest indexes).
+
+  This is the resumable_tracker_dir, unless that's on a network file system
+  (see IsOnNetworkFileSystem), in which case it's a directory on local disk,
+  under the directory given by the local_database_dir option in the [GSUtil]
+  section of the boto config. Each remote tracker directory gets its own
+  subdirectory there. Returns None if there's no usable local directory, in
+  which case callers must do without their databases.
+  """
+  tracker_dir = CreateTrackerDirIfNeeded()
+  with _sqlite_database_dirs_lock:
+    if tracker_dir not in _sqlite_database_dirs:
+      _sqlite_database_dirs[tracker_dir] = _FindSqliteDatabaseDir(tracker_dir)
+    return _sqlite_database_dirs[tracker_dir]
+
+
+def _FindSqliteDatabaseDir(tracker_dir):
+  """Determines the result of GetSqliteDatabaseDir for tracker_dir."""
+  if not IsOnNetworkFileSystem(tracker_dir):
+    return tracker_dir
+  base_dir = config.get('GSUtil', 'local_database_dir', None)
+  if not base_dir:
+    # The default directory is shared with other users, so each user gets
+    # their own subdirectory, which only they can use.
+    base_dir = os.path.join(DEFAULT_LOCAL_DATABASE_BASE_DIR,
+                            'gsutil-%d' % os.getuid())
+  database_dir = os.path.join(
+      base_dir, hashlib.md5(os.path.realpath(tracker_dir)).hexdigest())
+  try:
+    os.makedirs(database_dir, 0700)
+  except OSError as e:
+    if e.errno != errno.EEXIST:
+      return None
+  try:
+    if os.stat(base_dir).st_uid != os.getuid():
+      # Someone else could read or tamper with our trackers.
+      return None
+  except OSError:
+    return None
+  if IsOnNetworkFileSystem(database_dir):
+    return None
+  return database_dir
+
+
 # Name of file where we keep the timestamp for the last time we checked whether
 # a new version of gsutil is available.
 LAST_CHECKED_FOR_GSUTIL_UPDATE_TIMESTAMP_FILE = (
@@ -421,6 +550,23 @@ def AddAcceptEncoding(headers):
     headers['accept-encoding'] = 'gzip'
 
 
+def KeyMethodAcceptsHashAlgs(key, method_name):
+  """
+  Returns whether key's download method (e.g., 'get_file') accepts a
+  hash_algs argument. S3 keys, older versions of boto and the mock storage
+  service used by tests don't, in which case boto computes the MD5 only.
+
+  Check this before starting a download, rather than catching the TypeError
+  from an unexpected argument, which can't be told apart from a TypeError
+  raised partway through the transfer.
+  """
+  try:
+    return 'hash_algs' in inspect.getargspec(getattr(key, method_name)).args
+  except TypeError:
+    # Not a Python function, so the arguments can't be inspected.
+    return False
+
+
 def PrintFullInfoAboutUri(uri, incl_acl, headers):
   """Print full info for given URI (like what displays for gsutil ls -L).
 
@@ -585,13 +731,12 @@ def MultiprocessingIsAvailable(logger=None):
         message += ('\nPlease ensure that you have write access to both '
                     '/dev/shm and /run/shm.')
       raise  # We'll handle this in one place below.
-  
-    # Manager objects and Windows are generally a pain to work with, so try it
-    # out as a sanity check. This definitely works on some versions of Windows,
-    # but it's certainly possible that there is some unknown configuration for
-    # which it won't.
-    multiprocessing.Manager()
-    
+
+    # Note that we don't try out a multiprocessing.Manager here, since that
+    # means starting a server process on every run of gsutil. Managers are
+    # only started when they're needed (see GetManager), and callers must be
+    # prepared for that to fail.
+
     # Check that the max number of open files is reasonable. Always check this
     # after we're sure that the basic multiprocessing functionality is
     # available, since this won't matter unless that's true.
@@ -636,8 +781,67 @@ def CreateLock():
   Returns either a multiprocessing lock or a threading lock. We will use the
   former iff we have access to the parts of the multiprocessing module that
   are necessary to enable parallelism in operations.
+
+  If the manager hasn't been started yet, the lock is a _LazyLock, which only
+  becomes a multiprocessing lock if it's ever shared with another process.
   """
   if MultiprocessingIsAvailable()[0]:
-    return manager.Lock()
+    with manager_lock:
+      if manager is not None:
+        return manager.Lock()
+      lock = _LazyLock()
+      lazy_locks.append(weakref.ref(lock))
+      return lock
   else:
     return threading.Lock()
+
+
+class _LazyLock(object):
+  """
+  Lock that behaves like a threading lock until the multiprocessing.Manager is
+  started, at which point it switches to a lock from the manager. Processes
+  that share state with this one can only exist once the manager has been
+  started, and pickling the lock (which is how it would be passed to another
+  process) starts the manager, so the lock is always shared correctly.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.is_cross_process = False
+
+  def UseManager(self, new_manager):
+    """Switches this lock to a lock from new_manager."""
+    old_lock = self.lock
+    # Wait for the current holder, if any, so that nobody can hold the old and
+    # the new lock at the same time.
+    old_lock.acquire()
+    self.lock = new_manager.Lock()
+    self.is_cross_process = True
+    old_lock.release()
+
+  def acquire(self, blocking=True):
+    while True:
+      lock = self.lock
+      if not lock.acquire(blocking):
+        return False
+      if lock is self.lock:
+        return True
+      # We switched locks while we were waiting for the old one.
+      lock.release()
+
+  def release(self):
+    self.lock.release()
+
+  def __enter__(self):
+    self.acquire()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.release()
+
+  def __getstate__(self):
+    if not self.is_cross_process:
+      GetManager()
+    return {'lock': self.lock}
+
+  def __setstate__(self, state):
+    self.lock = state['lock']
+    self.is_cross_process = True
@@ -66,6 +66,7 @@ import urllib
 from boto.s3.prefix import Prefix
 from boto.storage_uri import BucketStorageUri
 from bucket_listing_ref import BucketListingRef
+from gslib.local_walker import WalkFiles
 
 # Regex to determine if a string contains any wildcards.
 WILDCARD_REGEX = re.compile('[*?\[\]]')
@@ -358,11 +359,12 @@ class CloudWildcardIterator(WildcardIterator):
 class FileWildcardIterator(WildcardIterator):
   """WildcardIterator subclass for files and directories.
 
-  If you use recursive wildcards ('**') only a single such wildcard is
-  supported. For example you could use the wildcard '**/*.txt' to list all .txt
-  files in any subdirectory of the current directory, but you couldn't use a
-  wildcard like '**/abc/**/*.txt' (which would, if supported, let you find .txt
-  files in any subdirectory named 'abc').
+  Recursive wildcards ('**') match any sequence of characters, including
+  directory separators, while '*' and '?' only match within one path
+  component. A '**' followed by a separator also matches no directories at
+  all, so '**/*.txt' lists all .txt files in the current directory and any
+  subdirectory of it. Any number of recursive wildcards can be used; for
+  example, '**/abc/**/*.txt' lists .txt files in any subdirectory named 'abc'.
   """
 
   def __init__(self, wildcard_uri, headers=None, debug=0):
@@ -380,37 +382,48 @@ class FileWildcardIterator(WildcardIterator):
 
   def __iter__(self):
     wildcard = self.wildcard_uri.object_name
-    match = re.search('\*\*', wildcard)
-    if match:
+    if '**' in wildcard:
       # Recursive wildcarding request ('.../**/...').
       # Example input: wildcard = '/tmp/tmp2pQJAX/**/*'
-      base_dir = wildcard[:match.start()-1]
-      remaining_wildcard = wildcard[match.start()+2:]
-      # At this point for the above example base_dir = '/tmp/tmp2pQJAX' and
-      # remaining_wildcard = '/*'
-      if remaining_wildcard.startswith('*'):
+      if '***' in wildcard:
         raise WildcardException('Invalid wildcard with more than 2 consecutive '
                                 '*s (%s)' % wildcard)
-      # If there was no remaining wildcard past the recursive wildcard,
-      # treat it as if it were a '*'. For example, file://tmp/** is equivalent
-      # to file://tmp/**/*
-      if not remaining_wildcard:
-        remaining_wildcard = '*'
-      # Skip slash(es).
-      remaining_wildcard = remaining_wildcard.lstrip(os.sep)
-      filepaths = self._iter_dir(base_dir, remaining_wildcard)
+      # Walk the deepest directory named without wildcards, and match the
+      # paths of the files in it against the rest of the wildcard.
+      parts = wildcard.split(os.sep)
+      num_base_parts = 0
+      while not ContainsWildcard(parts[num_base_parts]):
+        num_base_parts += 1
+      base_dir = os.sep.join(parts[:num_base_parts])
+      if parts[:num_base_parts] == ['']:
+        base_dir = os.sep
+      remaining_wildcard = '/'.join(parts[num_base_parts:])
+      # At this point for the above example base_dir = '/tmp/tmp2pQJAX' and
+      # remaining_wildcard = '**/*'
+      for (filepath, file_stat) in self._iter_dir(base_dir, remaining_wildcard):
+        expanded_uri = self.wildcard_uri.clone_replace_name(filepath)
+        yield BucketListingRef(expanded_uri, file_stat=file_stat)
     else:
       # Not a recursive wildcarding request.
-      filepaths = glob.iglob(wildcard)
-    for filepath in filepaths:
-      expanded_uri = self.wildcard_uri.clone_replace_name(filepath)
-      yield BucketListingRef(expanded_uri)
+      for filepath in glob.iglob(wildcard):
+        expanded_uri = self.wildcard_uri.clone_replace_name(filepath)
+        yield BucketListingRef(expanded_uri)
 
   def _iter_dir(self, dir, wildcard):
-    """An iterator over the specified dir and wildcard."""
-    for dirpath, unused_dirnames, filenames in os.walk(dir):
-      for f in fnmatch.filter(filenames, wildcard):
-        yield os.path.join(dirpath, f)
+    """
+    An iterator over the files in dir whose paths relative to dir match
+    wildcard, which uses '/' as its separator. Yields (path, FileStat) tuples.
+    """
+    flags = 0
+    if os.path.normcase('A') != 'A':
+      # Match case-insensitively where the file system does, as fnmatch does.
+      flags = re.IGNORECASE
+    prog = re.compile(_TranslateRecursiveFileWildcard(wildcard), flags)
+    for (filepath, rel_path, file_stat) in WalkFiles(dir or os.curdir):
+      if os.sep != '/':
+        rel_path = rel_path.replace(os.sep, '/')
+      if prog.match(rel_path):
+        yield (os.path.join(dir, rel_path) if dir else rel_path, file_stat)
 
   def IterKeys(self):
     """
@@ -489,6 +502,60 @@ def wildcard_iterator(uri_or_str, proj_id_handler,
     raise WildcardException('Unexpected type of StorageUri (%s)' % uri)
 
 
+def _TranslateRecursiveFileWildcard(wildcard):
+  """
+  Translates a file wildcard, which may contain recursive wildcards ('**') and
+  uses '/' as its separator, to a regular expression matching the paths (with
+  '/' separators) it names. Character ranges are handled as by fnmatch.
+
+  Args:
+    wildcard: The wildcard to translate.
+
+  Returns:
+    Regular expression string.
+  """
+  i = 0
+  n = len(wildcard)
+  res = ''
+  while i < n:
+    c = wildcard[i]
+    i += 1
+    if c == '*':
+      if wildcard[i:i+1] == '*':
+        i += 1
+        if wildcard[i:i+1] == '/':
+          # '**/' matches any number of directories, including none.
+          i += 1
+          res += '(?:.*/)?'
+        else:
+          res += '.*'
+      else:
+        res += '[^/]*'
+    elif c == '?':
+      res += '[^/]'
+    elif c == '[':
+      j = i
+      if j < n and wildcard[j] == '!':
+        j += 1
+      if j < n and wildcard[j] == ']':
+        j += 1
+      while j < n and wildcard[j] != ']':
+        j += 1
+      if j >= n:
+        res += '\\['
+      else:
+        stuff = wildcard[i:j].replace('\\', '\\\\')
+        i = j + 1
+        if stuff[0] == '!':
+          stuff = '^' + stuff[1:]
+        elif stuff[0] == '^':
+          stuff = '\\' + stuff
+        res += '[%s]' % stuff
+    else:
+      res += re.escape(c)
+  return res + '\\Z(?ms)'
+
+
 def ContainsWildcard(uri_or_str):
   """Checks whether uri_or_str contains a wildcard.
 